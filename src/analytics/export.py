@@ -0,0 +1,180 @@
+"""Streaming export of sessions and their responses for offline analysis.
+
+    python -m src.analytics.export --output exports/sessions --format parquet
+
+Sessions are read from MongoDB in (start_time, session_id) order in batches
+and flattened to one row per response, with the session's fields repeated;
+a session without responses gives one row with empty response columns.
+Rows are written to numbered part files of at most --chunk-rows rows, so
+memory stays bounded by one part whatever the size of the collection.
+
+After each part, export.json in the output directory records the last
+exported session. Running the same command again resumes after it;
+--since exports only sessions that started after a given start_time.
+Parquet output needs pyarrow (``pip install pyarrow``).
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+from typing import Optional, List, Dict, Any, Iterator
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+COLUMNS = (
+    "session_id", "telegram_id", "session_type", "start_time", "end_time", "completed", "final_message",
+    "graph_revision", "response_index", "node_id", "response", "response_timestamp", "message_text",
+)
+
+FORMATS = ("parquet", "csv")
+
+MANIFEST_FILE = "export.json"
+
+def flatten_session(document: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Rows of a raw session document, one per response"""
+    session = {
+        "session_id": document.get("session_id"),
+        "telegram_id": document.get("telegram_id"),
+        "session_type": document.get("session_type"),
+        "start_time": document.get("start_time"),
+        "end_time": document.get("end_time"),
+        "completed": document.get("completed", False),
+        "final_message": document.get("final_message"),
+        "graph_revision": document.get("graph_revision"),
+    }
+    responses = document.get("responses") or [{}]
+    for index, response in enumerate(responses):
+        yield {
+            **session,
+            "response_index": index if response else None,
+            "node_id": response.get("node_id"),
+            "response": response.get("response"),
+            "response_timestamp": response.get("timestamp"),
+            "message_text": response.get("message_text"),
+        }
+
+def _write_csv(path: str, rows: List[Dict[str, Any]]) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _write_parquet(path: str, rows: List[Dict[str, Any]]) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    types = {"telegram_id": pa.int64(), "completed": pa.bool_(), "response_index": pa.int32()}
+    schema = pa.schema([(column, types.get(column, pa.string())) for column in COLUMNS])
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), path, compression="zstd")
+
+class SessionExporter:
+    """Writes the sessions collection to part files, resumable after the last complete part"""
+    
+    def __init__(self, output: str, file_format: str = "parquet", batch_size: int = 1000, chunk_rows: int = 100_000):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown export format: {file_format} (expected one of {', '.join(FORMATS)})")
+        if file_format == "parquet":
+            try:
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Parquet export needs pyarrow; install it or use --format csv") from None
+        self.output = output
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.chunk_rows = chunk_rows
+        self.manifest_path = os.path.join(output, MANIFEST_FILE)
+    
+    def load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {"format": self.file_format, "parts": 0, "rows": 0, "sessions": 0,
+                    "last_start_time": None, "last_session_id": None}
+        if manifest["format"] != self.file_format:
+            raise ValueError(f"{self.output} holds a {manifest['format']} export; use another directory")
+        return manifest
+    
+    def _save_manifest(self, manifest: Dict[str, Any]) -> None:
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temporary, self.manifest_path)
+    
+    def _write_part(self, manifest: Dict[str, Any], rows: List[Dict[str, Any]]) -> None:
+        """Write a part file, then record it; a part cut short by a crash is written again on resume"""
+        path = os.path.join(self.output, f"part-{manifest['parts']:05d}.{self.file_format}")
+        temporary = path + ".tmp"
+        (_write_parquet if self.file_format == "parquet" else _write_csv)(temporary, rows)
+        os.replace(temporary, path)
+        manifest["parts"] += 1
+        manifest["rows"] += len(rows)
+        self._save_manifest(manifest)
+        logger.info(f"Wrote {path}: {len(rows)} rows ({manifest['sessions']} sessions so far)")
+    
+    @staticmethod
+    def _query(since: Optional[str], start_time: Optional[str], session_id: Optional[str]) -> Dict[str, Any]:
+        if start_time is not None:
+            # Keyset: sessions after the last exported one in (start_time, session_id) order
+            return {"$or": [
+                {"start_time": {"$gt": start_time}},
+                {"start_time": start_time, "session_id": {"$gt": session_id}},
+            ]}
+        if since is not None:
+            return {"start_time": {"$gt": since}}
+        return {}
+    
+    async def run(self, sessions: AsyncIOMotorCollection, since: Optional[str] = None) -> Dict[str, Any]:
+        """Export every session not exported yet; returns the manifest"""
+        os.makedirs(self.output, exist_ok=True)
+        manifest = self.load_manifest()
+        if manifest["last_start_time"] is not None:
+            logger.info(f"Resuming export after session {manifest['last_session_id']} ({manifest['parts']} parts written)")
+        
+        cursor = sessions.find(
+            self._query(since, manifest["last_start_time"], manifest["last_session_id"]),
+            projection={"_id": False},
+            sort=[("start_time", 1), ("session_id", 1)],
+            batch_size=self.batch_size,
+        )
+        rows: List[Dict[str, Any]] = []
+        async for document in cursor:
+            rows.extend(flatten_session(document))
+            manifest["sessions"] += 1
+            manifest["last_start_time"] = document["start_time"]
+            manifest["last_session_id"] = document["session_id"]
+            # Parts end on a session boundary, so the checkpoint never splits a session
+            if len(rows) >= self.chunk_rows:
+                self._write_part(manifest, rows)
+                rows = []
+        if rows:
+            self._write_part(manifest, rows)
+        logger.info(f"Export complete: {manifest['rows']} rows from {manifest['sessions']} sessions in {self.output}")
+        return manifest
+
+async def export_sessions(args: argparse.Namespace) -> Dict[str, Any]:
+    from src.db.repository import MongoDBRepository
+    
+    # Fails before connecting if the format cannot be written
+    exporter = SessionExporter(args.output, args.format, batch_size=args.batch_size, chunk_rows=args.chunk_rows)
+    repository = MongoDBRepository()
+    await repository.connect()
+    try:
+        return await exporter.run(repository.sessions, since=args.since)
+    finally:
+        await repository.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export sessions and responses to Parquet or CSV part files")
+    parser.add_argument("--output", required=True, help="directory for the part files and export.json")
+    parser.add_argument("--format", choices=FORMATS, default="parquet", help="file format of the parts")
+    parser.add_argument("--batch-size", type=int, default=1000, help="sessions fetched per round trip")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="rows per part file")
+    parser.add_argument("--since", default=None, help="only export sessions with a later start_time (ISO format)")
+    args = parser.parse_args()
+    asyncio.run(export_sessions(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Daily triage rollups computed from the sessions collection.
+
+    python -m src.analytics.triage
+
+runs the job once (e.g. from cron); with ANALYTICS_ENABLED the bot runs it
+every ANALYTICS_INTERVAL seconds. Dashboards read the rollup collections by
+_id and never query the live sessions collection:
+
+- triage_daily, _id "YYYY-MM-DD": sessions, completed, empeoramiento,
+  patients and outcomes ({"teleconsulta": n, "hospital_dia": n, ...})
+- triage_patient_daily, _id {"day", "telegram_id"}: the same counts per patient
+- triage_node_daily, _id {"day", "node_id", "answer"}: responses given at each node
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Any
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from src.conversation.models import Conversation
+
+# Terminal nodes a triage session can end at
+OUTCOME_NODES = ("teleconsulta", "hospital_dia", "recomendaciones_finales", "despedida")
+
+# Separates node id and answer in the keys outcomes are matched on
+_KEY_SEPARATOR = "\x1f"
+
+def outcome_answers(conversation: Conversation) -> Dict[str, List[str]]:
+    """For each outcome node, the "node_id<sep>answer" keys of the buttons leading to it"""
+    answers: Dict[str, List[str]] = {outcome: [] for outcome in OUTCOME_NODES}
+    for node in conversation.conversation:
+        for option in node.options or []:
+            if option.next in answers:
+                answers[option.next].append(f"{node.id}{_KEY_SEPARATOR}{option.text}")
+    return answers
+
+class TriageRollups:
+    """Incrementally maintains the triage rollup collections.
+    
+    Sessions record when they last changed in ``end_time``. Each run finds the
+    days whose sessions changed since the checkpoint, recomputes those days
+    with aggregation pipelines and replaces their rollup documents with
+    ``$merge``, so a run can be repeated safely. The checkpoint is moved back
+    by ``lag`` to pick up buffered writes stamped before it.
+    """
+    
+    CHECKPOINT_ID = "triage"
+    
+    def __init__(self, db: AsyncIOMotorDatabase, conversation: Conversation, lag: float = 300.0):
+        self.db = db
+        self.answers = outcome_answers(conversation)
+        self.lag = lag
+    
+    def _session_fields(self) -> Dict[str, Any]:
+        """$addFields computing the day a session started and the outcome it reached"""
+        keys = {"$map": {
+            "input": {"$ifNull": ["$responses", []]},
+            "in": {"$concat": ["$$this.node_id", _KEY_SEPARATOR, "$$this.response"]},
+        }}
+        branches = [
+            {"case": {"$gt": [{"$size": {"$setIntersection": ["$$keys", {"$literal": answers}]}}, 0]}, "then": outcome}
+            for outcome, answers in self.answers.items() if answers
+        ]
+        outcome = {"$let": {"vars": {"keys": keys}, "in": {"$switch": {"branches": branches, "default": None}}}}
+        return {"$addFields": {
+            "day": {"$substrCP": ["$start_time", 0, 10]},
+            "outcome": outcome if branches else None,
+        }}
+    
+    def _counts(self) -> Dict[str, Any]:
+        """$group accumulators shared by the daily and per-patient rollups"""
+        counts: Dict[str, Any] = {
+            "sessions": {"$sum": 1},
+            "completed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+            "empeoramiento": {"$sum": {"$cond": [{"$eq": ["$session_type", "empeoramiento"]}, 1, 0]}},
+        }
+        for outcome in OUTCOME_NODES:
+            counts[f"outcome_{outcome}"] = {"$sum": {"$cond": [{"$eq": ["$outcome", outcome]}, 1, 0]}}
+        return counts
+    
+    def _outcomes(self) -> Dict[str, Any]:
+        return {outcome: f"$outcome_{outcome}" for outcome in OUTCOME_NODES}
+    
+    @staticmethod
+    def _days_match(days: List[str]) -> Dict[str, Any]:
+        """$match on start_time ranges, so the index on start_time is used"""
+        ranges = []
+        for day in days:
+            next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+            ranges.append({"start_time": {"$gte": day, "$lt": next_day}})
+        return {"$match": {"$or": ranges}}
+    
+    def pipelines(self, days: List[str], updated_at: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Aggregation pipeline recomputing ``days`` of each rollup collection"""
+        prefix = [self._days_match(days), self._session_fields()]
+        counts = ["sessions", "completed", "empeoramiento"]
+        updated_at = {"$literal": updated_at}
+        return {
+            "triage_daily": prefix + [
+                {"$group": {"_id": "$day", "patients": {"$addToSet": "$telegram_id"}, **self._counts()}},
+                {"$project": {
+                    **{field: 1 for field in counts},
+                    "patients": {"$size": "$patients"},
+                    "outcomes": self._outcomes(),
+                    "updated_at": updated_at,
+                }},
+                {"$merge": {"into": "triage_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+            ],
+            "triage_patient_daily": prefix + [
+                {"$group": {"_id": {"day": "$day", "telegram_id": "$telegram_id"}, **self._counts()}},
+                {"$project": {**{field: 1 for field in counts}, "outcomes": self._outcomes(), "updated_at": updated_at}},
+                {"$merge": {
+                    "into": "triage_patient_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"
+                }},
+            ],
+            "triage_node_daily": prefix + [
+                {"$unwind": "$responses"},
+                {"$group": {
+                    "_id": {"day": "$day", "node_id": "$responses.node_id", "answer": "$responses.response"},
+                    "responses": {"$sum": 1},
+                    "patients": {"$addToSet": "$telegram_id"},
+                }},
+                {"$project": {"responses": 1, "patients": {"$size": "$patients"}, "updated_at": updated_at}},
+                {"$merge": {"into": "triage_node_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+            ],
+        }
+    
+    async def _changed_days(self, since: str) -> List[str]:
+        cursor = self.db.sessions.aggregate([
+            {"$match": {"end_time": {"$gt": since}}},
+            {"$group": {"_id": {"$substrCP": ["$start_time", 0, 10]}}},
+            {"$sort": {"_id": 1}},
+        ])
+        return [document["_id"] async for document in cursor]
+    
+    async def run(self, now: Optional[datetime] = None) -> List[str]:
+        """Recompute the days changed since the last run; returns those days"""
+        now = now or datetime.now()
+        checkpoint = await self.db.analytics_checkpoints.find_one({"_id": self.CHECKPOINT_ID})
+        since = ""
+        if checkpoint is not None:
+            since = (datetime.fromisoformat(checkpoint["changed_until"]) - timedelta(seconds=self.lag)).isoformat()
+        
+        days = await self._changed_days(since)
+        if days:
+            for collection, pipeline in self.pipelines(days, now.isoformat()).items():
+                # $merge writes the results; the returned cursor is empty
+                await self.db.sessions.aggregate(pipeline).to_list(None)
+                logger.debug(f"Recomputed {collection} for {len(days)} days")
+        
+        await self.db.analytics_checkpoints.update_one(
+            {"_id": self.CHECKPOINT_ID},
+            {"$set": {"changed_until": now.isoformat(), "days": len(days)}},
+            upsert=True
+        )
+        logger.info(f"Triage rollups updated for {len(days)} days" + (f" ({days[0]} to {days[-1]})" if days else ""))
+        return days
+
+class TriageRollupJob:
+    """Runs TriageRollups every ``interval`` seconds in the background"""
+    
+    def __init__(self, rollups: TriageRollups, interval: float = 3600.0):
+        self.rollups = rollups
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.rollups.run()
+            except Exception as e:
+                logger.error(f"Triage rollups failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Triage rollups scheduled every {self.interval:.0f}s")
+    
+    async def stop(self) -> None:
+        """Stop the job; the next run picks up from the last checkpoint"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+async def run_once() -> List[str]:
+    from src.config.settings import settings
+    from src.conversation.manager import ConversationManager
+    from src.db.repository import MongoDBRepository
+    
+    repository = MongoDBRepository()
+    await repository.connect()
+    try:
+        conversation = ConversationManager(settings.CONVERSATION_FILE).conversation_data
+        return await TriageRollups(repository.db, conversation, lag=settings.ANALYTICS_LAG).run()
+    finally:
+        await repository.close()
+
+if __name__ == "__main__":
+    asyncio.run(run_once())
@@ -0,0 +1,28 @@
+from pydantic import BaseModel, field_validator
+from typing import List, Optional, Dict, Any
+
+# Users each audience is sent to
+AUDIENCES: Dict[str, Dict[str, Any]] = {
+    "education": {"education_opt_in": True},
+    "all": {},
+}
+
+class Campaign(BaseModel):
+    id: str
+    message: str
+    audience: str = "education"
+    weekday: int = 0  # 0 = lunes
+    hour: int = 9
+    minute: int = 0
+    enabled: bool = True
+    
+    @field_validator("audience")
+    @classmethod
+    def check_audience(cls, audience: str) -> str:
+        """Reject unknown audiences when the campaign file is loaded, not when the campaign runs"""
+        if audience not in AUDIENCES:
+            raise ValueError(f"Unknown audience '{audience}', expected one of: {', '.join(AUDIENCES)}")
+        return audience
+
+class CampaignSchedule(BaseModel):
+    campaigns: List[Campaign]
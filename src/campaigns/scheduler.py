@@ -0,0 +1,149 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Set
+
+from loguru import logger
+from telegram.error import Forbidden
+
+from src.campaigns.models import AUDIENCES, Campaign, CampaignSchedule
+from src.conversation.graph import MessageTemplate
+from src.db.models import CampaignRun, Delivery
+from src.db.base import Repository
+from src.messaging.outbound import OutboundQueue, Priority
+
+def load_campaigns(campaigns_file: str) -> List[Campaign]:
+    """Load campaign definitions from a JSON file; a missing file means no campaigns"""
+    try:
+        with open(campaigns_file, "r", encoding="utf-8") as f:
+            return CampaignSchedule(**json.load(f)).campaigns
+    except FileNotFoundError:
+        logger.warning(f"Campaign file {campaigns_file} not found, no campaigns scheduled")
+        return []
+
+class CampaignRunner:
+    """Sends one run of a campaign to its audience.
+    
+    Users are streamed from MongoDB in telegram_id order. Each batch is sent
+    through the outbound queue in the education lane, so interactive replies
+    and alerts go out first, then its deliveries are recorded with
+    one insert and the run is checkpointed at the batch's last telegram_id.
+    A run that stopped half way resumes after its checkpoint.
+    """
+    
+    def __init__(self, outbox: OutboundQueue, repository: Repository, batch_size: int = 200):
+        self.outbox = outbox
+        self.repository = repository
+        self.batch_size = batch_size
+    
+    async def run(self, campaign: Campaign, run_id: str) -> CampaignRun:
+        run = await self.repository.get_campaign_run(run_id)
+        if run is not None and run.status == "completed":
+            return run
+        
+        skip: Set[int] = set()
+        if run is None:
+            run = await self.repository.save_campaign_run(CampaignRun.create_new(run_id, campaign.id))
+            logger.info(f"Campaign run {run_id} started")
+        else:
+            # Deliveries recorded after the last checkpoint were already sent
+            skip = await self.repository.get_delivered_ids(run_id, run.last_telegram_id)
+            logger.info(f"Campaign run {run_id} resumed after telegram_id {run.last_telegram_id}")
+        
+        template = MessageTemplate.parse(campaign.message)
+        audience = AUDIENCES[campaign.audience]
+        async for batch in self.repository.iter_campaign_audience(audience, run.last_telegram_id, self.batch_size):
+            recipients = [user for user in batch if user["telegram_id"] not in skip]
+            deliveries = await asyncio.gather(*(self._send(run_id, template, user) for user in recipients))
+            await self.repository.record_deliveries(list(deliveries))
+            
+            for delivery in deliveries:
+                if delivery.status == "sent":
+                    run.sent += 1
+                elif delivery.status == "blocked":
+                    run.blocked += 1
+                else:
+                    run.failed += 1
+            run.last_telegram_id = batch[-1]["telegram_id"]
+            run.updated_at = datetime.now().isoformat()
+            await self.repository.save_campaign_run(run)
+        
+        run.status = "completed"
+        run.completed_at = datetime.now().isoformat()
+        await self.repository.save_campaign_run(run)
+        logger.info(f"Campaign run {run_id} completed: {run.sent} sent, {run.blocked} blocked, {run.failed} failed")
+        return run
+    
+    async def _send(self, run_id: str, template: MessageTemplate, user: Dict[str, Any]) -> Delivery:
+        telegram_id = user["telegram_id"]
+        text = template.render({"nombre": user.get("first_name", "")})
+        try:
+            # Flood control and retries are handled by the outbound queue
+            await self.outbox.send_message(telegram_id, text, priority=Priority.EDUCATION)
+            return Delivery(run_id=run_id, telegram_id=telegram_id, status="sent",
+                            timestamp=datetime.now().isoformat())
+        except Forbidden as e:
+            return Delivery(run_id=run_id, telegram_id=telegram_id, status="blocked",
+                            timestamp=datetime.now().isoformat(), error=str(e))
+        except Exception as e:
+            return Delivery(run_id=run_id, telegram_id=telegram_id, status="failed",
+                            timestamp=datetime.now().isoformat(), error=str(e))
+
+class CampaignScheduler:
+    """Starts each campaign once a week at its scheduled weekday and time.
+    
+    A run is identified by the campaign and the ISO week, so a restart in the
+    middle of a run resumes it and a completed run is not sent again.
+    """
+    
+    def __init__(self, runner: CampaignRunner, campaigns: List[Campaign], check_interval: float = 60.0):
+        self.runner = runner
+        self.campaigns = [campaign for campaign in campaigns if campaign.enabled]
+        self.check_interval = check_interval
+        self._completed: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def run_id_for(campaign: Campaign, now: datetime) -> str:
+        year, week, _ = now.isocalendar()
+        return f"{campaign.id}:{year}-W{week:02d}"
+    
+    @staticmethod
+    def scheduled_time(campaign: Campaign, now: datetime) -> datetime:
+        """When the campaign is due in the week of ``now``"""
+        monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        return monday + timedelta(days=campaign.weekday, hours=campaign.hour, minutes=campaign.minute)
+    
+    async def run_due(self, now: Optional[datetime] = None) -> None:
+        """Run every campaign that is due this week and not completed yet"""
+        now = now or datetime.now()
+        for campaign in self.campaigns:
+            run_id = self.run_id_for(campaign, now)
+            if run_id in self._completed or now < self.scheduled_time(campaign, now):
+                continue
+            run = await self.runner.run(campaign, run_id)
+            if run.status == "completed":
+                self._completed.add(run_id)
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"Campaign scheduler failed: {str(e)}")
+            await asyncio.sleep(self.check_interval)
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Scheduled {len(self.campaigns)} campaigns")
+    
+    async def stop(self) -> None:
+        """Stop the scheduler; an interrupted run resumes from its checkpoint"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,21 @@
+import random
+from typing import Any, Dict
+
+class LevelSampler:
+    """Keeps a fraction of the records of each level, the same records in every sink.
+    
+    Install ``patch`` as the logger's patcher; it decides once per record and
+    marks it in ``extra``, and the sampler itself is the filter each sink uses.
+    Levels without a rate, or with a rate of 1 or more, are always kept, so
+    warnings and errors are never sampled away.
+    """
+    
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = {level.upper(): rate for level, rate in rates.items() if rate < 1}
+    
+    def patch(self, record: Dict[str, Any]) -> None:
+        rate = self.rates.get(record["level"].name)
+        record["extra"]["sampled"] = rate is None or random.random() < rate
+    
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        return record["extra"].get("sampled", True)
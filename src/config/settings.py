@@ -10,13 +10,114 @@ class Settings(BaseModel):
     # Bot settings
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
     BOT_NAME: str = os.getenv("BOT_NAME", "CardioVID_Bot")
+    # Bot API endpoint; point it at the fake Telegram harness for offline load tests
+    TELEGRAM_API_BASE_URL: str = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+    
+    # Update ingestion: "polling" or "webhook"
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling").lower()
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "telegram")
+    WEBHOOK_SECRET_TOKEN: str = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    # Updates of different users processed at the same time; each user's updates run in order
+    UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+    # Updates accepted at once, including those waiting for an earlier update of the same user
+    UPDATE_MAX_PENDING: int = int(os.getenv("UPDATE_MAX_PENDING", "256"))
+    
+    # Worker processes; with more than one, updates are partitioned by telegram_id
+    WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", "1"))
+    WORKER_QUEUE_SIZE: int = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+    
+    # Storage backend: "mongodb", "sqlite" (single node) or "memory" (nothing is kept on restart)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "mongodb")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "cardiovid_bot.db")
+    # Writes are committed together every interval or after this many writes
+    SQLITE_COMMIT_INTERVAL: float = float(os.getenv("SQLITE_COMMIT_INTERVAL", "0.5"))
+    SQLITE_COMMIT_BATCH_SIZE: int = int(os.getenv("SQLITE_COMMIT_BATCH_SIZE", "500"))
     
     # MongoDB settings
     MONGODB_CONNECTION_STRING: str = os.getenv("MONGODB_CONNECTION_STRING", "mongodb://localhost:27017")
     MONGODB_DATABASE: str = os.getenv("MONGODB_DATABASE", "cardiovid_bot")
+    # Connection pool per process; with WORKER_PROCESSES > 1 each worker has its own pool
+    MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+    MONGODB_MIN_POOL_SIZE: int = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))
+    MONGODB_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+    MONGODB_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    # How long an operation waits for a free pooled connection before failing
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+    # Wire compression, e.g. "zstd,zlib"; empty disables it
+    MONGODB_COMPRESSORS: str = os.getenv("MONGODB_COMPRESSORS", "")
+    # "foreground" creates indexes before startup completes, "background" after, "skip" never
+    MONGODB_INDEX_MODE: str = os.getenv("MONGODB_INDEX_MODE", "foreground")
+    # Run explain() on every repository query at startup and warn about collection scans
+    QUERY_PLAN_CHECK_ENABLED: bool = os.getenv("QUERY_PLAN_CHECK_ENABLED", "true").lower() in ("1", "true", "yes")
+    
+    # Write-behind buffer settings
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+    WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+    
+    # User cache settings
+    USER_CACHE_ENABLED: bool = os.getenv("USER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "300"))
+    
+    # Bot state persistence (user_data and conversation states in MongoDB)
+    PERSISTENCE_ENABLED: bool = os.getenv("PERSISTENCE_ENABLED", "true").lower() in ("1", "true", "yes")
+    PERSISTENCE_UPDATE_INTERVAL: float = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "5"))
+    PERSISTENCE_FLUSH_DELAY: float = float(os.getenv("PERSISTENCE_FLUSH_DELAY", "1"))
+    
+    # Conversation hot reload settings
+    CONVERSATION_FILE: str = os.getenv("CONVERSATION_FILE", "conversation.json")
+    CONVERSATION_RELOAD_ENABLED: bool = os.getenv("CONVERSATION_RELOAD_ENABLED", "false").lower() in ("1", "true", "yes")
+    CONVERSATION_RELOAD_INTERVAL: float = float(os.getenv("CONVERSATION_RELOAD_INTERVAL", "2"))
+    CONVERSATION_REVISION_HISTORY: int = int(os.getenv("CONVERSATION_REVISION_HISTORY", "5"))
+    
+    # Scheduled campaigns (weekly check-ins and education messages)
+    CAMPAIGNS_ENABLED: bool = os.getenv("CAMPAIGNS_ENABLED", "false").lower() in ("1", "true", "yes")
+    CAMPAIGNS_FILE: str = os.getenv("CAMPAIGNS_FILE", "campaigns.json")
+    CAMPAIGN_BATCH_SIZE: int = int(os.getenv("CAMPAIGN_BATCH_SIZE", "200"))
+    
+    # Triage rollups for dashboards (MongoDB only), recomputed every interval in seconds;
+    # the lag in seconds covers buffered writes that reach the database late
+    ANALYTICS_ENABLED: bool = os.getenv("ANALYTICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    ANALYTICS_INTERVAL: float = float(os.getenv("ANALYTICS_INTERVAL", "3600"))
+    ANALYTICS_LAG: float = float(os.getenv("ANALYTICS_LAG", "300"))
+    
+    # Clinician alerts: delivered to a staff chat and/or POSTed to a webhook; repeats for the same
+    # patient and kind within the same dedup window (fixed buckets of seconds) are merged into one alert
+    ALERT_CHAT_ID: str = os.getenv("ALERT_CHAT_ID", "")
+    ALERT_WEBHOOK_URL: str = os.getenv("ALERT_WEBHOOK_URL", "")
+    ALERT_DEDUP_WINDOW: float = float(os.getenv("ALERT_DEDUP_WINDOW", "1800"))
+    ALERT_BATCH_SIZE: int = int(os.getenv("ALERT_BATCH_SIZE", "20"))
+    ALERT_BATCH_WINDOW: float = float(os.getenv("ALERT_BATCH_WINDOW", "2.0"))
+    ALERT_POLL_INTERVAL: float = float(os.getenv("ALERT_POLL_INTERVAL", "10"))
+    
+    # Outbound queue: messages per second overall (split across worker processes) and per chat
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+    OUTBOUND_PER_CHAT_RATE: float = float(os.getenv("OUTBOUND_PER_CHAT_RATE", "1"))
+    OUTBOUND_CONCURRENCY: int = int(os.getenv("OUTBOUND_CONCURRENCY", "16"))
+    
+    # Metrics endpoint; worker processes listen on METRICS_PORT + 1 + worker index
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
     
     # Application settings
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # Write logs from a background thread instead of on the event loop
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+    # logs/bot.log as "text" or "json" (one object per line); writes are buffered up to this many bytes
+    LOG_FILE_FORMAT: str = os.getenv("LOG_FILE_FORMAT", "text").lower()
+    LOG_FILE_BUFFER_SIZE: int = int(os.getenv("LOG_FILE_BUFFER_SIZE", "65536"))
+    # Fraction of DEBUG and INFO records kept; warnings and errors are always kept
+    LOG_SAMPLE_DEBUG: float = float(os.getenv("LOG_SAMPLE_DEBUG", "1.0"))
+    LOG_SAMPLE_INFO: float = float(os.getenv("LOG_SAMPLE_INFO", "1.0"))
+    # Write the startup time of each phase as JSON to this file, if set
+    STARTUP_REPORT_FILE: str = os.getenv("STARTUP_REPORT_FILE", "")
     
     class Config:
         case_sensitive = True
@@ -38,10 +139,15 @@ class Settings(BaseModel):
                 
                 # Reconstruct connection string
                 self.MONGODB_CONNECTION_STRING = f"{prefix}{username}:{password}@{rest}"
+    
+    def check_required(self) -> None:
+        """Raise if a setting needed to run the bot is missing.
+        
+        Called when the bot starts rather than on import, so tools and tests
+        can import the settings without a token.
+        """
+        if not self.BOT_TOKEN:
+            raise ValueError("BOT_TOKEN environment variable is not set")
 
 # Create a global settings instance
 settings = Settings()
-
-# Validate that required settings are set
-if not settings.BOT_TOKEN:
-    raise ValueError("BOT_TOKEN environment variable is not set") 
\ No newline at end of file
@@ -0,0 +1,199 @@
+import hashlib
+import re
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple, Mapping, Iterable
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from src.conversation.models import Conversation, ConversationNode
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+# callback_data is "<revision>.<node index>.<option index>", indices in base 36
+CALLBACK_SEPARATOR = "."
+REVISION_LENGTH = 4
+
+# Button of a node that has no options but a default "next"
+CONTINUE_TEXT = "Continuar"
+
+class ConversationGraphError(ValueError):
+    """Raised when a conversation definition cannot be compiled"""
+
+class MessageTemplate(NamedTuple):
+    """Message split into literal parts and placeholder names.
+    
+    ``parts[i]`` is followed by the placeholder ``keys[i]``; the last part has
+    no placeholder after it.
+    """
+    parts: Tuple[str, ...]
+    keys: Tuple[str, ...]
+    
+    @classmethod
+    def parse(cls, message: str) -> "MessageTemplate":
+        pieces = PLACEHOLDER_PATTERN.split(message)
+        return cls(parts=tuple(pieces[0::2]), keys=tuple(pieces[1::2]))
+    
+    def render(self, user_data: Optional[Dict[str, Any]] = None) -> str:
+        """Fill placeholders; unknown placeholders are left as they are"""
+        if not self.keys:
+            return self.parts[0]
+        user_data = user_data or {}
+        chunks = [self.parts[0]]
+        for key, part in zip(self.keys, self.parts[1:]):
+            chunks.append(str(user_data[key]) if key in user_data else f"{{{{{key}}}}}")
+            chunks.append(part)
+        return "".join(chunks)
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        encoded = digits[remainder] + encoded
+        if not value:
+            return encoded
+
+class OptionChoice(NamedTuple):
+    """An option of a node resolved from a button press"""
+    node_id: str
+    index: int
+    text: str
+    next: Optional[str]
+
+class CompiledNode(NamedTuple):
+    """A conversation node with everything needed to render it precomputed"""
+    node: ConversationNode
+    index: int
+    template: MessageTemplate
+    markup: Optional[InlineKeyboardMarkup]
+    default_next: Optional[str]
+
+class ConversationGraph:
+    """Immutable, validated form of a conversation definition.
+    
+    Compiling builds the routing table keyed by the compact ``callback_data``
+    of every button, the message templates and the inline keyboards once, so
+    serving a button press is a dictionary lookup.
+    
+    ``callback_data`` carries a short revision of the conversation definition
+    plus the node and option indices, so it stays a few bytes long whatever
+    the option text is, and a button from an older message or an older
+    conversation.json can be told apart from one on the current keyboard.
+    """
+    
+    def __init__(self, conversation: Conversation, start_node: Optional[str] = None):
+        if not conversation.conversation:
+            raise ConversationGraphError("Conversation has no nodes")
+        self.start_node = start_node or conversation.conversation[0].id
+        self.revision = self.compute_revision(conversation)
+        
+        nodes: Dict[str, CompiledNode] = {}
+        routes: Dict[str, OptionChoice] = {}
+        for index, node in enumerate(conversation.conversation):
+            if node.id in nodes:
+                raise ConversationGraphError(f"Duplicate node id: {node.id}")
+            nodes[node.id] = CompiledNode(
+                node=node,
+                index=index,
+                template=MessageTemplate.parse(node.message),
+                markup=self._build_markup(node, index),
+                default_next=node.next
+            )
+            for option_index, (text, next_node) in enumerate(self._buttons(node)):
+                choice = OptionChoice(node.id, option_index, text, next_node)
+                routes[self.callback_data_for(index, option_index)] = choice
+        
+        self.nodes: Mapping[str, CompiledNode] = MappingProxyType(nodes)
+        self.routes: Mapping[str, OptionChoice] = MappingProxyType(routes)
+        self._validate()
+        self.unreachable: Tuple[str, ...] = tuple(self._find_unreachable())
+    
+    @staticmethod
+    def compute_revision(conversation: Conversation) -> str:
+        """Short fingerprint of a conversation definition"""
+        digest = hashlib.sha1(conversation.model_dump_json().encode("utf-8")).hexdigest()
+        return digest[:REVISION_LENGTH]
+    
+    def callback_data_for(self, node_index: int, option_index: int) -> str:
+        """callback_data sent by the button for an option"""
+        return CALLBACK_SEPARATOR.join((self.revision, _to_base36(node_index), _to_base36(option_index)))
+    
+    @staticmethod
+    def _buttons(node: ConversationNode) -> List[Tuple[str, Optional[str]]]:
+        """(text, next) of each button of a node.
+        
+        A node without options that has a default ``next`` gets a single
+        "Continuar" button, so the patient can move on from it.
+        """
+        if node.options:
+            return [(option.text, option.next) for option in node.options]
+        if node.next:
+            return [(CONTINUE_TEXT, node.next)]
+        return []
+    
+    def _build_markup(self, node: ConversationNode, node_index: int) -> Optional[InlineKeyboardMarkup]:
+        """Build the inline keyboard for a node, or None if it has no buttons"""
+        buttons = self._buttons(node)
+        if not buttons:
+            return None
+        keyboard = [
+            [InlineKeyboardButton(text=text, callback_data=self.callback_data_for(node_index, option_index))]
+            for option_index, (text, _) in enumerate(buttons)
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    def _targets(self, compiled: CompiledNode) -> Iterable[str]:
+        if compiled.default_next:
+            yield compiled.default_next
+        for option in compiled.node.options or []:
+            if option.next:
+                yield option.next
+    
+    def _validate(self) -> None:
+        if self.start_node not in self.nodes:
+            raise ConversationGraphError(f"Start node '{self.start_node}' is not defined")
+        
+        dangling: List[str] = []
+        for node_id, compiled in self.nodes.items():
+            for target in self._targets(compiled):
+                if target not in self.nodes:
+                    dangling.append(f"{node_id} -> {target}")
+        if dangling:
+            raise ConversationGraphError(f"Dangling 'next' references: {', '.join(dangling)}")
+    
+    def _find_unreachable(self) -> List[str]:
+        seen = {self.start_node}
+        stack = [self.start_node]
+        while stack:
+            for target in self._targets(self.nodes[stack.pop()]):
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return [node_id for node_id in self.nodes if node_id not in seen]
+    
+    def __len__(self) -> int:
+        return len(self.nodes)
+    
+    def get(self, node_id: str) -> Optional[CompiledNode]:
+        return self.nodes.get(node_id)
+    
+    def resolve(self, node_id: str, callback_data: str) -> Optional[OptionChoice]:
+        """Option pressed on the keyboard of ``node_id``, or None for a stale button.
+        
+        A button is stale when it was built for another node, for an older
+        revision of the conversation, or does not exist at all, including
+        buttons sent before callback_data was encoded, which carry the option text.
+        """
+        choice = self.routes.get(callback_data)
+        if choice is None or choice.node_id != node_id:
+            return None
+        return choice
+    
+    def next_node_id(self, node_id: str, callback_data: str) -> Optional[str]:
+        """Next node for a button press, falling back to the node's default ``next``"""
+        compiled = self.nodes.get(node_id)
+        if compiled is None:
+            return None
+        choice = self.resolve(node_id, callback_data)
+        if choice is None:
+            return compiled.default_next
+        return choice.next
@@ -1,18 +1,32 @@
+import asyncio
 import json
+import os
+from collections import OrderedDict
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from loguru import logger
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardMarkup
 
+from src.conversation.graph import ConversationGraph, MessageTemplate, OptionChoice
 from src.conversation.models import Conversation, ConversationNode, User, ConversationState
 
 class ConversationManager:
-    def __init__(self, conversation_file: str = "conversation.json"):
+    """Serves the compiled conversation graph.
+    
+    The graph can be reloaded while the bot runs. A reload compiles the new
+    file off the event loop and swaps it in with a single assignment. The last
+    ``history_size`` graphs stay available by revision, so a session pinned
+    to a revision keeps using that version until it ends.
+    """
+    
+    def __init__(self, conversation_file: str = "conversation.json", history_size: int = 5):
         self.conversation_file = conversation_file
+        self.history_size = history_size
+        self._graphs: "OrderedDict[str, ConversationGraph]" = OrderedDict()
+        self._file_signature = self._stat_file()
         self.conversation_data = self._load_conversation()
-        self.nodes_map: Dict[str, ConversationNode] = {
-            node.id: node for node in self.conversation_data.conversation
-        }
+        self._install(ConversationGraph(self.conversation_data))
+        self._watch_task: Optional[asyncio.Task] = None
         # Map node_ids to ConversationState values for state machine
         self.node_state_map = {
             "saludo_inicial": ConversationState.INITIAL,
@@ -26,6 +40,8 @@ class ConversationManager:
             "registro_educacion": ConversationState.END,
             "cerrar_chat": ConversationState.END
         }
+        if self.graph.unreachable:
+            logger.warning(f"Unreachable conversation nodes: {', '.join(self.graph.unreachable)}")
         logger.info(f"Loaded {len(self.nodes_map)} conversation nodes from {conversation_file}")
     
     def _load_conversation(self) -> Conversation:
@@ -38,23 +54,97 @@ class ConversationManager:
             logger.error(f"Error loading conversation file: {str(e)}")
             raise
     
-    def get_node(self, node_id: str) -> Optional[ConversationNode]:
-        """Get a conversation node by its ID"""
-        return self.nodes_map.get(node_id)
+    def _stat_file(self) -> Optional[Tuple[int, int]]:
+        """Modification time and size of the conversation file, or None if missing"""
+        try:
+            stat = os.stat(self.conversation_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
     
-    def format_message(self, node: ConversationNode, user_data: Dict[str, Any] = None) -> str:
-        """Format message with user data placeholders"""
-        if not user_data:
-            user_data = {}
+    def _install(self, graph: ConversationGraph) -> None:
+        """Make a compiled graph the current one and keep it for pinned sessions"""
+        self._graphs[graph.revision] = graph
+        self._graphs.move_to_end(graph.revision)
+        while len(self._graphs) > self.history_size:
+            self._graphs.popitem(last=False)
+        self.graph = graph
+    
+    @property
+    def nodes_map(self) -> Dict[str, ConversationNode]:
+        """Nodes of the current graph by ID"""
+        return {node_id: compiled.node for node_id, compiled in self.graph.nodes.items()}
+    
+    def graph_for(self, revision: Optional[str] = None) -> ConversationGraph:
+        """Graph for a pinned revision, or the current graph if it is unknown or no longer kept"""
+        if revision is None:
+            return self.graph
+        return self._graphs.get(revision, self.graph)
+    
+    def _compile(self) -> Tuple[Conversation, ConversationGraph]:
+        conversation = self._load_conversation()
+        return conversation, ConversationGraph(conversation)
+    
+    async def reload(self) -> bool:
+        """Recompile the conversation file and swap it in if it changed.
         
-        message = node.message
-        # Replace placeholders like {{name}} with actual values
-        for key, value in user_data.items():
-            placeholder = f"{{{{{key}}}}}"
-            if placeholder in message:
-                message = message.replace(placeholder, str(value))
+        Returns whether a new revision was installed. An invalid file is
+        logged and the current graph stays in place.
+        """
+        try:
+            conversation, graph = await asyncio.to_thread(self._compile)
+        except Exception as e:
+            logger.error(f"Conversation reload failed, keeping revision {self.graph.revision}: {str(e)}")
+            return False
         
-        return message
+        if graph.revision == self.graph.revision:
+            return False
+        previous = self.graph.revision
+        self.conversation_data = conversation
+        self._install(graph)
+        if graph.unreachable:
+            logger.warning(f"Unreachable conversation nodes: {', '.join(graph.unreachable)}")
+        logger.info(f"Reloaded {len(graph)} conversation nodes from {self.conversation_file}: "
+                    f"revision {previous} -> {graph.revision}")
+        return True
+    
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            signature = self._stat_file()
+            if signature is None or signature == self._file_signature:
+                continue
+            self._file_signature = signature
+            await self.reload()
+    
+    def start_watching(self, interval: float = 2.0) -> None:
+        """Poll the conversation file and reload it when it changes"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+            logger.info(f"Watching {self.conversation_file} for changes every {interval}s")
+    
+    async def stop_watching(self) -> None:
+        """Stop polling the conversation file"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+    
+    def get_node(self, node_id: str, revision: Optional[str] = None) -> Optional[ConversationNode]:
+        """Get a conversation node by its ID"""
+        compiled = self.graph_for(revision).get(node_id)
+        return compiled.node if compiled is not None else None
+    
+    def format_message(self, node: ConversationNode, user_data: Dict[str, Any] = None,
+                       revision: Optional[str] = None) -> str:
+        """Format message with user data placeholders"""
+        compiled = self.graph_for(revision).get(node.id)
+        if compiled is not None and compiled.node is node:
+            return compiled.template.render(user_data)
+        return MessageTemplate.parse(node.message).render(user_data)
     
     def get_state_for_node(self, node_id: str) -> int:
         """Convert node_id to ConversationState value"""
@@ -67,28 +157,22 @@ class ConversationManager:
         user.last_interaction = timestamp
         return user
     
-    def get_next_node_id(self, current_node_id: str, selected_option: str) -> Optional[str]:
+    def get_next_node_id(self, current_node_id: str, selected_option: str,
+                         revision: Optional[str] = None) -> Optional[str]:
         """Determine the next node based on the user's selection"""
-        current_node = self.get_node(current_node_id)
-        if not current_node:
-            return None
-        
-        # If there are options, find the matching option text
-        if current_node.options:
-            for option in current_node.options:
-                if option.text == selected_option:
-                    return option.next
-        
-        # If no matching option or no options, return next node if defined
-        return current_node.next
+        return self.graph_for(revision).next_node_id(current_node_id, selected_option)
     
-    def create_keyboard_markup(self, node: ConversationNode) -> Optional[InlineKeyboardMarkup]:
-        """Create an inline keyboard markup for a conversation node"""
-        if not node.options:
+    def resolve_option(self, current_node_id: str, callback_data: str,
+                       revision: Optional[str] = None) -> Optional[OptionChoice]:
+        """Decode a button press for the current node; None if the button is stale"""
+        return self.graph_for(revision).resolve(current_node_id, callback_data)
+    
+    def create_keyboard_markup(self, node: ConversationNode,
+                               revision: Optional[str] = None) -> Optional[InlineKeyboardMarkup]:
+        """Return the prebuilt inline keyboard markup for a conversation node"""
+        compiled = self.graph_for(revision).get(node.id)
+        if compiled is None:
+            # Buttons of nodes outside the graph could never be routed
+            logger.warning(f"No keyboard for unknown conversation node: {node.id}")
             return None
-        
-        keyboard = []
-        for option in node.options:
-            keyboard.append([InlineKeyboardButton(text=option.text, callback_data=option.text)])
-        
-        return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+        return compiled.markup
\ No newline at end of file
@@ -0,0 +1,118 @@
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Set, Tuple, AsyncIterator, Protocol
+
+from .models import UserDB, UserSession, NodeResponse, SessionSummary, CampaignRun, Delivery, Alert
+
+# Backends selectable with STORAGE_BACKEND
+BACKENDS = ("mongodb", "sqlite", "memory")
+
+class Repository(Protocol):
+    """Storage operations the bot needs, implemented by every backend.
+    
+    Campaign audiences are given as equality filters on user fields, e.g.
+    ``{"education_opt_in": True}``.
+    """
+    
+    async def connect(self) -> None: ...
+    
+    async def close(self) -> None: ...
+    
+    async def flush(self) -> None: ...
+    
+    async def get_user(self, telegram_id: int) -> Optional[UserDB]: ...
+    
+    async def create_user(self, user: UserDB) -> UserDB: ...
+    
+    async def update_user(self, user: UserDB) -> UserDB: ...
+    
+    async def save_user(self, user: UserDB) -> UserDB: ...
+    
+    async def apply_transition(self, telegram_id: int, expected_node: str, next_node: Optional[str],
+                               answer: str, timestamp: str,
+                               fields: Optional[Dict[str, Any]] = None) -> Optional[UserDB]: ...
+    
+    async def get_session(self, session_id: str) -> Optional[UserSession]: ...
+    
+    async def get_active_session(self, telegram_id: int) -> Optional[UserSession]: ...
+    
+    async def create_session(self, session: UserSession) -> UserSession: ...
+    
+    async def update_session(self, session: UserSession) -> UserSession: ...
+    
+    async def append_session_response(self, session: UserSession, response: NodeResponse) -> None: ...
+    
+    async def complete_session(self, session: UserSession) -> UserSession: ...
+    
+    async def get_user_sessions(self, telegram_id: int, limit: int = 10) -> List[UserSession]: ...
+    
+    async def get_session_summaries(self, telegram_id: int, limit: int = 5,
+                                    last_responses: int = 3) -> List[SessionSummary]: ...
+    
+    async def get_user_data(self, telegram_id: int) -> Optional[Dict[str, Any]]: ...
+    
+    async def get_conversation_states(self, name: str) -> Dict[Tuple[Any, ...], Any]: ...
+    
+    async def save_bot_state(self, user_data: Dict[int, Optional[Dict[str, Any]]],
+                             conversations: Dict[Tuple[str, Tuple[Any, ...]], Any]) -> None: ...
+    
+    def iter_campaign_audience(self, query: Dict[str, Any], after_telegram_id: Optional[int] = None,
+                               batch_size: int = 200) -> AsyncIterator[List[Dict[str, Any]]]: ...
+    
+    async def get_campaign_run(self, run_id: str) -> Optional[CampaignRun]: ...
+    
+    async def save_campaign_run(self, run: CampaignRun) -> CampaignRun: ...
+    
+    async def get_delivered_ids(self, run_id: str, after_telegram_id: Optional[int] = None) -> Set[int]: ...
+    
+    async def record_deliveries(self, deliveries: List[Delivery]) -> None: ...
+    
+    async def enqueue_alert(self, alert: Alert, dedup_window: float = 0) -> bool: ...
+    
+    async def get_pending_alerts(self, limit: int = 50) -> List[Alert]: ...
+    
+    async def mark_alerts_sent(self, alert_ids: List[str], sent_at: str) -> None: ...
+
+def dedup_key(alert: Alert, dedup_window: float) -> str:
+    """Key shared by the triggers of an alert kind for a user within the same dedup window.
+    
+    Windows are fixed buckets of ``dedup_window`` seconds, so the key can back
+    a unique index; two triggers either side of a bucket boundary give two alerts.
+    """
+    bucket = int(datetime.fromisoformat(alert.created_at).timestamp() // dedup_window)
+    return f"{alert.telegram_id}:{alert.kind}:{bucket}"
+
+def transition_fields(node_id: str, next_node: Optional[str], answer: str, timestamp: str,
+                      fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Dotted field paths a node transition sets on the user document.
+    
+    Only the answer to ``node_id`` is written, not the whole ``responses`` dict;
+    without a ``next_node`` the user stays on ``node_id``.
+    """
+    update: Dict[str, Any] = {
+        f"responses.{node_id}": {"answer": answer, "timestamp": timestamp},
+        "last_interaction": timestamp,
+    }
+    if next_node:
+        update["current_node"] = next_node
+    if fields:
+        update.update(fields)
+    return update
+
+def create_repository(backend: str) -> Repository:
+    """Repository for a STORAGE_BACKEND value; backends are imported only when selected"""
+    from src.config.settings import settings
+    
+    if backend == "mongodb":
+        from .repository import MongoDBRepository
+        return MongoDBRepository()
+    if backend == "sqlite":
+        from .sqlite import SQLiteRepository
+        return SQLiteRepository(
+            settings.SQLITE_PATH,
+            commit_interval=settings.SQLITE_COMMIT_INTERVAL,
+            commit_batch_size=settings.SQLITE_COMMIT_BATCH_SIZE
+        )
+    if backend == "memory":
+        from .memory import InMemoryRepository
+        return InMemoryRepository()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend} (expected one of {', '.join(BACKENDS)})")
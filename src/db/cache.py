@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+from .models import UserDB
+
+class UserCache:
+    """Bounded in-process cache of UserDB objects with LRU and TTL eviction.
+    
+    The cache stores and returns copies, so handlers can mutate the user they
+    got back without changing the cached value until the write goes through.
+    """
+    
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, Tuple[float, UserDB]]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, telegram_id: int) -> Optional[UserDB]:
+        """Return a copy of the cached user, or None on a miss or expired entry"""
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[telegram_id]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return user.model_copy(deep=True)
+    
+    def put(self, user: UserDB) -> None:
+        """Store a copy of the user, evicting the least recently used entries if full"""
+        self._entries[user.telegram_id] = (time.monotonic() + self.ttl, user.model_copy(deep=True))
+        self._entries.move_to_end(user.telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, telegram_id: int) -> None:
+        """Drop a user from the cache"""
+        self._entries.pop(telegram_id, None)
+    
+    def clear(self) -> None:
+        """Drop every cached user"""
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
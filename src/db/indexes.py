@@ -0,0 +1,105 @@
+from typing import Any, Dict, List, Tuple
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCursor, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Indexes every repository query relies on, by collection. Names are left to
+# MongoDB's default so indexes created by earlier versions are recognised.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("telegram_id", ASCENDING)], unique=True),
+        # iter_campaign_audience: opted-in users streamed in telegram_id order
+        IndexModel([("education_opt_in", ASCENDING), ("telegram_id", ASCENDING)]),
+    ],
+    "sessions": [
+        IndexModel([("session_id", ASCENDING)], unique=True),
+        # get_user_sessions: equality on telegram_id and completed, sorted by start_time
+        IndexModel([("telegram_id", ASCENDING), ("completed", ASCENDING), ("start_time", DESCENDING)]),
+        # get_active_session: only incomplete sessions are indexed, so it stays small
+        IndexModel(
+            [("telegram_id", ASCENDING), ("completed", ASCENDING)],
+            name="active_sessions",
+            partialFilterExpression={"completed": False}
+        ),
+        # Triage rollups: sessions changed since a checkpoint, and the sessions of a day;
+        # the export also streams sessions in (start_time, session_id) order
+        IndexModel([("end_time", ASCENDING)]),
+        IndexModel([("start_time", ASCENDING), ("session_id", ASCENDING)]),
+    ],
+    "user_data": [
+        IndexModel([("telegram_id", ASCENDING)], unique=True),
+    ],
+    "conversations": [
+        IndexModel([("name", ASCENDING)]),
+    ],
+    "campaign_runs": [
+        IndexModel([("run_id", ASCENDING)], unique=True),
+    ],
+    "deliveries": [
+        IndexModel([("run_id", ASCENDING), ("telegram_id", ASCENDING)], unique=True),
+    ],
+    "alerts": [
+        IndexModel([("alert_id", ASCENDING)], unique=True),
+        # enqueue_alert: one alert per dedup key, so concurrent triggers cannot both insert
+        IndexModel(
+            [("dedup_key", ASCENDING)],
+            name="alerts_dedup",
+            unique=True,
+            partialFilterExpression={"dedup_key": {"$exists": True}}
+        ),
+        # get_pending_alerts: only undelivered alerts are indexed, most urgent first
+        IndexModel(
+            [("priority", ASCENDING), ("created_at", ASCENDING)],
+            name="pending_alerts",
+            partialFilterExpression={"status": "pending"}
+        ),
+    ],
+}
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Create the indexes in INDEXES and warn about indexes that are no longer needed.
+    
+    Extra indexes are not dropped automatically, since building them back on a
+    large collection is expensive if that was a mistake.
+    """
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        await collection.create_indexes(models)
+        wanted = {model.document["name"] for model in models} | {"_id_"}
+        async for index in collection.list_indexes():
+            if index["name"] not in wanted:
+                logger.warning(f"Index {collection_name}.{index['name']} is not used by the repository and can be dropped")
+
+def _stages(plan: Any) -> List[str]:
+    """All stage names of an explain() plan tree"""
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages.extend(_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    return []
+
+async def check_query_plans(queries: List[Tuple[str, AsyncIOMotorCursor]]) -> List[str]:
+    """Run explain() on each query and warn when one falls back to a collection scan.
+    
+    Returns the names of the queries that scan a collection.
+    """
+    scans = []
+    for name, cursor in queries:
+        try:
+            explanation = await cursor.explain()
+        except Exception as e:
+            logger.warning(f"Could not explain query {name}: {str(e)}")
+            continue
+        stages = _stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            scans.append(name)
+            logger.warning(f"Query {name} uses a collection scan: {' <- '.join(stages)}")
+        else:
+            logger.debug(f"Query {name} plan: {' <- '.join(stages)}")
+    if not scans:
+        logger.info(f"All {len(queries)} repository queries use an index")
+    return scans
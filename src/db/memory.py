@@ -0,0 +1,215 @@
+import copy
+from typing import Optional, List, Dict, Any, Set, Tuple, AsyncIterator
+
+from src.metrics.registry import instrument_methods
+from .base import dedup_key, transition_fields
+from .models import UserDB, UserSession, NodeResponse, SessionSummary, CampaignRun, Delivery, Alert
+
+@instrument_methods
+class InMemoryRepository:
+    """Repository kept in process memory, for tests, benchmarks and offline runs.
+    
+    Documents are stored as dicts, as MongoDBRepository would send them, so
+    callers never share model instances with the store. Nothing survives a restart.
+    """
+    
+    def __init__(self):
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.user_data: Dict[int, Dict[str, Any]] = {}
+        self.conversations: Dict[Tuple[str, Tuple[Any, ...]], Any] = {}
+        self.campaign_runs: Dict[str, Dict[str, Any]] = {}
+        self.deliveries: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self.alerts: Dict[str, Dict[str, Any]] = {}
+    
+    async def connect(self):
+        pass
+    
+    async def close(self):
+        pass
+    
+    async def flush(self) -> None:
+        pass
+    
+    async def get_user(self, telegram_id: int) -> Optional[UserDB]:
+        """Get user by Telegram ID"""
+        document = self.users.get(telegram_id)
+        return UserDB.from_dict(copy.deepcopy(document)) if document else None
+    
+    async def create_user(self, user: UserDB) -> UserDB:
+        """Create a new user"""
+        self.users[user.telegram_id] = user.to_dict()
+        return user
+    
+    async def update_user(self, user: UserDB) -> UserDB:
+        """Update an existing user"""
+        if user.telegram_id in self.users:
+            self.users[user.telegram_id].update(user.to_dict())
+        return user
+    
+    async def save_user(self, user: UserDB) -> UserDB:
+        """Create or update user"""
+        self.users.setdefault(user.telegram_id, {}).update(user.to_dict())
+        return user
+    
+    async def apply_transition(self, telegram_id: int, expected_node: str, next_node: Optional[str],
+                               answer: str, timestamp: str,
+                               fields: Optional[Dict[str, Any]] = None) -> Optional[UserDB]:
+        """Record the answer to ``expected_node`` and move to ``next_node``, if the user is still there"""
+        document = self.users.get(telegram_id)
+        if document is None or document.get("current_node") != expected_node:
+            return None
+        for path, value in transition_fields(expected_node, next_node, answer, timestamp, fields).items():
+            *parents, field = path.split(".")
+            target = document
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[field] = copy.deepcopy(value)
+        return UserDB.from_dict(copy.deepcopy(document))
+    
+    async def get_session(self, session_id: str) -> Optional[UserSession]:
+        """Get a session by its ID"""
+        document = self.sessions.get(session_id)
+        return UserSession.from_dict(copy.deepcopy(document)) if document else None
+    
+    async def get_active_session(self, telegram_id: int) -> Optional[UserSession]:
+        """Get the active (incomplete) session for a user"""
+        for document in self.sessions.values():
+            if document["telegram_id"] == telegram_id and not document["completed"]:
+                return UserSession.from_dict(copy.deepcopy(document))
+        return None
+    
+    async def create_session(self, session: UserSession) -> UserSession:
+        """Create a new session"""
+        self.sessions[session.session_id] = session.to_dict()
+        return session
+    
+    async def update_session(self, session: UserSession) -> UserSession:
+        """Update an existing session"""
+        if session.session_id in self.sessions:
+            self.sessions[session.session_id].update(session.to_dict())
+        return session
+    
+    async def append_session_response(self, session: UserSession, response: NodeResponse) -> None:
+        """Append a single response to a session"""
+        document = self.sessions.get(session.session_id)
+        if document is not None:
+            document["responses"].append(response.model_dump(exclude_none=True))
+            document["end_time"] = response.timestamp
+    
+    async def complete_session(self, session: UserSession) -> UserSession:
+        """Persist the completion fields of a session without rewriting its responses"""
+        document = self.sessions.get(session.session_id)
+        if document is not None:
+            document["completed"] = session.completed
+            document["end_time"] = session.end_time
+            if session.final_message is not None:
+                document["final_message"] = session.final_message
+        return session
+    
+    def _completed_sessions(self, telegram_id: int, limit: int) -> List[Dict[str, Any]]:
+        documents = [
+            document for document in self.sessions.values()
+            if document["telegram_id"] == telegram_id and document["completed"]
+        ]
+        documents.sort(key=lambda document: document["start_time"], reverse=True)
+        return documents[:limit]
+    
+    async def get_user_sessions(self, telegram_id: int, limit: int = 10) -> List[UserSession]:
+        """Get completed sessions for a user"""
+        return [
+            UserSession.from_dict(copy.deepcopy(document))
+            for document in self._completed_sessions(telegram_id, limit)
+        ]
+    
+    async def get_session_summaries(self, telegram_id: int, limit: int = 5,
+                                    last_responses: int = 3) -> List[SessionSummary]:
+        """Get summaries of the latest completed sessions of a user"""
+        return [
+            SessionSummary.from_session(document, last_responses)
+            for document in self._completed_sessions(telegram_id, limit)
+        ]
+    
+    async def get_user_data(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Get the persisted bot user_data of a user"""
+        data = self.user_data.get(telegram_id)
+        return copy.deepcopy(data) if data is not None else None
+    
+    async def get_conversation_states(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        """Get every persisted state of a ConversationHandler, keyed by conversation key"""
+        return {key: state for (state_name, key), state in self.conversations.items() if state_name == name}
+    
+    async def save_bot_state(self, user_data: Dict[int, Optional[Dict[str, Any]]],
+                             conversations: Dict[Tuple[str, Tuple[Any, ...]], Any]) -> None:
+        """Store user_data and conversation states; ``None`` deletes the stored entry"""
+        for telegram_id, data in user_data.items():
+            if data is None:
+                self.user_data.pop(telegram_id, None)
+            else:
+                self.user_data[telegram_id] = copy.deepcopy(data)
+        for (name, key), state in conversations.items():
+            if state is None:
+                self.conversations.pop((name, tuple(key)), None)
+            else:
+                self.conversations[(name, tuple(key))] = state
+    
+    async def iter_campaign_audience(self, query: Dict[str, Any], after_telegram_id: Optional[int] = None,
+                                     batch_size: int = 200) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream users matching ``query`` in telegram_id order, in batches"""
+        batch = []
+        for telegram_id in sorted(self.users):
+            if after_telegram_id is not None and telegram_id <= after_telegram_id:
+                continue
+            document = self.users[telegram_id]
+            if all(document.get(field) == value for field, value in query.items()):
+                batch.append({"telegram_id": telegram_id, "first_name": document.get("first_name")})
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+    
+    async def get_campaign_run(self, run_id: str) -> Optional[CampaignRun]:
+        """Get a campaign run by its ID"""
+        document = self.campaign_runs.get(run_id)
+        return CampaignRun.from_dict(copy.deepcopy(document)) if document else None
+    
+    async def save_campaign_run(self, run: CampaignRun) -> CampaignRun:
+        """Create or update the checkpoint of a campaign run"""
+        self.campaign_runs[run.run_id] = run.to_dict()
+        return run
+    
+    async def get_delivered_ids(self, run_id: str, after_telegram_id: Optional[int] = None) -> Set[int]:
+        """IDs of users a run already recorded a delivery for, after a checkpoint"""
+        return {
+            telegram_id for delivery_run_id, telegram_id in self.deliveries
+            if delivery_run_id == run_id and (after_telegram_id is None or telegram_id > after_telegram_id)
+        }
+    
+    async def record_deliveries(self, deliveries: List[Delivery]) -> None:
+        """Record delivery results; already recorded ones are skipped"""
+        for delivery in deliveries:
+            self.deliveries.setdefault((delivery.run_id, delivery.telegram_id), delivery.to_dict())
+    
+    async def enqueue_alert(self, alert: Alert, dedup_window: float = 0) -> bool:
+        """Store a pending alert, or count it on the alert with the same dedup key"""
+        if dedup_window:
+            alert.dedup_key = dedup_key(alert, dedup_window)
+            for document in self.alerts.values():
+                if document.get("dedup_key") == alert.dedup_key:
+                    document["triggers"] = document.get("triggers", 1) + 1
+                    return False
+        self.alerts[alert.alert_id] = alert.to_dict()
+        return True
+    
+    async def get_pending_alerts(self, limit: int = 50) -> List[Alert]:
+        """Alerts not delivered yet, most urgent and oldest first"""
+        documents = [document for document in self.alerts.values() if document["status"] == "pending"]
+        documents.sort(key=lambda document: (document["priority"], document["created_at"]))
+        return [Alert.from_dict(copy.deepcopy(document)) for document in documents[:limit]]
+    
+    async def mark_alerts_sent(self, alert_ids: List[str], sent_at: str) -> None:
+        """Mark alerts as delivered to staff"""
+        for alert_id in alert_ids:
+            if alert_id in self.alerts:
+                self.alerts[alert_id].update(status="sent", sent_at=sent_at)
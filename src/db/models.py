@@ -44,6 +44,48 @@ class NodeResponse(BaseModel):
     timestamp: str
     message_text: Optional[str] = None
 
+class SessionSummary(BaseModel):
+    """Summary of a completed session, as returned for /historial"""
+    session_id: str
+    start_time: str
+    end_time: str
+    session_type: str
+    final_message: Optional[str] = None
+    responses_count: int = 0
+    last_responses: List[NodeResponse] = Field(default_factory=list)
+    duration_seconds: Optional[float] = None
+    
+    @property
+    def duration_minutes(self) -> int:
+        """Whole minutes between start and end of the session"""
+        seconds = self.duration_seconds
+        if seconds is None:
+            duration = datetime.fromisoformat(self.end_time) - datetime.fromisoformat(self.start_time)
+            seconds = duration.total_seconds()
+        return int(seconds // 60)
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionSummary":
+        """Create model from an aggregation result"""
+        return cls(**data)
+    
+    @classmethod
+    def from_session(cls, data: Dict[str, Any], last_responses: int = 3) -> "SessionSummary":
+        """Summarize a stored session document, for backends without an aggregation pipeline"""
+        responses = data.get("responses") or []
+        return cls(
+            session_id=data["session_id"],
+            start_time=data["start_time"],
+            end_time=data["end_time"],
+            session_type=data["session_type"],
+            final_message=data.get("final_message"),
+            responses_count=len(responses),
+            last_responses=[
+                NodeResponse(node_id=r["node_id"], response=r["response"], timestamp=r["timestamp"])
+                for r in responses[-last_responses:]
+            ],
+        )
+
 class UserSession(BaseModel):
     """Model for complete user interaction sessions"""
     telegram_id: int
@@ -54,9 +96,11 @@ class UserSession(BaseModel):
     responses: List[NodeResponse]
     completed: bool = False
     final_message: Optional[str] = None
+    graph_revision: Optional[str] = None  # Revisión de conversation.json usada por la sesión
     
     @classmethod
-    def create_new(cls, telegram_id: int, session_type: str = "normal") -> "UserSession":
+    def create_new(cls, telegram_id: int, session_type: str = "normal",
+                   graph_revision: Optional[str] = None) -> "UserSession":
         """Create a new session"""
         now = datetime.now().isoformat()
         return cls(
@@ -65,11 +109,12 @@ class UserSession(BaseModel):
             start_time=now,
             end_time=now,
             session_type=session_type,
-            responses=[]
+            responses=[],
+            graph_revision=graph_revision
         )
     
-    def add_response(self, node_id: str, response: str, message_text: Optional[str] = None) -> None:
-        """Add a response to the session"""
+    def add_response(self, node_id: str, response: str, message_text: Optional[str] = None) -> NodeResponse:
+        """Add a response to the session and return it"""
         now = datetime.now().isoformat()
         
         # Asegurar que node_id y response sean strings
@@ -84,15 +129,15 @@ class UserSession(BaseModel):
             except:
                 message_text_str = "Error en mensaje"
         
-        self.responses.append(
-            NodeResponse(
-                node_id=node_id_str,
-                response=response_str,
-                timestamp=now,
-                message_text=message_text_str
-            )
+        node_response = NodeResponse(
+            node_id=node_id_str,
+            response=response_str,
+            timestamp=now,
+            message_text=message_text_str
         )
+        self.responses.append(node_response)
         self.end_time = now
+        return node_response
     
     def complete_session(self, final_message: Optional[str] = None) -> None:
         """Mark the session as completed"""
@@ -108,4 +153,75 @@ class UserSession(BaseModel):
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "UserSession":
         """Create model from dictionary (from MongoDB)"""
-        return cls(**data) 
\ No newline at end of file
+        return cls(**data)
+
+class CampaignRun(BaseModel):
+    """Progress of one scheduled send of a campaign, checkpointed so it can resume"""
+    run_id: str
+    campaign_id: str
+    status: str = "running"  # "running" o "completed"
+    last_telegram_id: Optional[int] = None
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    started_at: str
+    updated_at: str
+    completed_at: Optional[str] = None
+    
+    @classmethod
+    def create_new(cls, run_id: str, campaign_id: str) -> "CampaignRun":
+        """Create a new run"""
+        now = datetime.now().isoformat()
+        return cls(run_id=run_id, campaign_id=campaign_id, started_at=now, updated_at=now)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert model to dictionary for MongoDB storage"""
+        return self.model_dump(exclude_none=True)
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CampaignRun":
+        """Create model from dictionary (from MongoDB)"""
+        return cls(**data)
+
+class Delivery(BaseModel):
+    """Result of sending a campaign message to one user"""
+    run_id: str
+    telegram_id: int
+    status: str  # "sent", "failed" o "blocked"
+    timestamp: str
+    error: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert model to dictionary for MongoDB storage"""
+        return self.model_dump(exclude_none=True)
+
+class Alert(BaseModel):
+    """Event clinical staff must be told about, kept until it is delivered"""
+    alert_id: str
+    telegram_id: int
+    kind: str  # "empeoramiento", "hospital_dia" o "teleconsulta"
+    priority: int = 0  # 0 es la más urgente
+    source: Optional[str] = None  # "texto", "comando" o "triaje"
+    first_name: Optional[str] = None
+    session_id: Optional[str] = None
+    status: str = "pending"  # "pending" o "sent"
+    triggers: int = 1  # Veces que se disparó dentro de la ventana de deduplicación
+    dedup_key: Optional[str] = None  # "<telegram_id>:<kind>:<ventana>", único entre las alertas
+    created_at: str
+    sent_at: Optional[str] = None
+    
+    @classmethod
+    def create_new(cls, telegram_id: int, kind: str, priority: int = 0, **fields) -> "Alert":
+        """Create a pending alert"""
+        now = datetime.now().isoformat()
+        return cls(alert_id=f"{telegram_id}_{kind}_{now}", telegram_id=telegram_id, kind=kind,
+                   priority=priority, created_at=now, **fields)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert model to dictionary for MongoDB storage"""
+        return self.model_dump(exclude_none=True)
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Alert":
+        """Create model from dictionary (from MongoDB)"""
+        return cls(**data)
@@ -0,0 +1,165 @@
+import asyncio
+from typing import Optional, Dict, Any, Set, Tuple
+
+from loguru import logger
+from telegram.ext import BasePersistence, PersistenceInput
+
+from .models import UserSession
+from .base import Repository
+
+# user_data stores the session in progress by reference; the session document is the source of truth
+SESSION_REFERENCE = "__session_id__"
+
+class MongoPersistence(BasePersistence):
+    """python-telegram-bot persistence for user_data and ConversationHandler states.
+    
+    user_data is loaded lazily, the first time an update of a user is handled,
+    instead of for every user at startup. Conversation states cannot be:
+    ConversationHandler reads them all once when the application starts and
+    then looks them up synchronously in ``check_update``, so there is no point
+    at which a missing state could be fetched. They stay cheap to load: only
+    conversations in progress are stored (an ended one is deleted), and each
+    is a small document read with one query. Changes handed over by the
+    application are coalesced for ``flush_delay`` seconds and written with one
+    ``bulk_write`` per collection, so persistence does not add a write per update.
+    """
+    
+    def __init__(self, repository: Repository, update_interval: float = 5.0, flush_delay: float = 1.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.repository = repository
+        self.flush_delay = flush_delay
+        self._loaded_users: Set[int] = set()
+        self._pending_user_data: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._pending_conversations: Dict[Tuple[str, Tuple[Any, ...]], Any] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+    
+    @staticmethod
+    def _encode_user_data(data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            key: {SESSION_REFERENCE: value.session_id} if isinstance(value, UserSession) else value
+            for key, value in data.items()
+        }
+    
+    async def _decode_user_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        decoded = {}
+        for key, value in data.items():
+            if isinstance(value, dict) and SESSION_REFERENCE in value:
+                session = await self.repository.get_session(value[SESSION_REFERENCE])
+                if session is None or session.completed:
+                    continue
+                value = session
+            decoded[key] = value
+        return decoded
+    
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+    
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self._write_pending()
+        except Exception as e:
+            logger.error(f"Failed to persist bot state: {str(e)}")
+    
+    async def _write_pending(self) -> None:
+        async with self._flush_lock:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not user_data and not conversations:
+                return
+            try:
+                await self.repository.save_bot_state(user_data, conversations)
+            except BaseException:
+                # Keep the batch for the next flush; changes made since then win
+                user_data.update(self._pending_user_data)
+                conversations.update(self._pending_conversations)
+                self._pending_user_data = user_data
+                self._pending_conversations = conversations
+                raise
+    
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        # Loaded per user in refresh_user_data
+        return {}
+    
+    async def get_chat_data(self) -> Dict[int, Dict[str, Any]]:
+        return {}
+    
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+    
+    async def get_callback_data(self) -> None:
+        return None
+    
+    async def get_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        """Every stored state of conversation ``name``, read once at startup (see the class docstring)"""
+        states = await self.repository.get_conversation_states(name)
+        for (pending_name, key), state in self._pending_conversations.items():
+            if pending_name == name:
+                if state is None:
+                    states.pop(key, None)
+                else:
+                    states[key] = state
+        logger.info(f"Loaded {len(states)} persisted states for conversation {name}")
+        return states
+    
+    async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[object]) -> None:
+        self._pending_conversations[(name, tuple(key))] = new_state
+        self._schedule_flush()
+    
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        self._loaded_users.add(user_id)
+        self._pending_user_data[user_id] = self._encode_user_data(data)
+        self._schedule_flush()
+    
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.discard(user_id)
+        self._pending_user_data[user_id] = None
+        self._schedule_flush()
+    
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        
+        if user_id in self._pending_user_data:
+            stored = self._pending_user_data[user_id]
+        else:
+            stored = await self.repository.get_user_data(user_id)
+        if stored:
+            for key, value in (await self._decode_user_data(stored)).items():
+                user_data.setdefault(key, value)
+    
+    async def update_chat_data(self, chat_id: int, data: Dict[str, Any]) -> None:
+        pass
+    
+    async def update_bot_data(self, data: Dict[str, Any]) -> None:
+        pass
+    
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+    
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+    
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[str, Any]) -> None:
+        pass
+    
+    async def refresh_bot_data(self, bot_data: Dict[str, Any]) -> None:
+        pass
+    
+    async def flush(self) -> None:
+        """Write everything still pending; called by the application on shutdown"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        await self._write_pending()
+        logger.info("Flushed persisted bot state")
@@ -1,10 +1,224 @@
-from typing import Optional, List, Dict, Any
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
+import asyncio
+import functools
+import time
+from typing import Optional, List, Dict, Any, Set, Tuple, AsyncIterator
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection, AsyncIOMotorCursor
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne, WriteConcern, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from loguru import logger
 
 from src.config.settings import settings
-from .models import UserDB, UserSession
+from src.metrics.registry import instrument_methods, record_round_trip
+from .base import dedup_key, transition_fields
+from .cache import UserCache
+from .indexes import ensure_indexes, check_query_plans
+from .models import UserDB, UserSession, NodeResponse, SessionSummary, CampaignRun, Delivery, Alert
 
+class RoundTripListener(monitoring.CommandListener):
+    """pymongo listener counting the commands sent on behalf of the current update"""
+    
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        record_round_trip()
+    
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+    
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+class PendingWrite:
+    """Merged, not yet flushed changes for a single document"""
+    
+    def __init__(self, owner: int):
+        self.owner = owner
+        self.insert: Optional[Dict[str, Any]] = None
+        self.set: Dict[str, Any] = {}
+        self.push: Dict[str, List[Any]] = {}
+    
+    def add_insert(self, document: Dict[str, Any]) -> None:
+        """Register a new document; later changes are folded into it"""
+        self.insert = dict(document)
+        for field, value in self.set.items():
+            self.insert[field] = value
+        for field, items in self.push.items():
+            self.insert.setdefault(field, []).extend(items)
+        self.set = {}
+        self.push = {}
+    
+    def add_set(self, fields: Dict[str, Any]) -> None:
+        """Merge a ``$set``; a later value for a pushed field replaces the pushes"""
+        if self.insert is not None:
+            self.insert.update(fields)
+            return
+        for field, value in fields.items():
+            self.push.pop(field, None)
+            self.set[field] = value
+    
+    def add_push(self, field: str, items: List[Any]) -> None:
+        """Merge a ``$push``; pushes onto a field already being set extend that value"""
+        if self.insert is not None:
+            self.insert.setdefault(field, []).extend(items)
+        elif field in self.set:
+            self.set[field] = list(self.set[field]) + list(items)
+        else:
+            self.push.setdefault(field, []).extend(items)
+    
+    def absorb(self, newer: "PendingWrite") -> None:
+        """Apply the changes of a newer pending write on top of this one"""
+        if newer.insert is not None:
+            self.add_insert(newer.insert)
+        if newer.set:
+            self.add_set(newer.set)
+        for field, items in newer.push.items():
+            self.add_push(field, items)
+    
+    def to_operation(self, key_field: str, key: Any):
+        """Build the bulk_write operation for this document"""
+        if self.insert is not None:
+            return InsertOne(self.insert)
+        update: Dict[str, Any] = {}
+        if self.set:
+            update["$set"] = self.set
+        if self.push:
+            update["$push"] = {field: {"$each": items} for field, items in self.push.items()}
+        return UpdateOne({key_field: key}, update)
+
+class WriteBehindBuffer:
+    """Buffers repository writes and flushes them as ``bulk_write`` batches.
+    
+    Changes to the same document within a flush window are merged into a single
+    operation, so a burst of button presses from one user costs one write per
+    collection instead of one round trip per call.
+    
+    A batch being written still counts as pending until ``bulk_write``
+    returns, so a read that flushes pending writes first waits for it.
+    """
+    
+    KEY_FIELDS = {"users": "telegram_id", "sessions": "session_id"}
+    
+    def __init__(self, flush_interval: float, batch_size: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.collections: Dict[str, AsyncIOMotorCollection] = {}
+        self._pending: Dict[str, Dict[Any, PendingWrite]] = {name: {} for name in self.KEY_FIELDS}
+        self._owners: Dict[str, Dict[int, Set[Any]]] = {name: {} for name in self.KEY_FIELDS}
+        # Batch of each collection being written by flush()
+        self._in_flight: Dict[str, Dict[Any, PendingWrite]] = {name: {} for name in self.KEY_FIELDS}
+        self._in_flight_owners: Dict[str, Dict[int, Set[Any]]] = {name: {} for name in self.KEY_FIELDS}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, collections: Dict[str, AsyncIOMotorCollection]) -> None:
+        """Bind the target collections and start the periodic flush task"""
+        self.collections = collections
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the periodic flush task and durably flush what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(durable=True)
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {str(e)}")
+    
+    def __len__(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+    
+    def _entry(self, collection: str, key: Any, owner: int) -> PendingWrite:
+        pending = self._pending[collection]
+        entry = pending.get(key)
+        if entry is None:
+            entry = pending[key] = PendingWrite(owner)
+            self._owners[collection].setdefault(owner, set()).add(key)
+        return entry
+    
+    async def insert(self, collection: str, key: Any, owner: int, document: Dict[str, Any]) -> None:
+        self._entry(collection, key, owner).add_insert(document)
+        await self._maybe_flush()
+    
+    async def set(self, collection: str, key: Any, owner: int, fields: Dict[str, Any]) -> None:
+        self._entry(collection, key, owner).add_set(fields)
+        await self._maybe_flush()
+    
+    async def push(self, collection: str, key: Any, owner: int, field: str, items: List[Any],
+                   fields: Optional[Dict[str, Any]] = None) -> None:
+        entry = self._entry(collection, key, owner)
+        entry.add_push(field, items)
+        if fields:
+            entry.add_set(fields)
+        await self._maybe_flush()
+    
+    def has_pending(self, collection: str, owner: int) -> bool:
+        """Whether there are unflushed writes for a user in a collection, including a batch being written"""
+        return bool(self._owners[collection].get(owner) or self._in_flight_owners[collection].get(owner))
+    
+    def is_pending(self, collection: str, key: Any) -> bool:
+        """Whether a document has unflushed writes, including a batch being written"""
+        return key in self._pending[collection] or key in self._in_flight[collection]
+    
+    async def _maybe_flush(self) -> None:
+        if len(self) >= self.batch_size:
+            await self.flush()
+    
+    async def flush(self, durable: bool = False) -> None:
+        """Write all pending changes, one ``bulk_write`` per collection"""
+        async with self._flush_lock:
+            for name, key_field in self.KEY_FIELDS.items():
+                batch = self._pending[name]
+                if not batch:
+                    continue
+                self._in_flight[name] = batch
+                self._in_flight_owners[name] = self._owners[name]
+                self._pending[name] = {}
+                self._owners[name] = {}
+                
+                collection = self.collections[name]
+                if durable:
+                    collection = collection.with_options(write_concern=WriteConcern(w="majority", j=True))
+                keys = list(batch.keys())
+                operations = [batch[key].to_operation(key_field, key) for key in keys]
+                try:
+                    await collection.bulk_write(operations, ordered=False)
+                    logger.debug(f"Flushed {len(operations)} buffered writes to {name}")
+                except BulkWriteError as e:
+                    # Failed operations are not retryable (e.g. duplicate keys); the rest were applied
+                    for error in e.details.get("writeErrors", []):
+                        logger.error(f"Buffered write to {name} for {keys[error['index']]} failed: {error.get('errmsg')}")
+                except Exception as e:
+                    logger.error(f"Failed to flush {len(operations)} buffered writes to {name}: {str(e)}")
+                    self._restore(name, batch)
+                    raise
+                finally:
+                    self._in_flight[name] = {}
+                    self._in_flight_owners[name] = {}
+    
+    def _restore(self, collection: str, batch: Dict[Any, PendingWrite]) -> None:
+        """Put a failed batch back in front of the writes buffered since"""
+        newer = self._pending[collection]
+        for key, entry in newer.items():
+            if key in batch:
+                batch[key].absorb(entry)
+            else:
+                batch[key] = entry
+        self._pending[collection] = batch
+        owners: Dict[int, Set[Any]] = {}
+        for key, entry in batch.items():
+            owners.setdefault(entry.owner, set()).add(key)
+        self._owners[collection] = owners
+
+@instrument_methods
 class MongoDBRepository:
     """Repository class for MongoDB operations"""
     
@@ -13,46 +227,178 @@ class MongoDBRepository:
         self.db: Optional[AsyncIOMotorDatabase] = None
         self.users: Optional[AsyncIOMotorCollection] = None
         self.sessions: Optional[AsyncIOMotorCollection] = None
+        self.user_data: Optional[AsyncIOMotorCollection] = None
+        self.conversations: Optional[AsyncIOMotorCollection] = None
+        self.campaign_runs: Optional[AsyncIOMotorCollection] = None
+        self.deliveries: Optional[AsyncIOMotorCollection] = None
+        self.alerts: Optional[AsyncIOMotorCollection] = None
+        self.write_buffer: Optional[WriteBehindBuffer] = None
+        if settings.WRITE_BEHIND_ENABLED:
+            self.write_buffer = WriteBehindBuffer(
+                flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+                batch_size=settings.WRITE_BEHIND_BATCH_SIZE
+            )
+        self.user_cache: Optional[UserCache] = None
+        if settings.USER_CACHE_ENABLED:
+            self.user_cache = UserCache(
+                max_size=settings.USER_CACHE_MAX_SIZE,
+                ttl=settings.USER_CACHE_TTL
+            )
+        self._connecting: Optional[asyncio.Future] = None
+        self._index_task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def client_options() -> Dict[str, Any]:
+        """Pool, timeout and compression options for AsyncIOMotorClient"""
+        options: Dict[str, Any] = {
+            "ssl": True,
+            "tlsAllowInvalidCertificates": True,
+            "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+            "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            # Counts the commands each update sends, for the metrics endpoint
+            "event_listeners": [RoundTripListener()],
+        }
+        if settings.MONGODB_COMPRESSORS:
+            options["compressors"] = settings.MONGODB_COMPRESSORS
+        return options
     
     async def connect(self):
-        """Connect to MongoDB"""
-        if self.client is None:
-            try:
-                self.client = AsyncIOMotorClient(
-                    settings.MONGODB_CONNECTION_STRING,
-                    ssl=True,
-                    tlsAllowInvalidCertificates=True
-                )
-                self.db = self.client[settings.MONGODB_DATABASE]
-                self.users = self.db.users
-                self.sessions = self.db.sessions
-                
-                # Create indexes
-                await self.users.create_index("telegram_id", unique=True)
-                await self.sessions.create_index("telegram_id")
-                await self.sessions.create_index("session_id", unique=True)
-                await self.sessions.create_index([("telegram_id", 1), ("start_time", -1)])
-                
-                logger.info(f"Connected to MongoDB: {settings.MONGODB_DATABASE}")
-            except Exception as e:
-                logger.error(f"Failed to connect to MongoDB: {str(e)}")
-                raise
+        """Connect to MongoDB.
+        
+        Concurrent callers share a single connection attempt. A failed attempt
+        is not remembered, so the next call tries again.
+        """
+        if self.users is not None:
+            return
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
+        # A caller that is cancelled must not cancel the attempt others wait for
+        await asyncio.shield(self._connecting)
+    
+    async def _connect(self) -> None:
+        if settings.MONGODB_INDEX_MODE not in ("foreground", "background", "skip"):
+            self._connecting = None
+            raise ValueError(f"Unknown MONGODB_INDEX_MODE: {settings.MONGODB_INDEX_MODE}")
+        
+        client = AsyncIOMotorClient(settings.MONGODB_CONNECTION_STRING, **self.client_options())
+        try:
+            # Fail at startup, within serverSelectionTimeoutMS, instead of on the first update
+            started = time.perf_counter()
+            await client.admin.command("ping")
+            ping_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            client.close()
+            self._connecting = None
+            logger.error(f"Failed to connect to MongoDB: {str(e)}")
+            raise
+        
+        self.client = client
+        self.db = self.client[settings.MONGODB_DATABASE]
+        self.sessions = self.db.sessions
+        self.user_data = self.db.user_data
+        self.conversations = self.db.conversations
+        self.campaign_runs = self.db.campaign_runs
+        self.deliveries = self.db.deliveries
+        self.alerts = self.db.alerts
+        # Set last: other callers treat users as the sign that the connection is ready
+        self.users = self.db.users
+        logger.info(f"Connected to MongoDB: {settings.MONGODB_DATABASE} (ping {ping_ms:.1f} ms)")
+        
+        if settings.MONGODB_INDEX_MODE == "foreground":
+            await self._prepare_indexes()
+        elif settings.MONGODB_INDEX_MODE == "background":
+            self._index_task = asyncio.create_task(self._prepare_indexes_in_background())
+        elif settings.MONGODB_INDEX_MODE == "skip":
+            logger.info("Index creation skipped (MONGODB_INDEX_MODE=skip)")
+        
+        if self.write_buffer is not None:
+            self.write_buffer.start({"users": self.users, "sessions": self.sessions})
+    
+    async def _prepare_indexes(self) -> None:
+        """Create indexes and make sure every query uses one"""
+        await ensure_indexes(self.db)
+        if settings.QUERY_PLAN_CHECK_ENABLED:
+            await check_query_plans(self.query_shapes())
+    
+    async def _prepare_indexes_in_background(self) -> None:
+        try:
+            await self._prepare_indexes()
+        except Exception as e:
+            logger.error(f"Failed to prepare MongoDB indexes: {str(e)}")
+    
+    def query_shapes(self) -> List[Tuple[str, AsyncIOMotorCursor]]:
+        """One cursor per repository query, with placeholder values, for explain()"""
+        telegram_id = 0
+        return [
+            ("get_user", self.users.find({"telegram_id": telegram_id}).limit(1)),
+            ("get_session", self.sessions.find({"session_id": ""}).limit(1)),
+            ("get_active_session", self.sessions.find({"telegram_id": telegram_id, "completed": False}).limit(1)),
+            # get_session_summaries matches and sorts like get_user_sessions
+            ("get_user_sessions", self.sessions.find(
+                {"telegram_id": telegram_id, "completed": True}
+            ).sort("start_time", -1).limit(10)),
+            ("get_user_data", self.user_data.find({"telegram_id": telegram_id}).limit(1)),
+            ("get_conversation_states", self.conversations.find({"name": ""})),
+            ("iter_campaign_audience", self.users.find(
+                {"education_opt_in": True, "telegram_id": {"$gt": telegram_id}}
+            ).sort("telegram_id", 1)),
+            ("get_campaign_run", self.campaign_runs.find({"run_id": ""}).limit(1)),
+            ("get_delivered_ids", self.deliveries.find({"run_id": "", "telegram_id": {"$gt": telegram_id}})),
+            ("get_pending_alerts", self.alerts.find({"status": "pending"}).sort([("priority", 1), ("created_at", 1)]).limit(1)),
+        ]
     
     async def close(self):
-        """Close MongoDB connection"""
+        """Flush buffered writes and close MongoDB connection"""
+        if self._index_task is not None and not self._index_task.done():
+            self._index_task.cancel()
+            try:
+                await self._index_task
+            except asyncio.CancelledError:
+                pass
+        self._index_task = None
+        if self.write_buffer is not None and self.client:
+            await self.write_buffer.stop()
+            logger.info("Flushed write-behind buffer")
+        if self.user_cache is not None:
+            logger.info(f"User cache stats: {self.user_cache.stats()}")
         if self.client:
             self.client.close()
             self.client = None
+            self.users = None
+            self._connecting = None
             logger.info("Closed MongoDB connection")
     
+    async def flush(self) -> None:
+        """Flush buffered writes, if write-behind is enabled"""
+        if self.write_buffer is not None and self.client:
+            await self.write_buffer.flush()
+    
+    async def _flush_pending(self, collection: str, telegram_id: int) -> None:
+        """Flush buffered writes before a read that would otherwise miss them"""
+        if self.write_buffer is not None and self.write_buffer.has_pending(collection, telegram_id):
+            await self.write_buffer.flush()
+    
     async def get_user(self, telegram_id: int) -> Optional[UserDB]:
         """Get user by Telegram ID"""
+        if self.user_cache is not None:
+            cached_user = self.user_cache.get(telegram_id)
+            if cached_user is not None:
+                return cached_user
+        
         if self.users is None:
             await self.connect()
         
+        await self._flush_pending("users", telegram_id)
         user_data = await self.users.find_one({"telegram_id": telegram_id})
         if user_data:
-            return UserDB.from_dict(user_data)
+            user = UserDB.from_dict(user_data)
+            if self.user_cache is not None:
+                self.user_cache.put(user)
+            return user
         return None
     
     async def create_user(self, user: UserDB) -> UserDB:
@@ -61,7 +407,12 @@ class MongoDBRepository:
             await self.connect()
         
         user_dict = user.to_dict()
-        await self.users.insert_one(user_dict)
+        if self.write_buffer is not None:
+            await self.write_buffer.insert("users", user.telegram_id, user.telegram_id, user_dict)
+        else:
+            await self.users.insert_one(user_dict)
+        if self.user_cache is not None:
+            self.user_cache.put(user)
         logger.info(f"Created new user: {user.telegram_id}")
         return user
     
@@ -71,10 +422,15 @@ class MongoDBRepository:
             await self.connect()
         
         user_dict = user.to_dict()
-        await self.users.update_one(
-            {"telegram_id": user.telegram_id},
-            {"$set": user_dict}
-        )
+        if self.write_buffer is not None:
+            await self.write_buffer.set("users", user.telegram_id, user.telegram_id, user_dict)
+        else:
+            await self.users.update_one(
+                {"telegram_id": user.telegram_id},
+                {"$set": user_dict}
+            )
+        if self.user_cache is not None:
+            self.user_cache.put(user)
         logger.info(f"Updated user: {user.telegram_id}")
         return user
     
@@ -86,11 +442,53 @@ class MongoDBRepository:
         else:
             return await self.create_user(user)
     
+    async def apply_transition(self, telegram_id: int, expected_node: str, next_node: Optional[str],
+                               answer: str, timestamp: str,
+                               fields: Optional[Dict[str, Any]] = None) -> Optional[UserDB]:
+        """Record the answer to ``expected_node`` and move the user to ``next_node`` in one round trip.
+        
+        The update only matches while the user is still at ``expected_node``, so
+        of two taps on the same keyboard only the first one is applied. Returns
+        the updated user, or None when the precondition failed.
+        """
+        if self.users is None:
+            await self.connect()
+        
+        # The precondition must see buffered writes of this user
+        await self._flush_pending("users", telegram_id)
+        user_data = await self.users.find_one_and_update(
+            {"telegram_id": telegram_id, "current_node": expected_node},
+            {"$set": transition_fields(expected_node, next_node, answer, timestamp, fields)},
+            return_document=ReturnDocument.AFTER
+        )
+        if not user_data:
+            # A cached copy may be what made the caller expect this node
+            if self.user_cache is not None:
+                self.user_cache.invalidate(telegram_id)
+            return None
+        user = UserDB.from_dict(user_data)
+        if self.user_cache is not None:
+            self.user_cache.put(user)
+        return user
+    
+    async def get_session(self, session_id: str) -> Optional[UserSession]:
+        """Get a session by its ID"""
+        if self.sessions is None:
+            await self.connect()
+        
+        if self.write_buffer is not None and self.write_buffer.is_pending("sessions", session_id):
+            await self.write_buffer.flush()
+        session_data = await self.sessions.find_one({"session_id": session_id})
+        if session_data:
+            return UserSession.from_dict(session_data)
+        return None
+    
     async def get_active_session(self, telegram_id: int) -> Optional[UserSession]:
         """Get the active (incomplete) session for a user"""
         if self.sessions is None:
             await self.connect()
         
+        await self._flush_pending("sessions", telegram_id)
         session_data = await self.sessions.find_one({
             "telegram_id": telegram_id,
             "completed": False
@@ -105,7 +503,10 @@ class MongoDBRepository:
             await self.connect()
         
         session_dict = session.to_dict()
-        await self.sessions.insert_one(session_dict)
+        if self.write_buffer is not None:
+            await self.write_buffer.insert("sessions", session.session_id, session.telegram_id, session_dict)
+        else:
+            await self.sessions.insert_one(session_dict)
         logger.info(f"Created new session for user: {session.telegram_id}")
         return session
     
@@ -115,18 +516,65 @@ class MongoDBRepository:
             await self.connect()
         
         session_dict = session.to_dict()
-        await self.sessions.update_one(
-            {"session_id": session.session_id},
-            {"$set": session_dict}
-        )
+        if self.write_buffer is not None:
+            await self.write_buffer.set("sessions", session.session_id, session.telegram_id, session_dict)
+        else:
+            await self.sessions.update_one(
+                {"session_id": session.session_id},
+                {"$set": session_dict}
+            )
         logger.info(f"Updated session: {session.session_id}")
         return session
     
+    async def append_session_response(self, session: UserSession, response: NodeResponse) -> None:
+        """Append a single response to a session.
+        
+        Uses ``$push`` on ``responses`` plus ``$set`` on ``end_time`` so the
+        write size does not depend on how many responses the session already has.
+        """
+        if self.sessions is None:
+            await self.connect()
+        
+        response_dict = response.model_dump(exclude_none=True)
+        if self.write_buffer is not None:
+            await self.write_buffer.push(
+                "sessions", session.session_id, session.telegram_id, "responses", [response_dict],
+                fields={"end_time": response.timestamp}
+            )
+        else:
+            await self.sessions.update_one(
+                {"session_id": session.session_id},
+                {
+                    "$push": {"responses": response_dict},
+                    "$set": {"end_time": response.timestamp}
+                }
+            )
+        logger.debug(f"Appended response to session: {session.session_id}")
+    
+    async def complete_session(self, session: UserSession) -> UserSession:
+        """Persist the completion fields of a session without rewriting its responses"""
+        if self.sessions is None:
+            await self.connect()
+        
+        fields = {"completed": session.completed, "end_time": session.end_time}
+        if session.final_message is not None:
+            fields["final_message"] = session.final_message
+        if self.write_buffer is not None:
+            await self.write_buffer.set("sessions", session.session_id, session.telegram_id, fields)
+        else:
+            await self.sessions.update_one(
+                {"session_id": session.session_id},
+                {"$set": fields}
+            )
+        logger.info(f"Completed session: {session.session_id}")
+        return session
+    
     async def get_user_sessions(self, telegram_id: int, limit: int = 10) -> List[UserSession]:
         """Get completed sessions for a user"""
         if self.sessions is None:
             await self.connect()
         
+        await self._flush_pending("sessions", telegram_id)
         cursor = self.sessions.find({
             "telegram_id": telegram_id,
             "completed": True
@@ -135,4 +583,229 @@ class MongoDBRepository:
         sessions = []
         async for doc in cursor:
             sessions.append(UserSession.from_dict(doc))
-        return sessions 
\ No newline at end of file
+        return sessions
+    
+    async def get_session_summaries(self, telegram_id: int, limit: int = 5,
+                                    last_responses: int = 3) -> List[SessionSummary]:
+        """Get summaries of the latest completed sessions of a user.
+        
+        The aggregation returns only the response count, the last few responses
+        without their message text and the duration, so the cost does not grow
+        with the length of each session.
+        """
+        if self.sessions is None:
+            await self.connect()
+        
+        await self._flush_pending("sessions", telegram_id)
+        responses = {"$ifNull": ["$responses", []]}
+        pipeline = [
+            {"$match": {"telegram_id": telegram_id, "completed": True}},
+            {"$sort": {"start_time": -1}},
+            {"$limit": limit},
+            {"$project": {
+                "_id": 0,
+                "session_id": 1,
+                "start_time": 1,
+                "end_time": 1,
+                "session_type": 1,
+                "final_message": 1,
+                "responses_count": {"$size": responses},
+                "last_responses": {"$map": {
+                    "input": {"$slice": [responses, -last_responses]},
+                    "as": "response",
+                    "in": {
+                        "node_id": "$$response.node_id",
+                        "response": "$$response.response",
+                        "timestamp": "$$response.timestamp",
+                    },
+                }},
+                # Null if the timestamps cannot be parsed; SessionSummary then computes it
+                "duration_seconds": {"$divide": [
+                    {"$subtract": [
+                        {"$dateFromString": {"dateString": "$end_time", "onError": None, "onNull": None}},
+                        {"$dateFromString": {"dateString": "$start_time", "onError": None, "onNull": None}},
+                    ]},
+                    1000,
+                ]},
+            }},
+        ]
+        
+        summaries = []
+        async for doc in self.sessions.aggregate(pipeline):
+            summaries.append(SessionSummary.from_dict(doc))
+        return summaries
+    
+    async def get_user_data(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Get the persisted bot user_data of a user"""
+        if self.user_data is None:
+            await self.connect()
+        
+        document = await self.user_data.find_one({"telegram_id": telegram_id}, {"_id": 0, "data": 1})
+        return document["data"] if document else None
+    
+    async def get_conversation_states(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        """Get every persisted state of a ConversationHandler, keyed by conversation key"""
+        if self.conversations is None:
+            await self.connect()
+        
+        cursor = self.conversations.find({"name": name}, {"_id": 0, "key": 1, "state": 1})
+        return {tuple(doc["key"]): doc["state"] async for doc in cursor}
+    
+    async def save_bot_state(self, user_data: Dict[int, Optional[Dict[str, Any]]],
+                             conversations: Dict[Tuple[str, Tuple[Any, ...]], Any]) -> None:
+        """Write user_data and conversation states in one bulk_write per collection.
+        
+        A ``None`` user_data or conversation state deletes the stored document.
+        """
+        if self.user_data is None:
+            await self.connect()
+        
+        if user_data:
+            operations = [
+                DeleteOne({"telegram_id": telegram_id}) if data is None else
+                UpdateOne({"telegram_id": telegram_id}, {"$set": {"data": data}}, upsert=True)
+                for telegram_id, data in user_data.items()
+            ]
+            await self.user_data.bulk_write(operations, ordered=False)
+        if conversations:
+            operations = []
+            for (name, key), state in conversations.items():
+                document_id = f"{name}:{':'.join(str(part) for part in key)}"
+                if state is None:
+                    operations.append(DeleteOne({"_id": document_id}))
+                else:
+                    operations.append(UpdateOne(
+                        {"_id": document_id},
+                        {"$set": {"name": name, "key": list(key), "state": state}},
+                        upsert=True
+                    ))
+            await self.conversations.bulk_write(operations, ordered=False)
+        logger.debug(f"Saved bot state: {len(user_data)} user_data, {len(conversations)} conversations")
+    
+    async def iter_campaign_audience(self, query: Dict[str, Any], after_telegram_id: Optional[int] = None,
+                                     batch_size: int = 200) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream users matching ``query`` in telegram_id order, in batches.
+        
+        Only the fields needed to address a message are fetched. Starting after
+        ``after_telegram_id`` lets an interrupted campaign resume where it stopped.
+        """
+        if self.users is None:
+            await self.connect()
+        
+        if after_telegram_id is not None:
+            query = {**query, "telegram_id": {"$gt": after_telegram_id}}
+        cursor = self.users.find(
+            query, {"_id": 0, "telegram_id": 1, "first_name": 1}
+        ).sort("telegram_id", 1).batch_size(batch_size)
+        
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    async def get_campaign_run(self, run_id: str) -> Optional[CampaignRun]:
+        """Get a campaign run by its ID"""
+        if self.campaign_runs is None:
+            await self.connect()
+        
+        run_data = await self.campaign_runs.find_one({"run_id": run_id}, {"_id": 0})
+        if run_data:
+            return CampaignRun.from_dict(run_data)
+        return None
+    
+    async def save_campaign_run(self, run: CampaignRun) -> CampaignRun:
+        """Create or update the checkpoint of a campaign run"""
+        if self.campaign_runs is None:
+            await self.connect()
+        
+        await self.campaign_runs.update_one({"run_id": run.run_id}, {"$set": run.to_dict()}, upsert=True)
+        return run
+    
+    async def get_delivered_ids(self, run_id: str, after_telegram_id: Optional[int] = None) -> Set[int]:
+        """IDs of users a run already recorded a delivery for, after a checkpoint"""
+        if self.deliveries is None:
+            await self.connect()
+        
+        query: Dict[str, Any] = {"run_id": run_id}
+        if after_telegram_id is not None:
+            query["telegram_id"] = {"$gt": after_telegram_id}
+        cursor = self.deliveries.find(query, {"_id": 0, "telegram_id": 1})
+        return {doc["telegram_id"] async for doc in cursor}
+    
+    async def record_deliveries(self, deliveries: List[Delivery]) -> None:
+        """Insert delivery results in one unordered batch; already recorded ones are skipped"""
+        if not deliveries:
+            return
+        if self.deliveries is None:
+            await self.connect()
+        
+        try:
+            await self.deliveries.insert_many([delivery.to_dict() for delivery in deliveries], ordered=False)
+        except BulkWriteError as e:
+            duplicates = [error for error in e.details.get("writeErrors", []) if error.get("code") == 11000]
+            if len(duplicates) != len(e.details.get("writeErrors", [])):
+                raise
+            logger.debug(f"Skipped {len(duplicates)} deliveries already recorded")
+    
+    async def enqueue_alert(self, alert: Alert, dedup_window: float = 0) -> bool:
+        """Store a pending alert for clinical staff, acknowledged by a majority and journaled.
+        
+        With a ``dedup_window``, triggers of the same kind for the user within
+        one window share a ``dedup_key`` (see ``dedup_key``). A unique index on
+        it makes every trigger after the first only increment ``triggers``, even
+        when several workers raise the alert at once. Returns whether a new
+        alert was stored.
+        """
+        if self.alerts is None:
+            await self.connect()
+        
+        # Alerts never go through the write-behind buffer
+        alerts = self.alerts.with_options(write_concern=WriteConcern(w="majority", j=True))
+        if not dedup_window:
+            await alerts.insert_one(alert.to_dict())
+            logger.info(f"Queued {alert.kind} alert for user {alert.telegram_id}")
+            return True
+        
+        alert.dedup_key = dedup_key(alert, dedup_window)
+        document = alert.to_dict()
+        document.pop("triggers")
+        upsert = functools.partial(
+            alerts.update_one,
+            {"dedup_key": alert.dedup_key},
+            {"$setOnInsert": document, "$inc": {"triggers": 1}},
+            upsert=True
+        )
+        try:
+            result = await upsert()
+        except DuplicateKeyError:
+            # A concurrent upsert inserted the alert first; this one now matches it
+            result = await upsert()
+        if result.upserted_id is None:
+            logger.info(f"Repeated {alert.kind} alert for user {alert.telegram_id} merged into a recent one")
+            return False
+        logger.info(f"Queued {alert.kind} alert for user {alert.telegram_id}")
+        return True
+    
+    async def get_pending_alerts(self, limit: int = 50) -> List[Alert]:
+        """Alerts not delivered yet, most urgent and oldest first"""
+        if self.alerts is None:
+            await self.connect()
+        
+        cursor = self.alerts.find({"status": "pending"}).sort([("priority", 1), ("created_at", 1)]).limit(limit)
+        return [Alert.from_dict(document) async for document in cursor]
+    
+    async def mark_alerts_sent(self, alert_ids: List[str], sent_at: str) -> None:
+        """Mark alerts as delivered to staff"""
+        if not alert_ids:
+            return
+        if self.alerts is None:
+            await self.connect()
+        
+        await self.alerts.update_many(
+            {"alert_id": {"$in": alert_ids}},
+            {"$set": {"status": "sent", "sent_at": sent_at}}
+        )
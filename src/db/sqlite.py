@@ -0,0 +1,464 @@
+import asyncio
+import functools
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Set, Tuple, AsyncIterator, Callable
+
+from loguru import logger
+
+from src.metrics.registry import instrument_methods
+from .base import dedup_key, transition_fields
+from .models import UserDB, UserSession, NodeResponse, SessionSummary, CampaignRun, Delivery, Alert
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_education_opt_in
+    ON users (json_extract(document, '$.education_opt_in'), telegram_id);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    telegram_id INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    start_time TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (telegram_id, completed, start_time);
+CREATE TABLE IF NOT EXISTS user_data (
+    telegram_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS campaign_runs (
+    run_id TEXT PRIMARY KEY,
+    document TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS deliveries (
+    run_id TEXT NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    document TEXT NOT NULL,
+    PRIMARY KEY (run_id, telegram_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alerts (
+    alert_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_pending ON alerts (status, priority, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS alerts_dedup ON alerts (json_extract(document, '$.dedup_key'))
+    WHERE json_extract(document, '$.dedup_key') IS NOT NULL;
+"""
+
+# Audience filters become json_extract() paths, so only plain field names are accepted
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+@instrument_methods
+class SQLiteRepository:
+    """Repository in a local SQLite database, for single-node deployments.
+    
+    Documents are stored as JSON next to the columns queries filter on. One
+    connection in WAL mode is owned by a single thread, so statements run in
+    order and never block the event loop. Writes are committed in batches,
+    every ``commit_interval`` seconds or after ``commit_batch_size`` writes,
+    instead of one fsync per update; reads on the same connection already see
+    them. A crash loses at most the writes of the last interval.
+    """
+    
+    def __init__(self, path: str, commit_interval: float = 0.5, commit_batch_size: int = 500):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_batch_size = commit_batch_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._uncommitted = 0
+        self._commit_task: Optional[asyncio.Task] = None
+    
+    async def _run(self, function: Callable, *args) -> Any:
+        if self._connection is None:
+            await self.connect()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args))
+    
+    # The methods below run on the database thread
+    
+    def _open(self) -> sqlite3.Connection:
+        # Transactions are managed explicitly so several writes share one commit
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+    
+    def _fetchone(self, sql: str, params: Tuple[Any, ...] = ()) -> Optional[Tuple[Any, ...]]:
+        return self._connection.execute(sql, params).fetchone()
+    
+    def _fetchall(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        return self._connection.execute(sql, params).fetchall()
+    
+    def _write(self, statements: List[Tuple[str, Tuple[Any, ...]]]) -> List[Tuple[Any, ...]]:
+        """Apply ``statements`` and return the rows of the last one (e.g. from RETURNING)"""
+        if not self._connection.in_transaction:
+            self._connection.execute("BEGIN")
+        # The statements of one call are applied together or not at all
+        self._connection.execute("SAVEPOINT write")
+        rows: List[Tuple[Any, ...]] = []
+        try:
+            for sql, params in statements:
+                rows = self._connection.execute(sql, params).fetchall()
+        except BaseException:
+            self._connection.execute("ROLLBACK TO write")
+            raise
+        finally:
+            self._connection.execute("RELEASE write")
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_batch_size:
+            self._commit()
+        return rows
+    
+    def _commit(self) -> None:
+        if self._connection is not None and self._connection.in_transaction:
+            self._connection.execute("COMMIT")
+        self._uncommitted = 0
+    
+    # Event loop side
+    
+    async def _execute(self, *statements: Tuple[str, Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        return await self._run(self._write, list(statements))
+    
+    async def _commit_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            try:
+                await self._run(self._commit)
+            except Exception as e:
+                logger.error(f"SQLite commit failed: {str(e)}")
+    
+    async def connect(self):
+        """Open the database and create the schema"""
+        if self._connection is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+            loop = asyncio.get_running_loop()
+            self._connection = await loop.run_in_executor(self._executor, self._open)
+            self._commit_task = asyncio.create_task(self._commit_periodically())
+            logger.info(f"Connected to SQLite: {self.path}")
+    
+    async def flush(self) -> None:
+        """Commit every pending write"""
+        if self._connection is not None:
+            await self._run(self._commit)
+    
+    async def close(self):
+        """Commit pending writes and close the database"""
+        if self._connection is None:
+            return
+        if self._commit_task is not None:
+            self._commit_task.cancel()
+            try:
+                await self._commit_task
+            except asyncio.CancelledError:
+                pass
+            self._commit_task = None
+        await self.flush()
+        await self._run(self._connection.close)
+        self._executor.shutdown()
+        self._connection = None
+        self._executor = None
+        logger.info("SQLite connection closed")
+    
+    async def get_user(self, telegram_id: int) -> Optional[UserDB]:
+        """Get user by Telegram ID"""
+        row = await self._run(self._fetchone, "SELECT document FROM users WHERE telegram_id = ?", (telegram_id,))
+        return UserDB.from_dict(json.loads(row[0])) if row else None
+    
+    async def create_user(self, user: UserDB) -> UserDB:
+        """Create a new user"""
+        await self._execute((
+            "INSERT INTO users (telegram_id, document) VALUES (?, ?)",
+            (user.telegram_id, json.dumps(user.to_dict()))
+        ))
+        logger.info(f"Created new user: {user.telegram_id}")
+        return user
+    
+    async def update_user(self, user: UserDB) -> UserDB:
+        """Update an existing user"""
+        await self._execute((
+            "UPDATE users SET document = ? WHERE telegram_id = ?",
+            (json.dumps(user.to_dict()), user.telegram_id)
+        ))
+        logger.info(f"Updated user: {user.telegram_id}")
+        return user
+    
+    async def save_user(self, user: UserDB) -> UserDB:
+        """Create or update user"""
+        await self._execute((
+            "INSERT INTO users (telegram_id, document) VALUES (?, ?) "
+            "ON CONFLICT (telegram_id) DO UPDATE SET document = excluded.document",
+            (user.telegram_id, json.dumps(user.to_dict()))
+        ))
+        return user
+    
+    async def apply_transition(self, telegram_id: int, expected_node: str, next_node: Optional[str],
+                               answer: str, timestamp: str,
+                               fields: Optional[Dict[str, Any]] = None) -> Optional[UserDB]:
+        """Record the answer to ``expected_node`` and move to ``next_node`` in one conditional UPDATE"""
+        update = transition_fields(expected_node, next_node, answer, timestamp, fields)
+        params: List[Any] = []
+        for path, value in update.items():
+            # Quoted labels, so node ids are never read as JSON path syntax
+            params.append("$." + ".".join(json.dumps(part) for part in path.split(".")))
+            params.append(json.dumps(value))
+        assignments = ", ".join(["?, json(?)"] * len(update))
+        rows = await self._execute((
+            f"UPDATE users SET document = json_set(document, {assignments}) "
+            "WHERE telegram_id = ? AND json_extract(document, '$.current_node') = ? RETURNING document",
+            (*params, telegram_id, expected_node)
+        ))
+        return UserDB.from_dict(json.loads(rows[0][0])) if rows else None
+    
+    async def get_session(self, session_id: str) -> Optional[UserSession]:
+        """Get a session by its ID"""
+        row = await self._run(self._fetchone, "SELECT document FROM sessions WHERE session_id = ?", (session_id,))
+        return UserSession.from_dict(json.loads(row[0])) if row else None
+    
+    async def get_active_session(self, telegram_id: int) -> Optional[UserSession]:
+        """Get the active (incomplete) session for a user"""
+        row = await self._run(
+            self._fetchone,
+            "SELECT document FROM sessions WHERE telegram_id = ? AND completed = 0 LIMIT 1",
+            (telegram_id,)
+        )
+        return UserSession.from_dict(json.loads(row[0])) if row else None
+    
+    @staticmethod
+    def _session_row(session: UserSession) -> Tuple[Any, ...]:
+        return (session.session_id, session.telegram_id, int(session.completed), session.start_time,
+                json.dumps(session.to_dict()))
+    
+    async def create_session(self, session: UserSession) -> UserSession:
+        """Create a new session"""
+        await self._execute((
+            "INSERT INTO sessions (session_id, telegram_id, completed, start_time, document) VALUES (?, ?, ?, ?, ?)",
+            self._session_row(session)
+        ))
+        logger.info(f"Created new session for user: {session.telegram_id}")
+        return session
+    
+    async def update_session(self, session: UserSession) -> UserSession:
+        """Update an existing session"""
+        session_id, telegram_id, completed, start_time, document = self._session_row(session)
+        await self._execute((
+            "UPDATE sessions SET completed = ?, start_time = ?, document = ? WHERE session_id = ?",
+            (completed, start_time, document, session_id)
+        ))
+        logger.info(f"Updated session: {session.session_id}")
+        return session
+    
+    async def append_session_response(self, session: UserSession, response: NodeResponse) -> None:
+        """Append a single response to a session, editing the stored JSON in place"""
+        await self._execute((
+            "UPDATE sessions SET document = json_set(json_insert(document, '$.responses[#]', json(?)), "
+            "'$.end_time', ?) WHERE session_id = ?",
+            (json.dumps(response.model_dump(exclude_none=True)), response.timestamp, session.session_id)
+        ))
+        logger.debug(f"Appended response to session: {session.session_id}")
+    
+    async def complete_session(self, session: UserSession) -> UserSession:
+        """Persist the completion fields of a session without rewriting its responses"""
+        paths = "'$.completed', json(?), '$.end_time', ?"
+        params: List[Any] = [json.dumps(session.completed), session.end_time]
+        if session.final_message is not None:
+            paths += ", '$.final_message', ?"
+            params.append(session.final_message)
+        await self._execute((
+            f"UPDATE sessions SET completed = ?, document = json_set(document, {paths}) WHERE session_id = ?",
+            (int(session.completed), *params, session.session_id)
+        ))
+        logger.info(f"Completed session: {session.session_id}")
+        return session
+    
+    async def _completed_sessions(self, telegram_id: int, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._run(
+            self._fetchall,
+            "SELECT document FROM sessions WHERE telegram_id = ? AND completed = 1 ORDER BY start_time DESC LIMIT ?",
+            (telegram_id, limit)
+        )
+        return [json.loads(row[0]) for row in rows]
+    
+    async def get_user_sessions(self, telegram_id: int, limit: int = 10) -> List[UserSession]:
+        """Get completed sessions for a user"""
+        return [UserSession.from_dict(document) for document in await self._completed_sessions(telegram_id, limit)]
+    
+    async def get_session_summaries(self, telegram_id: int, limit: int = 5,
+                                    last_responses: int = 3) -> List[SessionSummary]:
+        """Get summaries of the latest completed sessions of a user"""
+        return [
+            SessionSummary.from_session(document, last_responses)
+            for document in await self._completed_sessions(telegram_id, limit)
+        ]
+    
+    async def get_user_data(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Get the persisted bot user_data of a user"""
+        row = await self._run(self._fetchone, "SELECT data FROM user_data WHERE telegram_id = ?", (telegram_id,))
+        return json.loads(row[0]) if row else None
+    
+    async def get_conversation_states(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        """Get every persisted state of a ConversationHandler, keyed by conversation key"""
+        rows = await self._run(self._fetchall, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+    
+    async def save_bot_state(self, user_data: Dict[int, Optional[Dict[str, Any]]],
+                             conversations: Dict[Tuple[str, Tuple[Any, ...]], Any]) -> None:
+        """Write user_data and conversation states in one transaction.
+        
+        A ``None`` user_data or conversation state deletes the stored row.
+        """
+        statements = []
+        for telegram_id, data in user_data.items():
+            if data is None:
+                statements.append(("DELETE FROM user_data WHERE telegram_id = ?", (telegram_id,)))
+            else:
+                statements.append((
+                    "INSERT INTO user_data (telegram_id, data) VALUES (?, ?) "
+                    "ON CONFLICT (telegram_id) DO UPDATE SET data = excluded.data",
+                    (telegram_id, json.dumps(data))
+                ))
+        for (name, key), state in conversations.items():
+            if state is None:
+                statements.append(("DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(list(key)))))
+            else:
+                statements.append((
+                    "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, key) DO UPDATE SET state = excluded.state",
+                    (name, json.dumps(list(key)), json.dumps(state))
+                ))
+        if statements:
+            await self._execute(*statements)
+        logger.debug(f"Saved bot state: {len(user_data)} user_data, {len(conversations)} conversations")
+    
+    async def iter_campaign_audience(self, query: Dict[str, Any], after_telegram_id: Optional[int] = None,
+                                     batch_size: int = 200) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream users matching ``query`` in telegram_id order, in batches.
+        
+        Each batch is a separate keyset query, so no cursor stays open on the
+        database thread between batches.
+        """
+        conditions, params = [], []
+        for field, value in query.items():
+            if not FIELD_NAME.match(field):
+                raise ValueError(f"Unsupported audience field: {field}")
+            conditions.append(f"json_extract(document, '$.{field}') = ?")
+            params.append(value)
+        conditions.append("telegram_id > ?")
+        sql = (
+            f"SELECT telegram_id, json_extract(document, '$.first_name') FROM users "
+            f"WHERE {' AND '.join(conditions)} ORDER BY telegram_id LIMIT ?"
+        )
+        
+        last_telegram_id = after_telegram_id if after_telegram_id is not None else -2**63
+        while True:
+            rows = await self._run(self._fetchall, sql, (*params, last_telegram_id, batch_size))
+            if not rows:
+                return
+            yield [{"telegram_id": telegram_id, "first_name": first_name} for telegram_id, first_name in rows]
+            last_telegram_id = rows[-1][0]
+    
+    async def get_campaign_run(self, run_id: str) -> Optional[CampaignRun]:
+        """Get a campaign run by its ID"""
+        row = await self._run(self._fetchone, "SELECT document FROM campaign_runs WHERE run_id = ?", (run_id,))
+        return CampaignRun.from_dict(json.loads(row[0])) if row else None
+    
+    async def save_campaign_run(self, run: CampaignRun) -> CampaignRun:
+        """Create or update the checkpoint of a campaign run"""
+        await self._execute((
+            "INSERT INTO campaign_runs (run_id, document) VALUES (?, ?) "
+            "ON CONFLICT (run_id) DO UPDATE SET document = excluded.document",
+            (run.run_id, json.dumps(run.to_dict()))
+        ))
+        # A checkpoint is only useful if it survives a crash
+        await self.flush()
+        return run
+    
+    async def get_delivered_ids(self, run_id: str, after_telegram_id: Optional[int] = None) -> Set[int]:
+        """IDs of users a run already recorded a delivery for, after a checkpoint"""
+        rows = await self._run(
+            self._fetchall,
+            "SELECT telegram_id FROM deliveries WHERE run_id = ? AND telegram_id > ?",
+            (run_id, after_telegram_id if after_telegram_id is not None else -2**63)
+        )
+        return {row[0] for row in rows}
+    
+    async def record_deliveries(self, deliveries: List[Delivery]) -> None:
+        """Insert delivery results in one transaction; already recorded ones are skipped"""
+        if not deliveries:
+            return
+        await self._execute(*(
+            (
+                "INSERT OR IGNORE INTO deliveries (run_id, telegram_id, document) VALUES (?, ?, ?)",
+                (delivery.run_id, delivery.telegram_id, json.dumps(delivery.to_dict()))
+            )
+            for delivery in deliveries
+        ))
+    
+    async def enqueue_alert(self, alert: Alert, dedup_window: float = 0) -> bool:
+        """Store a pending alert, or count it on the alert with the same dedup key.
+        
+        Committed before returning; returns False when the trigger was merged.
+        """
+        insert = "INSERT INTO alerts (alert_id, status, priority, created_at, document) VALUES (?, ?, ?, ?, ?)"
+        merged = []
+        if dedup_window:
+            alert.dedup_key = dedup_key(alert, dedup_window)
+            # Both statements run in one batch on the writer thread; the unique index on
+            # dedup_key leaves the insert undone when the alert already exists
+            merged = await self._execute(
+                (
+                    insert + " ON CONFLICT DO NOTHING",
+                    (alert.alert_id, alert.status, alert.priority, alert.created_at, json.dumps(alert.to_dict()))
+                ),
+                (
+                    "UPDATE alerts SET document = json_set(document, '$.triggers', "
+                    "json_extract(document, '$.triggers') + 1) "
+                    "WHERE json_extract(document, '$.dedup_key') = ? AND alert_id != ? RETURNING alert_id",
+                    (alert.dedup_key, alert.alert_id)
+                ),
+            )
+        else:
+            await self._execute(
+                (insert, (alert.alert_id, alert.status, alert.priority, alert.created_at, json.dumps(alert.to_dict())))
+            )
+        # An alert must not be lost in a crash before the next batched commit
+        await self.flush()
+        return not merged
+    
+    async def get_pending_alerts(self, limit: int = 50) -> List[Alert]:
+        """Alerts not delivered yet, most urgent and oldest first"""
+        rows = await self._run(
+            self._fetchall,
+            "SELECT document FROM alerts WHERE status = 'pending' ORDER BY priority, created_at LIMIT ?",
+            (limit,)
+        )
+        return [Alert.from_dict(json.loads(row[0])) for row in rows]
+    
+    async def mark_alerts_sent(self, alert_ids: List[str], sent_at: str) -> None:
+        """Mark alerts as delivered to staff"""
+        if not alert_ids:
+            return
+        await self._execute(*(
+            (
+                "UPDATE alerts SET status = 'sent', "
+                "document = json_set(document, '$.status', 'sent', '$.sent_at', ?) WHERE alert_id = ?",
+                (sent_at, alert_id)
+            )
+            for alert_id in alert_ids
+        ))
+        await self.flush()
@@ -0,0 +1,333 @@
+"""Offline benchmark of the bot's update handlers with synthetic patients.
+
+The real handlers of src.main run in-process against an in-memory (or a
+temporary SQLite) repository and a fake Bot, with no network or MongoDB:
+
+    python -m src.harness.benchmark --patients 200 --rounds 3 --output bench.json
+
+Each patient sends /start and taps a random button of every keyboard until the
+conversation ends, sometimes interrupting with EMPEORÉ. A conversation that
+ends without reaching the education opt-in question, or an answer to it that
+is not stored as the patient's ``education_opt_in``, counts as an error. The
+JSON report has throughput, latency percentiles and repository calls per
+update, overall and per handler. Compare a run against an earlier one with:
+
+    python -m src.harness.benchmark --patients 200 --rounds 3 --baseline bench.json
+
+which exits with status 1 when a metric regressed more than --max-regression.
+"""
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Any, Callable
+
+from loguru import logger
+from telegram import CallbackQuery, Chat, InlineKeyboardMarkup, Message, Update, User
+
+from src import main as bot_main
+from src.db.memory import InMemoryRepository
+from src.db.sqlite import SQLiteRepository
+from src.messaging.outbound import OutboundQueue
+from src.messaging.ratelimit import RateLimiter
+
+# Rates high enough that the outbound queue never holds a message back
+UNLIMITED = 1e9
+
+# Repository calls made by the update being handled
+_db_ops: ContextVar[Optional[List[int]]] = ContextVar("benchmark_db_ops", default=None)
+
+class BenchmarkBot:
+    """Stand-in for the Bot methods the handlers call, remembering each chat's last keyboard"""
+    
+    def __init__(self):
+        self.sent = 0
+        self.last_keyboard: Dict[int, Message] = {}
+        self._message_ids = itertools.count(1)
+    
+    async def send_message(self, chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                           **kwargs) -> Message:
+        self.sent += 1
+        message = Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type=Chat.PRIVATE),
+            text=text,
+            reply_markup=reply_markup,
+        )
+        message.set_bot(self)
+        # Messages without buttons, like the /empeore reminder, leave the previous keyboard usable
+        if reply_markup is not None:
+            self.last_keyboard[chat_id] = message
+        return message
+    
+    async def answer_callback_query(self, callback_query_id: str, text: Optional[str] = None, **kwargs) -> bool:
+        return True
+
+class CountingRepository:
+    """Proxy counting repository calls per update, with an optional simulated round trip"""
+    
+    def __init__(self, repository: Any, latency: float = 0.0):
+        self.repository = repository
+        self.latency = latency
+    
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.repository, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+        
+        async def call(*args, **kwargs):
+            ops = _db_ops.get()
+            if ops is not None:
+                ops[0] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await attribute(*args, **kwargs)
+        
+        return call
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted ``values``"""
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+class HandlerBenchmark:
+    """Drives synthetic patients through the conversation by calling the handlers directly"""
+    
+    def __init__(self, bot: BenchmarkBot, empeore_rate: float = 0.1, max_steps: int = 50):
+        self.bot = bot
+        self.empeore_rate = empeore_rate
+        self.max_steps = max_steps
+        self.samples: Dict[str, List[float]] = {}
+        self.db_ops: Dict[str, int] = {}
+        self.errors = 0
+        self._update_ids = itertools.count(1)
+    
+    def _user(self, user_id: int) -> User:
+        return User(id=user_id, is_bot=False, first_name=f"Paciente {user_id}")
+    
+    def _message_update(self, user_id: int, text: str) -> Update:
+        message = Message(
+            message_id=next(self._update_ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type=Chat.PRIVATE),
+            from_user=self._user(user_id),
+            text=text,
+        )
+        message.set_bot(self.bot)
+        return Update(update_id=next(self._update_ids), message=message)
+    
+    def _callback_update(self, user_id: int, message: Message, callback_data: str) -> Update:
+        query = CallbackQuery(
+            id=str(next(self._update_ids)),
+            from_user=self._user(user_id),
+            chat_instance=str(user_id),
+            data=callback_data,
+            message=message,
+        )
+        query.set_bot(self.bot)
+        return Update(update_id=next(self._update_ids), callback_query=query)
+    
+    async def _handle(self, handler: Callable, update: Update, context: SimpleNamespace) -> None:
+        ops = [0]
+        token = _db_ops.set(ops)
+        started = time.perf_counter()
+        try:
+            await handler(update, context)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"{handler.__name__} failed: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            _db_ops.reset(token)
+        self.samples.setdefault(handler.__name__, []).append(elapsed)
+        self.db_ops[handler.__name__] = self.db_ops.get(handler.__name__, 0) + ops[0]
+    
+    async def _check_opt_in(self, user_id: int, expected: bool) -> None:
+        """The education campaign's audience depends on the answer at the opt-in question being stored"""
+        user = await bot_main.db_repository.get_user(user_id)
+        if user is None or user.education_opt_in != expected:
+            self.errors += 1
+            logger.error(f"education_opt_in of patient {user_id} is not {expected} after answering the opt-in question")
+    
+    async def run_patient(self, user_id: int, rounds: int) -> None:
+        # Handlers only use user_data from the context
+        context = SimpleNamespace(user_data={})
+        for _ in range(rounds):
+            await self._handle(bot_main.start, self._message_update(user_id, "/start"), context)
+            # Nodes whose buttons the patient pressed in this conversation
+            answered = set()
+            interrupted = False
+            pressed = None
+            for _ in range(self.max_steps):
+                # The conversation ended, or a press was rejected, when no new keyboard was sent
+                message = self.bot.last_keyboard.get(user_id)
+                if message is None or message is pressed:
+                    break
+                pressed = message
+                keyboard = message.reply_markup.inline_keyboard
+                if random.random() < self.empeore_rate:
+                    await self._handle(bot_main.handle_message, self._message_update(user_id, "EMPEORÉ"), context)
+                    interrupted = True
+                    break
+                button = random.choice([button for row in keyboard for button in row])
+                choice = bot_main.conversation_manager.graph.routes.get(button.callback_data)
+                if choice is not None:
+                    answered.add(choice.node_id)
+                await self._handle(bot_main.handle_callback, self._callback_update(user_id, message, button.callback_data),
+                                   context)
+                if choice is not None and choice.node_id == bot_main.EDUCATION_OPT_IN_NODE:
+                    await self._check_opt_in(user_id, choice.next == bot_main.EDUCATION_OPT_IN_NEXT)
+            # Every path through the conversation passes the opt-in question unless EMPEORÉ cut it short
+            if not interrupted and bot_main.EDUCATION_OPT_IN_NODE not in answered:
+                self.errors += 1
+                logger.error(f"Conversation of patient {user_id} ended without reaching {bot_main.EDUCATION_OPT_IN_NODE}")
+        await self._handle(bot_main.history_command, self._message_update(user_id, "/historial"), context)
+    
+    async def run(self, patients: int, rounds: int, first_user_id: int = 10_000) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.run_patient(user_id, rounds)
+            for user_id in range(first_user_id, first_user_id + patients)
+        ))
+        return time.perf_counter() - started
+    
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        def summary(latencies: List[float], db_ops: int) -> Dict[str, Any]:
+            latencies = sorted(latencies)
+            return {
+                "updates": len(latencies),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+                "db_ops_per_update": round(db_ops / len(latencies), 2) if latencies else 0.0,
+            }
+        
+        everything = [latency for latencies in self.samples.values() for latency in latencies]
+        report = summary(everything, sum(self.db_ops.values()))
+        report.update({
+            "elapsed_s": round(elapsed, 3),
+            "updates_per_s": round(len(everything) / elapsed, 1) if elapsed else 0.0,
+            "messages_sent": self.bot.sent,
+            "errors": self.errors,
+            "handlers": {
+                name: summary(latencies, self.db_ops[name])
+                for name, latencies in sorted(self.samples.items())
+            },
+        })
+        return report
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {
+    "updates_per_s": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "db_ops_per_update": False,
+}
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Describe the metrics that regressed more than ``max_regression`` (a fraction)"""
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline["results"].get(metric), report["results"][metric]
+        if not old:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > max_regression:
+            regressions.append(f"{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    random.seed(args.seed)
+    bot = BenchmarkBot()
+    
+    # Give the handlers offline stand-ins for the repository and the Bot
+    temporary_directory = tempfile.TemporaryDirectory()
+    if args.backend == "sqlite":
+        repository = SQLiteRepository(os.path.join(temporary_directory.name, "benchmark.db"))
+    else:
+        repository = InMemoryRepository()
+    await repository.connect()
+    bot_main.init_services(
+        repository=CountingRepository(repository, latency=args.db_latency_ms / 1000),
+        outbound=OutboundQueue(
+            RateLimiter(global_rate=UNLIMITED, per_chat_rate=UNLIMITED, per_chat_burst=UNLIMITED),
+            concurrency=args.patients
+        )
+    )
+    bot_main.outbox.start(bot)
+    try:
+        benchmark = HandlerBenchmark(bot, empeore_rate=args.empeore_rate)
+        elapsed = await benchmark.run(args.patients, args.rounds)
+    finally:
+        await bot_main.outbox.stop()
+        await repository.close()
+        temporary_directory.cleanup()
+    
+    return {
+        "benchmark": "handlers",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            "patients": args.patients,
+            "rounds": args.rounds,
+            "backend": args.backend,
+            "empeore_rate": args.empeore_rate,
+            "db_latency_ms": args.db_latency_ms,
+            "seed": args.seed,
+        },
+        "results": benchmark.report(elapsed),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the update handlers with synthetic patients")
+    parser.add_argument("--patients", type=int, default=100, help="number of concurrent synthetic patients")
+    parser.add_argument("--rounds", type=int, default=3, help="conversations per patient")
+    parser.add_argument("--empeore-rate", type=float, default=0.1, help="chance of EMPEORÉ instead of each button press")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory", help="repository to run against")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip per repository call")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the patients' choices")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    parser.add_argument("--baseline", default=None, help="JSON report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed regression against the baseline")
+    args = parser.parse_args()
+    
+    # Handler logging would dominate the measurements
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        for regression in regressions:
+            logger.warning(f"Regression against {baseline.get('commit') or args.baseline}: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Fake Telegram Bot API and webhook load driver for offline load tests.
+
+Start the bot in webhook mode against the fake API:
+
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot BOT_MODE=webhook \\
+    WEBHOOK_URL=http://127.0.0.1:8443/telegram WEBHOOK_SECRET_TOKEN=harness \\
+    python -m src.main
+
+then drive it with synthetic patients:
+
+    python -m src.harness.fake_telegram --users 200 --rounds 5 --secret-token harness
+
+Every patient sends /start and then taps a random button of each keyboard the
+bot answers with. The driver measures the time from posting an update to the
+bot's first reply in that chat.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+from typing import Optional, List, Dict, Any
+
+import httpx
+from loguru import logger
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as TornadoApplication, RequestHandler
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "CardioVID", "username": "CardioVID_Bot"}
+
+class FakeTelegramAPI:
+    """In-memory stand-in for the Bot API methods the bot calls"""
+    
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.stale_answers = 0
+        self._message_ids = itertools.count(1)
+        self._waiters: Dict[int, asyncio.Future] = {}
+    
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        """Future resolved with the next message the bot sends to a chat"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = future
+        return future
+    
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "sendMessage":
+            return self._send_message(params)
+        if method == "answerCallbackQuery" and params.get("text"):
+            self.stale_answers += 1
+        return True
+    
+    def _send_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        reply_markup = params.get("reply_markup")
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        waiter = self._waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(message)
+        return message
+
+class BotMethodHandler(RequestHandler):
+    def initialize(self, api: FakeTelegramAPI):
+        self.api = api
+    
+    def post(self, token: str, method: str):
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(self.request.body or b"{}")
+        else:
+            params = {name: self.get_body_argument(name) for name in self.request.body_arguments}
+        self.write({"ok": True, "result": self.api.handle(method, params)})
+
+def create_fake_api_server(api: FakeTelegramAPI, port: int, address: str = "127.0.0.1") -> HTTPServer:
+    """Serve the fake Bot API at http://<address>:<port>/bot<token>/<method>"""
+    app = TornadoApplication([(r"/bot([^/]+)/(\w+)", BotMethodHandler, {"api": api})])
+    server = HTTPServer(app)
+    server.listen(port, address)
+    return server
+
+class WebhookLoadDriver:
+    """Posts synthetic patient updates to the bot's webhook and times the replies"""
+    
+    def __init__(self, api: FakeTelegramAPI, webhook_url: str, secret_token: Optional[str] = None,
+                 concurrency: int = 100, reply_timeout: float = 10.0):
+        self.api = api
+        self.webhook_url = webhook_url
+        self.secret_token = secret_token
+        self.reply_timeout = reply_timeout
+        self.latencies: List[float] = []
+        self.timeouts = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._update_ids = itertools.count(1)
+    
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"Paciente{user_id}"}
+    
+    def _command_update(self, user_id: int, text: str) -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+            },
+        }
+    
+    def _callback_update(self, user_id: int, message: Dict[str, Any], callback_data: str) -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "message": message,
+                "data": callback_data,
+            },
+        }
+    
+    async def _post(self, client: httpx.AsyncClient, user_id: int, update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Post an update and wait for the bot's reply in the same chat"""
+        headers = {}
+        if self.secret_token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.secret_token
+        reply = self.api.expect_reply(user_id)
+        started = time.perf_counter()
+        async with self._semaphore:
+            response = await client.post(self.webhook_url, json=update, headers=headers)
+            response.raise_for_status()
+        try:
+            message = await asyncio.wait_for(reply, self.reply_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        self.latencies.append(time.perf_counter() - started)
+        return message
+    
+    async def run_patient(self, client: httpx.AsyncClient, user_id: int, rounds: int) -> None:
+        message = await self._post(client, user_id, self._command_update(user_id, "/start"))
+        for _ in range(rounds):
+            keyboard = (message or {}).get("reply_markup", {}).get("inline_keyboard")
+            if not keyboard:
+                message = await self._post(client, user_id, self._command_update(user_id, "/start"))
+                continue
+            button = random.choice([button for row in keyboard for button in row])
+            message = await self._post(client, user_id, self._callback_update(user_id, message, button["callback_data"]))
+    
+    async def run(self, users: int, rounds: int, first_user_id: int = 10_000) -> Dict[str, Any]:
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=self.reply_timeout) as client:
+            await asyncio.gather(*(
+                self.run_patient(client, user_id, rounds)
+                for user_id in range(first_user_id, first_user_id + users)
+            ))
+        return self.report(time.perf_counter() - started)
+    
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        
+        def percentile(q: float) -> float:
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+        
+        return {
+            "updates": len(latencies) + self.timeouts,
+            "replies": len(latencies),
+            "timeouts": self.timeouts,
+            "stale_buttons": self.api.stale_answers,
+            "elapsed_s": round(elapsed, 3),
+            "updates_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(0.50), 1),
+            "p95_ms": round(percentile(0.95), 1),
+            "p99_ms": round(percentile(0.99), 1),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        }
+
+async def run_harness(args: argparse.Namespace) -> Dict[str, Any]:
+    api = FakeTelegramAPI()
+    server = create_fake_api_server(api, args.api_port)
+    logger.info(f"Fake Bot API listening on http://127.0.0.1:{args.api_port}/bot")
+    try:
+        if args.wait:
+            logger.info(f"Waiting {args.wait}s for the bot to start")
+            await asyncio.sleep(args.wait)
+        driver = WebhookLoadDriver(
+            api, args.webhook_url,
+            secret_token=args.secret_token,
+            concurrency=args.concurrency,
+            reply_timeout=args.reply_timeout
+        )
+        return await driver.run(args.users, args.rounds)
+    finally:
+        server.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline webhook load test against a fake Telegram API")
+    parser.add_argument("--api-port", type=int, default=8081, help="port of the fake Bot API")
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8443/telegram", help="bot webhook to post updates to")
+    parser.add_argument("--secret-token", default=None, help="WEBHOOK_SECRET_TOKEN configured on the bot")
+    parser.add_argument("--users", type=int, default=100, help="number of synthetic patients")
+    parser.add_argument("--rounds", type=int, default=5, help="button presses per patient")
+    parser.add_argument("--concurrency", type=int, default=100, help="maximum updates in flight")
+    parser.add_argument("--reply-timeout", type=float, default=10.0, help="seconds to wait for each reply")
+    parser.add_argument("--wait", type=float, default=0.0, help="seconds to wait before starting, e.g. for the bot to boot")
+    args = parser.parse_args()
+    
+    report = asyncio.run(run_harness(args))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
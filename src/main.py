@@ -1,3 +1,8 @@
+import time
+
+# Startup is measured from here, so the report includes this module's imports
+_IMPORT_STARTED = time.perf_counter()
+
 import asyncio
 import os
 import sys
@@ -6,7 +11,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from loguru import logger
 
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update, User, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -14,14 +19,25 @@ from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
     filters,
 )
 
 from src.config.settings import settings
+from src.config.logs import LevelSampler
 from src.conversation.manager import ConversationManager
 from src.conversation.models import ConversationState
-from src.db.repository import MongoDBRepository
-from src.db.models import UserDB, UserSession
+from src.db.base import Repository, create_repository
+from src.db.models import Alert, UserDB, UserSession
+from src.messaging.ratelimit import RateLimiter
+from src.messaging.outbound import OutboundQueue, Priority
+from src.messaging.alerts import ALERT_PRIORITIES
+from src.metrics.registry import REGISTRY, Gauge, instrument_handler
+from src.metrics.startup import StartupProfile
+
+# Optional components (persistence, worker processes, campaigns, alert
+# delivery, metrics endpoint) are imported by the functions that create them
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 # Función auxiliar para obtener mensajes de forma segura
 def get_node_message(node) -> str:
@@ -55,20 +71,181 @@ def get_node_message(node) -> str:
         logger.error(f"Error al obtener mensaje del nodo: {e}")
         return ""
 
-# Configure logger
-logger.remove()
-logger.add(sys.stderr, level=settings.LOG_LEVEL)
+# Services used by the handlers. They are created by init_services(), so that
+# importing this module reads no files and opens no connections.
+conversation_manager: Optional[ConversationManager] = None
+db_repository: Optional[Repository] = None
+outbox: Optional[OutboundQueue] = None
+# Delivers clinician alerts; only one process runs it, the others just store alerts
+alert_dispatcher: Optional["AlertDispatcher"] = None
+
+REGISTRY.register(Gauge(
+    "cardiovid_outbound_queue_depth", "Messages waiting in the outbound queue",
+    lambda: len(outbox) if outbox is not None else 0
+))
+REGISTRY.register(Gauge(
+    "cardiovid_outbound_in_flight", "Messages being sent to Telegram",
+    lambda: outbox.stats()["in_flight"] if outbox is not None else 0
+))
+
+def configure_logging(log_file: str = "logs/bot.log") -> None:
+    """Log to stderr and to a daily ``log_file``.
+    
+    Each process needs its own file, since several processes rotating one
+    file would interleave and lose records. With LOG_ASYNC, records are handed to a background thread, so handlers
+    never wait on the terminal or the disk; the file is written in buffered
+    batches. High-volume levels can be sampled with LOG_SAMPLE_DEBUG/INFO.
+    """
+    if settings.LOG_FILE_FORMAT not in ("text", "json"):
+        raise ValueError(f"Unknown LOG_FILE_FORMAT: {settings.LOG_FILE_FORMAT}")
+    sampler = LevelSampler({"DEBUG": settings.LOG_SAMPLE_DEBUG, "INFO": settings.LOG_SAMPLE_INFO})
+    
+    logger.remove()
+    # Sampled once per record, so the console and the file keep the same records
+    logger.configure(patcher=sampler.patch)
+    logger.add(sys.stderr, level=settings.LOG_LEVEL, filter=sampler, enqueue=settings.LOG_ASYNC)
+    
+    # Create logs directory if it doesn't exist
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    logger.add(
+        log_file,
+        rotation="1 day",
+        retention="7 days",
+        level=settings.LOG_LEVEL,
+        filter=sampler,
+        enqueue=settings.LOG_ASYNC,
+        serialize=settings.LOG_FILE_FORMAT == "json",
+        buffering=settings.LOG_FILE_BUFFER_SIZE,
+    )
+
+def init_services(repository: Optional[Repository] = None, outbound: Optional[OutboundQueue] = None) -> None:
+    """Create the conversation manager, repository and outbound queue the handlers use.
+    
+    Benchmarks and tests can pass their own repository or outbound queue.
+    """
+    global conversation_manager, db_repository, outbox
+    conversation_manager = ConversationManager(
+        settings.CONVERSATION_FILE,
+        history_size=settings.CONVERSATION_REVISION_HISTORY
+    )
+    db_repository = repository if repository is not None else create_repository(settings.STORAGE_BACKEND)
+    # Every message the bot sends goes through this queue; Telegram's global limit
+    # is shared by all worker processes
+    outbox = outbound if outbound is not None else OutboundQueue(
+        RateLimiter(
+            global_rate=settings.OUTBOUND_GLOBAL_RATE / max(settings.WORKER_PROCESSES, 1),
+            per_chat_rate=settings.OUTBOUND_PER_CHAT_RATE
+        ),
+        concurrency=settings.OUTBOUND_CONCURRENCY
+    )
+
+async def reply(update: Update, text: str, priority: Priority = Priority.INTERACTIVE, **kwargs):
+    """Send ``text`` to the chat of ``update`` through the outbound queue"""
+    return await outbox.send_message(update.effective_chat.id, text, priority=priority, **kwargs)
 
-# Create logs directory if it doesn't exist
-os.makedirs("logs", exist_ok=True)
-logger.add("logs/bot.log", rotation="1 day", retention="7 days", level=settings.LOG_LEVEL)
+async def raise_alert(telegram_id: int, first_name: Optional[str], kind: str, **fields) -> None:
+    """Store an alert for clinical staff; a repeat in the same ALERT_DEDUP_WINDOW is merged into the first one"""
+    alert = Alert.create_new(telegram_id, kind, priority=ALERT_PRIORITIES[kind], first_name=first_name, **fields)
+    try:
+        queued = await db_repository.enqueue_alert(alert, dedup_window=settings.ALERT_DEDUP_WINDOW)
+    except Exception as e:
+        logger.error(f"Error al guardar alerta {kind} del usuario {telegram_id}: {e}")
+        return
+    if queued and alert_dispatcher is not None:
+        alert_dispatcher.notify()
 
-# Initialize conversation manager
-conversation_manager = ConversationManager()
+# Triage outcomes clinical staff are alerted of
+REFERRAL_NODES = ("hospital_dia", "teleconsulta")
 
-# Initialize database repository
-db_repository = MongoDBRepository()
+EXACERBATION_MESSAGE = (
+    "He detectado que tus síntomas han empeorado. Te estamos redirigiendo al protocolo de exacerbación..."
+)
 
+async def record_exacerbation(user: User, context: ContextTypes.DEFAULT_TYPE, source: str,
+                              node_id: str, response: str) -> bool:
+    """Store an exacerbation and queue an alert for clinical staff; False if the user never started the bot.
+    
+    The patient has already been told the protocol started, so clinical staff
+    are alerted even when there is no user record to store a session for.
+    """
+    user_id = user.id
+    user_db = await db_repository.get_user(user_id)
+    if not user_db:
+        await raise_alert(user_id, user.first_name, "empeoramiento", source=source)
+        logger.warning(f"Empeoramiento de usuario no registrado {user_id} ({source}); alerta enviada al equipo clínico")
+        return False
+    
+    session = UserSession.create_new(telegram_id=user_id, session_type="empeoramiento")
+    session.add_response(node_id=node_id, response=response, message_text=EXACERBATION_MESSAGE)
+    # Marcar la sesión como completada inmediatamente
+    session.complete_session(final_message="Protocolo de exacerbación activado")
+    # Establecer nodo actual en filtro_1 (para futuras interacciones)
+    user_db.current_node = "filtro_1"
+    context.user_data["current_node"] = "filtro_1"
+    
+    # The writes touch different documents, so they go out together
+    steps = {
+        "alerta": raise_alert(
+            user_id, user_db.first_name, "empeoramiento", source=source, session_id=session.session_id
+        ),
+        "sesión de empeoramiento": db_repository.create_session(session),
+        "usuario": db_repository.update_user(user_db),
+    }
+    current_session = context.user_data.pop("current_session", None)
+    if current_session:
+        current_session.complete_session(final_message=f"Sesión terminada por empeoramiento de síntomas ({source})")
+        steps["sesión anterior"] = db_repository.complete_session(current_session)
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error al guardar {step} por empeoramiento del usuario {user_id}: {result}")
+    logger.info(f"Protocolo de exacerbación activado para usuario {user_id} por {source}")
+    return True
+
+async def exacerbation_protocol(update: Update, context: ContextTypes.DEFAULT_TYPE, source: str,
+                                node_id: str, response: str) -> int:
+    """Answer a worsening patient at once, in the alert lane, while the session and alert are stored"""
+    recording = asyncio.create_task(record_exacerbation(update.effective_user, context, source, node_id, response))
+    try:
+        # Enviar solo el mensaje de activación del protocolo, antes que cualquier otro mensaje en cola
+        await reply(update, EXACERBATION_MESSAGE, priority=Priority.ALERT)
+    finally:
+        # The exacerbation is stored even if the reply could not be sent
+        registered = await recording
+    
+    if not registered:
+        await reply(update, "Hemos avisado al equipo clínico. Por favor, inicia el bot con /start para continuar.")
+        return ConversationHandler.END
+    
+    # La interacción termina aquí
+    return ConversationState.RESPONDING
+
+def is_exacerbation_update(update: object) -> bool:
+    """Whether an update is EMPEORÉ or /empeore, which skips the wait for a free update slot"""
+    message = update.message if isinstance(update, Update) else None
+    if message is None or not message.text:
+        return False
+    words = message.text.split()
+    if not words:
+        return False
+    return message.text.strip().upper() == "EMPEORÉ" or words[0].split("@")[0].lower() == "/empeore"
+
+# Node where the patient answers whether they want weekly education messages
+EDUCATION_OPT_IN_NODE = "fin"
+EDUCATION_OPT_IN_NEXT = "registro_educacion"
+
+def create_persistence() -> Optional["MongoPersistence"]:
+    """Persistence for user_data and conversation states, if enabled"""
+    if not settings.PERSISTENCE_ENABLED:
+        return None
+    from src.db.persistence import MongoPersistence
+    return MongoPersistence(
+        db_repository,
+        update_interval=settings.PERSISTENCE_UPDATE_INTERVAL,
+        flush_delay=settings.PERSISTENCE_FLUSH_DELAY
+    )
+
+@instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handler for /start command"""
     user = update.effective_user
@@ -86,7 +263,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if current_session:
         final_message = "Sesión terminada por inicio de nueva conversación"
         current_session.complete_session(final_message=final_message)
-        await db_repository.update_session(current_session)
+        await db_repository.complete_session(current_session)
         logger.info(f"Sesión anterior completada por /start para usuario {user_id} con mensaje final: {final_message}")
     
     # Get or create user in database
@@ -101,8 +278,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await db_repository.create_user(user_db)
         logger.info(f"Nuevo usuario creado: {user_id}")
     
-    # Create new session
-    session = UserSession.create_new(telegram_id=user_id)
+    # Create new session, pinned to the current conversation revision
+    revision = conversation_manager.graph.revision
+    session = UserSession.create_new(telegram_id=user_id, graph_revision=revision)
     await db_repository.create_session(session)
     context.user_data["current_session"] = session
     logger.info(f"Nueva sesión creada por /start para usuario {user_id}")
@@ -112,31 +290,32 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await db_repository.update_user(user_db)
     
     # Get initial node and send message
-    initial_node = conversation_manager.get_node("saludo_inicial")
+    initial_node = conversation_manager.get_node("saludo_inicial", revision)
     if initial_node:
         user_data = {"nombre": first_name}
-        message_text = conversation_manager.format_message(initial_node, user_data)
+        message_text = conversation_manager.format_message(initial_node, user_data, revision)
         
         # Create keyboard markup
-        markup = conversation_manager.create_keyboard_markup(initial_node)
+        markup = conversation_manager.create_keyboard_markup(initial_node, revision)
         
         # Store current node ID in context
         context.user_data["current_node"] = "saludo_inicial"
         
         # Añadir respuesta a la nueva sesión
-        session.add_response(
+        node_response = session.add_response(
             node_id="START_COMMAND",
             response="/start",
             message_text="Inicio de conversación"
         )
-        await db_repository.update_session(session)
+        await db_repository.append_session_response(session, node_response)
         
-        await update.message.reply_text(message_text, reply_markup=markup)
+        await reply(update, message_text, reply_markup=markup)
         return ConversationState.RESPONDING
     else:
-        await update.message.reply_text("Error: No se pudo iniciar la conversación. Por favor, contacta al soporte.")
+        await reply(update, "Error: No se pudo iniciar la conversación. Por favor, contacta al soporte.")
         return ConversationHandler.END
 
+@instrument_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handler for /help command"""
     help_text = (
@@ -153,8 +332,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "puedes usar el comando /empeore o escribir la palabra EMPEORÉ "
         "y seguiremos el protocolo de exacerbación."
     )
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    await reply(update, help_text, parse_mode="Markdown")
 
+@instrument_handler
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handler for /reset command - Reset conversation to beginning"""
     user_id = update.effective_user.id
@@ -166,11 +346,12 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         if current_session:
             final_message = "Sesión reiniciada por el usuario"
             current_session.complete_session(final_message=final_message)
-            await db_repository.update_session(current_session)
+            await db_repository.complete_session(current_session)
             logger.info(f"Sesión completada por reset para usuario {user_id} con mensaje final: {final_message}")
         
-        # Create new session
-        session = UserSession.create_new(telegram_id=user_id)
+        # Create new session, pinned to the current conversation revision
+        revision = conversation_manager.graph.revision
+        session = UserSession.create_new(telegram_id=user_id, graph_revision=revision)
         await db_repository.create_session(session)
         context.user_data["current_session"] = session
         logger.info(f"Nueva sesión creada por reset para usuario {user_id}")
@@ -181,75 +362,103 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         # Store current node ID in context
         context.user_data["current_node"] = "saludo_inicial"
         
-        initial_node = conversation_manager.get_node("saludo_inicial")
+        initial_node = conversation_manager.get_node("saludo_inicial", revision)
         user_data = {"nombre": user_db.first_name}
-        message_text = conversation_manager.format_message(initial_node, user_data)
+        message_text = conversation_manager.format_message(initial_node, user_data, revision)
         
         # Create keyboard markup
-        markup = conversation_manager.create_keyboard_markup(initial_node)
+        markup = conversation_manager.create_keyboard_markup(initial_node, revision)
         
         # Añadir respuesta a la nueva sesión
-        session.add_response(
+        node_response = session.add_response(
             node_id="RESET_COMMAND",
             response="/reset",
             message_text="Conversación reiniciada"
         )
-        await db_repository.update_session(session)
+        await db_repository.append_session_response(session, node_response)
         
-        await update.message.reply_text(message_text, reply_markup=markup)
+        await reply(update, message_text, reply_markup=markup)
         return ConversationState.RESPONDING
     else:
-        await update.message.reply_text("Por favor, inicia el bot primero con /start")
+        await reply(update, "Por favor, inicia el bot primero con /start")
         return ConversationHandler.END
 
+@instrument_handler
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle callback queries from inline keyboards"""
     query = update.callback_query
-    await query.answer()  # Answer callback query to stop loading state
-    
     user_id = update.effective_user.id
-    selected_option = query.data
     
     # Get user from database
     user_db = await db_repository.get_user(user_id)
     if not user_db:
-        await query.message.reply_text("Por favor, inicia el bot primero con /start")
+        await query.answer()
+        await reply(update, "Por favor, inicia el bot primero con /start")
         return ConversationHandler.END
     
+    # Get the session from context or, on a worker that has not seen this user yet, from the database
+    session = context.user_data.get("current_session")
+    if not session:
+        session = await db_repository.get_active_session(user_id)
+        if session:
+            context.user_data["current_session"] = session
+    
+    # Sessions keep the conversation revision they started with
+    revision = session.graph_revision if session else None
+    
     # Get current node
     current_node_id = user_db.current_node
-    current_node = conversation_manager.get_node(current_node_id)
+    current_node = conversation_manager.get_node(current_node_id, revision)
     
-    # Get or create session
-    session = context.user_data.get("current_session")
+    # Decode the pressed button; buttons of older messages are ignored
+    choice = conversation_manager.resolve_option(current_node_id, query.data, revision)
+    if choice is None:
+        await query.answer("Esta opción ya no está disponible. Usa los botones del último mensaje.")
+        logger.info(f"Botón obsoleto ignorado para usuario {user_id} en nodo {current_node_id}: {query.data}")
+        return conversation_manager.get_state_for_node(current_node_id)
+    
+    selected_option = choice.text
+    next_node_id = choice.next
+    
+    # Record the answer and move to the next node in one step; it only applies while
+    # the user is still at current_node_id, so a double tap is rejected here
+    timestamp = datetime.now().isoformat()
+    fields = None
+    if current_node_id == EDUCATION_OPT_IN_NODE:
+        fields = {"education_opt_in": next_node_id == EDUCATION_OPT_IN_NEXT}
+    user_db = await db_repository.apply_transition(
+        user_id, current_node_id, next_node_id, selected_option, timestamp, fields
+    )
+    if user_db is None:
+        await query.answer("Esta opción ya no está disponible. Usa los botones del último mensaje.")
+        logger.info(f"Transición rechazada para usuario {user_id}: ya no está en el nodo {current_node_id}")
+        # None keeps the conversation in its current state
+        return None
+    if fields:
+        logger.info(f"Recomendaciones educativas {'activadas' if user_db.education_opt_in else 'desactivadas'} para usuario {user_id}")
+    
+    await query.answer()  # Answer callback query to stop loading state
+    
+    # Create a session if there is none in progress
     if not session:
-        session = await db_repository.get_active_session(user_id)
-        if not session:
-            session = UserSession.create_new(telegram_id=user_id)
-            await db_repository.create_session(session)
+        session = UserSession.create_new(telegram_id=user_id, graph_revision=conversation_manager.graph.revision)
+        await db_repository.create_session(session)
         context.user_data["current_session"] = session
     
     # Add response to session
     try:
         # Extraer mensaje del nodo de forma segura
         node_message = get_node_message(current_node)
-        session.add_response(
+        node_response = session.add_response(
             node_id=current_node_id,
             response=selected_option,
             message_text=node_message
         )
-        await db_repository.update_session(session)
+        await db_repository.append_session_response(session, node_response)
         logger.debug(f"Respuesta registrada para usuario {user_id}, nodo {current_node_id}")
     except Exception as e:
         logger.error(f"Error al guardar respuesta: {e}")
     
-    # Record response in user document
-    timestamp = datetime.now().isoformat()
-    user_db.responses[current_node_id] = {"answer": selected_option, "timestamp": timestamp}
-    user_db.last_interaction = timestamp
-    
-    # Get next node id
-    next_node_id = conversation_manager.get_next_node_id(current_node_id, selected_option)
     if not next_node_id:
         # Mensaje final para la sesión
         final_message = "Conversación finalizada"
@@ -257,33 +466,51 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Complete session when conversation ends
         try:
             session.complete_session(final_message=final_message)
-            await db_repository.update_session(session)
+            await db_repository.complete_session(session)
             logger.info(f"Sesión completada para usuario {user_id} con mensaje final: {final_message}")
         except Exception as e:
             logger.error(f"Error al completar sesión: {e}")
         
         context.user_data.pop("current_session", None)
         
-        await query.message.reply_text(final_message)
+        await reply(update, final_message)
         return ConversationHandler.END
     
-    # Update user with new node
-    user_db.current_node = next_node_id
-    await db_repository.update_user(user_db)
-    
     # Store current node ID in context
     context.user_data["current_node"] = next_node_id
     
     # Get next node and send message
-    next_node = conversation_manager.get_node(next_node_id)
+    next_node = conversation_manager.get_node(next_node_id, revision)
     user_data = {"nombre": user_db.first_name}
-    message_text = conversation_manager.format_message(next_node, user_data)
+    message_text = conversation_manager.format_message(next_node, user_data, revision)
     
     # Create keyboard markup
-    markup = conversation_manager.create_keyboard_markup(next_node)
+    markup = conversation_manager.create_keyboard_markup(next_node, revision)
+    
+    # A referral alerts clinical staff; the alert is stored while the next message is sent
+    alerting = None
+    if next_node_id in REFERRAL_NODES:
+        alerting = asyncio.create_task(
+            raise_alert(user_id, user_db.first_name, next_node_id, source="triaje", session_id=session.session_id)
+        )
     
     # Send new message
-    await query.message.reply_text(message_text, reply_markup=markup)
+    try:
+        await reply(update, message_text, reply_markup=markup)
+    finally:
+        if alerting is not None:
+            await alerting
+    
+    if markup is None:
+        # A node without buttons ends the conversation
+        try:
+            session.complete_session(final_message="Conversación finalizada")
+            await db_repository.complete_session(session)
+            logger.info(f"Sesión completada para usuario {user_id} en el nodo {next_node_id}")
+        except Exception as e:
+            logger.error(f"Error al completar sesión: {e}")
+        context.user_data.pop("current_session", None)
+        return ConversationHandler.END
     
     # Recordatorio ocasional sobre el comando /empeore (10% de probabilidad)
     should_remind = random.random() < 0.1  # 10% de probabilidad
@@ -292,71 +519,29 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "📝 *Recordatorio*: Si en algún momento presentas empeoramiento de síntomas, "
             "puedes usar el comando /empeore para acceder rápidamente al protocolo de exacerbación."
         )
-        await query.message.reply_text(reminder_text, parse_mode="Markdown")
+        await reply(update, reminder_text, parse_mode="Markdown")
     
     # Return appropriate state based on node
     return conversation_manager.get_state_for_node(next_node_id)
 
+@instrument_handler
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle text messages"""
     message_text = update.message.text
-    user_id = update.effective_user.id
     
     # Check if message is "EMPEORÉ"
     if message_text.upper() == "EMPEORÉ":
-        # Mensaje de respuesta
-        response_message = "He detectado que tus síntomas han empeorado. Te estamos redirigiendo al protocolo de exacerbación..."
-        
-        # Get user from database
-        user_db = await db_repository.get_user(user_id)
-        if not user_db:
-            await update.message.reply_text("Por favor, inicia el bot primero con /start")
-            return ConversationHandler.END
-        
-        # Complete current session if exists
-        current_session = context.user_data.get("current_session")
-        if current_session:
-            try:
-                final_message = "Sesión terminada por empeoramiento de síntomas (texto)"
-                current_session.complete_session(final_message=final_message)
-                await db_repository.update_session(current_session)
-                logger.info(f"Sesión anterior completada para usuario {user_id} con mensaje final: {final_message}")
-            except Exception as e:
-                logger.error(f"Error al completar sesión anterior: {e}")
-        
-        # Create new session for empeoramiento
-        try:
-            session = UserSession.create_new(telegram_id=user_id, session_type="empeoramiento")
-            session.add_response(
-                node_id="EMPEORÉ_MESSAGE",
-                response=message_text,
-                message_text=response_message
-            )
-            # Marcar la sesión como completada inmediatamente
-            session.complete_session(final_message="Protocolo de exacerbación activado")
-            await db_repository.create_session(session)
-            logger.info(f"Sesión de empeoramiento creada y completada para usuario {user_id} por texto EMPEORÉ")
-        except Exception as e:
-            logger.error(f"Error al crear sesión de empeoramiento: {e}")
-        
-        # Establecer nodo actual en filtro_1 (para futuras interacciones)
-        user_db.current_node = "filtro_1"
-        await db_repository.update_user(user_db)
-        context.user_data["current_node"] = "filtro_1"
-        
-        # Enviar solo el mensaje de activación del protocolo
-        await update.message.reply_text(response_message)
-        
-        # La interacción termina aquí
-        return ConversationState.RESPONDING
+        return await exacerbation_protocol(update, context, "texto", "EMPEORÉ_MESSAGE", message_text)
     else:
-        await update.message.reply_text(
+        await reply(
+            update,
             "Por favor, usa los botones proporcionados para responder "
             "o utiliza los comandos /start, /help o /reset.\n\n"
             "Si tus síntomas han empeorado, escribe EMPEORÉ."
         )
         return ConversationState.RESPONDING
 
+@instrument_handler
 async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handler for /historial command - Show user session history"""
     user_id = update.effective_user.id
@@ -364,14 +549,14 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Get user from database
     user_db = await db_repository.get_user(user_id)
     if not user_db:
-        await update.message.reply_text("Por favor, inicia el bot primero con /start")
+        await reply(update, "Por favor, inicia el bot primero con /start")
         return
     
-    # Get user sessions
-    sessions = await db_repository.get_user_sessions(user_id, limit=5)
+    # Get summaries of the latest sessions
+    sessions = await db_repository.get_session_summaries(user_id, limit=5)
     
     if not sessions:
-        await update.message.reply_text("No tienes sesiones registradas aún.")
+        await reply(update, "No tienes sesiones registradas aún.")
         return
     
     # Format session history
@@ -379,12 +564,10 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     for i, session in enumerate(sessions, 1):
         start_date = datetime.fromisoformat(session.start_time).strftime("%d/%m/%Y %H:%M")
-        end_date = datetime.fromisoformat(session.end_time).strftime("%d/%m/%Y %H:%M")
-        duration = datetime.fromisoformat(session.end_time) - datetime.fromisoformat(session.start_time)
-        minutes = duration.total_seconds() // 60
+        minutes = session.duration_minutes
         
         session_type = "⚠️ Empeoramiento" if session.session_type == "empeoramiento" else "📝 Normal"
-        responses_count = len(session.responses)
+        responses_count = session.responses_count
         final_msg = f"✓ {session.final_message}" if session.final_message else "✓ Completada"
         
         history_text += (
@@ -397,30 +580,88 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         
         # Show last 3 responses of the session
-        for response in session.responses[-3:]:
+        for response in session.last_responses:
             history_text += f"- `{response.node_id}`: {response.response}\n"
         
         history_text += "\n"
     
     history_text += "\n_Se muestran las últimas 5 sesiones completadas._"
     
-    await update.message.reply_text(history_text, parse_mode="Markdown")
+    await reply(update, history_text, parse_mode="Markdown")
     logger.info(f"Historial mostrado para usuario {user_id}: {len(sessions)} sesiones")
 
-async def main() -> None:
-    """Start the bot."""
-    # Create the Application
-    application = Application.builder().token(settings.BOT_TOKEN).build()
+def create_update_processor() -> "PerUserUpdateProcessor":
+    """Update processor running different users' updates concurrently, each user's in order"""
+    from src.workers.processor import PerUserUpdateProcessor
+    return PerUserUpdateProcessor(
+        settings.UPDATE_CONCURRENCY,
+        max_pending_updates=settings.UPDATE_MAX_PENDING,
+        urgent=is_exacerbation_update
+    )
 
-    # Connect to database
-    await db_repository.connect()
-    
-    # Configure bot commands menu
-    await setup_bot_commands(application)
-    
-    # Setup conversation handler
+def create_metrics_server(port: int) -> Optional["MetricsServer"]:
+    """Metrics endpoint on ``port``, if enabled"""
+    if not settings.METRICS_ENABLED:
+        return None
+    from src.metrics.server import MetricsServer
+    return MetricsServer(REGISTRY, settings.METRICS_HOST, port)
+
+def create_campaign_scheduler(application: Application) -> Optional["CampaignScheduler"]:
+    """Scheduler for the campaigns in CAMPAIGNS_FILE, if enabled"""
+    if not settings.CAMPAIGNS_ENABLED:
+        return None
+    from src.campaigns.scheduler import CampaignRunner, CampaignScheduler, load_campaigns
+    runner = CampaignRunner(outbox, db_repository, batch_size=settings.CAMPAIGN_BATCH_SIZE)
+    return CampaignScheduler(runner, load_campaigns(settings.CAMPAIGNS_FILE))
+
+def create_analytics_job() -> Optional["TriageRollupJob"]:
+    """Background job maintaining the triage rollups, if enabled"""
+    if not settings.ANALYTICS_ENABLED:
+        return None
+    if settings.STORAGE_BACKEND != "mongodb":
+        logger.warning(f"Triage rollups need MongoDB, not running them with STORAGE_BACKEND={settings.STORAGE_BACKEND}")
+        return None
+    from src.analytics.triage import TriageRollupJob, TriageRollups
+    rollups = TriageRollups(db_repository.db, conversation_manager.conversation_data, lag=settings.ANALYTICS_LAG)
+    return TriageRollupJob(rollups, interval=settings.ANALYTICS_INTERVAL)
+
+def create_alert_dispatcher() -> Optional["AlertDispatcher"]:
+    """Dispatcher delivering alerts to ALERT_CHAT_ID and/or ALERT_WEBHOOK_URL, if either is set"""
+    from src.messaging.alerts import AlertDispatcher, HttpSink, TelegramChatSink
+    sinks = []
+    if settings.ALERT_CHAT_ID:
+        sinks.append(TelegramChatSink(outbox, int(settings.ALERT_CHAT_ID)))
+    if settings.ALERT_WEBHOOK_URL:
+        sinks.append(HttpSink(settings.ALERT_WEBHOOK_URL))
+    if not sinks:
+        logger.warning("Neither ALERT_CHAT_ID nor ALERT_WEBHOOK_URL is set; clinician alerts are only stored")
+        return None
+    return AlertDispatcher(
+        db_repository,
+        sinks,
+        batch_size=settings.ALERT_BATCH_SIZE,
+        batch_window=settings.ALERT_BATCH_WINDOW,
+        poll_interval=settings.ALERT_POLL_INTERVAL
+    )
+
+def start_alert_dispatcher() -> None:
+    """Create the alert dispatcher handlers notify and start it"""
+    global alert_dispatcher
+    alert_dispatcher = create_alert_dispatcher()
+    if alert_dispatcher is not None:
+        alert_dispatcher.start()
+
+def register_handlers(application: Application) -> None:
+    """Register the conversation and command handlers"""
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        name="cardiovid_conversation",
+        persistent=application.persistence is not None,
+        entry_points=[
+            CommandHandler("start", start),
+            # Buttons are routed from the state stored in MongoDB, so a process
+            # that has not seen the user's /start can still take over
+            CallbackQueryHandler(handle_callback),
+        ],
         states={
             ConversationState.INITIAL: [
                 CallbackQueryHandler(handle_callback),
@@ -441,6 +682,10 @@ async def main() -> None:
             ConversationState.EDUCATION_OPT: [
                 CallbackQueryHandler(handle_callback),
             ],
+            # Nodes after the opt-in question, such as registro_educacion with its Continuar button
+            ConversationState.END: [
+                CallbackQueryHandler(handle_callback),
+            ],
         },
         fallbacks=[
             CommandHandler("start", start),
@@ -451,12 +696,58 @@ async def main() -> None:
             MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message),
         ],
     )
-
+    
     # Register handlers
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("historial", history_command))
     application.add_handler(CommandHandler("empeore", empeore_command))
+
+async def main() -> None:
+    """Start the bot."""
+    configure_logging()
+    settings.check_required()
+    profile = StartupProfile(_IMPORT_STARTED)
+    profile.record("imports", IMPORT_SECONDS)
+    sharded = settings.WORKER_PROCESSES > 1
+    
+    if not sharded:
+        with profile.phase("services"):
+            init_services()
+    
+    # Create the Application
+    with profile.phase("application"):
+        builder = Application.builder().token(settings.BOT_TOKEN).base_url(settings.TELEGRAM_API_BASE_URL)
+        if not sharded:
+            # A slow database call only holds back the updates of the same user
+            builder = builder.concurrent_updates(create_update_processor())
+            persistence = create_persistence()
+            if persistence is not None:
+                builder = builder.persistence(persistence)
+        application = builder.build()
+    
+    dispatcher = None
+    if sharded:
+        from src.workers.pool import ShardedDispatcher
+        # This process only receives updates; workers own the database and handlers
+        with profile.phase("workers"):
+            dispatcher = ShardedDispatcher(
+                settings.WORKER_PROCESSES,
+                worker_process,
+                queue_size=settings.WORKER_QUEUE_SIZE
+            )
+            dispatcher.start()
+        application.add_handler(TypeHandler(Update, dispatcher.dispatch))
+    else:
+        # Connect to database
+        with profile.phase("database"):
+            await db_repository.connect()
+        
+        # Reload conversation.json on change without restarting
+        if settings.CONVERSATION_RELOAD_ENABLED:
+            conversation_manager.start_watching(settings.CONVERSATION_RELOAD_INTERVAL)
+        
+        register_handlers(application)
     
     # Start the Bot
     logger.info(f"Starting CardioVID Bot as @{settings.BOT_NAME}")
@@ -473,20 +764,160 @@ async def main() -> None:
     signal.signal(signal.SIGINT, signal_handler)  # Ctrl+C
     signal.signal(signal.SIGTERM, signal_handler) # Termination signal
     
+    # Workers serve the handler metrics; the parent only has its own process to report
+    metrics_server = create_metrics_server(settings.METRICS_PORT)
+    if metrics_server is not None:
+        await metrics_server.start()
+    
     # Run the bot
-    await application.initialize()
+    with profile.phase("initialize"):
+        await application.initialize()
+    if not sharded:
+        outbox.start(application.bot)
     await application.start()
-    await application.updater.start_polling()
+    with profile.phase("updates"):
+        await start_updates(application)
+    
+    # The commands menu is not needed to answer updates; configure it in the background
+    commands_task = asyncio.create_task(setup_bot_commands(application))
+    
+    # In multi-process mode the first worker runs the campaigns, the triage rollups and the alert dispatcher
+    campaign_scheduler = None if sharded else create_campaign_scheduler(application)
+    if campaign_scheduler is not None:
+        campaign_scheduler.start()
+    analytics_job = None if sharded else create_analytics_job()
+    if analytics_job is not None:
+        analytics_job.start()
+    if not sharded:
+        start_alert_dispatcher()
+    profile.report("Bot", settings.STARTUP_REPORT_FILE or None)
     
     # Keep the program running until stopped by signal
     await stop_event.wait()
     
     # Close database connection when application exits
     logger.info("Shutting down bot...")
+    commands_task.cancel()
+    if campaign_scheduler is not None:
+        await campaign_scheduler.stop()
+    if analytics_job is not None:
+        await analytics_job.stop()
+    await application.updater.stop()
     await application.stop()
-    await db_repository.close()
+    if alert_dispatcher is not None:
+        await alert_dispatcher.stop()
+    if outbox is not None:
+        await outbox.stop()
+    # Shutting down writes the persisted user_data and conversation states
+    await application.shutdown()
+    if metrics_server is not None:
+        await metrics_server.stop()
+    if dispatcher is not None:
+        await asyncio.to_thread(dispatcher.stop)
+    else:
+        await conversation_manager.stop_watching()
+        # Closing the repository durably flushes any write-behind buffer
+        await db_repository.close()
     logger.info("Bot stopped")
 
+async def run_worker(index: int, worker_queue) -> None:
+    """Handle the updates of one shard of users until the dispatcher stops"""
+    from src.workers.pool import serve_shard
+    profile = StartupProfile()
+    with profile.phase("services"):
+        init_services()
+    
+    with profile.phase("application"):
+        builder = (
+            Application.builder()
+            .token(settings.BOT_TOKEN)
+            .base_url(settings.TELEGRAM_API_BASE_URL)
+            .updater(None)
+            .concurrent_updates(create_update_processor())
+        )
+        persistence = create_persistence()
+        if persistence is not None:
+            builder = builder.persistence(persistence)
+        application = builder.build()
+        register_handlers(application)
+    
+    with profile.phase("database"):
+        await db_repository.connect()
+    if settings.CONVERSATION_RELOAD_ENABLED:
+        conversation_manager.start_watching(settings.CONVERSATION_RELOAD_INTERVAL)
+    
+    metrics_server = create_metrics_server(settings.METRICS_PORT + 1 + index)
+    if metrics_server is not None:
+        await metrics_server.start()
+    
+    with profile.phase("initialize"):
+        await application.initialize()
+    outbox.start(application.bot)
+    await application.start()
+    campaign_scheduler = create_campaign_scheduler(application) if index == 0 else None
+    if campaign_scheduler is not None:
+        campaign_scheduler.start()
+    analytics_job = create_analytics_job() if index == 0 else None
+    if analytics_job is not None:
+        analytics_job.start()
+    # Other workers only store alerts; the first one delivers them on its next poll
+    if index == 0:
+        start_alert_dispatcher()
+    profile.report(f"Worker {index}")
+    
+    await serve_shard(application, worker_queue)
+    
+    if campaign_scheduler is not None:
+        await campaign_scheduler.stop()
+    if analytics_job is not None:
+        await analytics_job.stop()
+    # Stopping the application finishes the updates already queued
+    await application.stop()
+    if alert_dispatcher is not None:
+        await alert_dispatcher.stop()
+    await outbox.stop()
+    await application.shutdown()
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await conversation_manager.stop_watching()
+    await db_repository.close()
+    logger.info(f"Worker {index} stopped")
+
+def worker_process(index: int, worker_queue) -> None:
+    """Entry point of a worker process"""
+    import signal
+    # The dispatcher decides when workers stop; ignore Ctrl+C sent to the process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(f"logs/bot.worker{index}.log")
+    try:
+        asyncio.run(run_worker(index, worker_queue))
+    finally:
+        # Worker processes skip atexit handlers; removing the sinks drains the queue and flushes the file
+        logger.remove()
+
+async def start_updates(application: Application) -> None:
+    """Start receiving updates by long polling or through a webhook, depending on BOT_MODE"""
+    if settings.BOT_MODE == "webhook":
+        if not settings.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL must be set when BOT_MODE is webhook")
+        await application.updater.start_webhook(
+            listen=settings.WEBHOOK_LISTEN,
+            port=settings.WEBHOOK_PORT,
+            url_path=settings.WEBHOOK_PATH,
+            webhook_url=settings.WEBHOOK_URL,
+            secret_token=settings.WEBHOOK_SECRET_TOKEN or None,
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(
+            f"Webhook listening on {settings.WEBHOOK_LISTEN}:{settings.WEBHOOK_PORT}/{settings.WEBHOOK_PATH} "
+            f"with up to {settings.UPDATE_CONCURRENCY} concurrent updates"
+        )
+    elif settings.BOT_MODE == "polling":
+        await application.updater.start_polling()
+        logger.info("Polling for updates")
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {settings.BOT_MODE}")
+
 async def setup_bot_commands(application: Application) -> None:
     """Set up bot commands menu"""
     commands = [
@@ -497,58 +928,16 @@ async def setup_bot_commands(application: Application) -> None:
         ("empeore", "Reportar empeoramiento")
     ]
     
-    await application.bot.set_my_commands(commands)
-    logger.info("Bot commands menu configured")
+    try:
+        await application.bot.set_my_commands(commands)
+        logger.info("Bot commands menu configured")
+    except Exception as e:
+        logger.error(f"Error configuring bot commands menu: {e}")
 
+@instrument_handler
 async def empeore_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handler for /empeore command - Same as typing EMPEORÉ"""
-    user_id = update.effective_user.id
-    
-    # Mensaje de respuesta
-    response_message = "He detectado que tus síntomas han empeorado. Te estamos redirigiendo al protocolo de exacerbación..."
-    
-    # Get user from database
-    user_db = await db_repository.get_user(user_id)
-    if not user_db:
-        await update.message.reply_text("Por favor, inicia el bot primero con /start")
-        return ConversationHandler.END
-    
-    # Complete current session if exists
-    current_session = context.user_data.get("current_session")
-    if current_session:
-        try:
-            final_message = "Sesión terminada por empeoramiento de síntomas (comando)"
-            current_session.complete_session(final_message=final_message)
-            await db_repository.update_session(current_session)
-            logger.info(f"Sesión anterior completada para usuario {user_id} con mensaje final: {final_message}")
-        except Exception as e:
-            logger.error(f"Error al completar sesión anterior: {e}")
-    
-    # Create new session for empeoramiento
-    try:
-        session = UserSession.create_new(telegram_id=user_id, session_type="empeoramiento")
-        session.add_response(
-            node_id="EMPEORÉ_COMMAND",
-            response="/empeore",
-            message_text=response_message
-        )
-        # Marcar la sesión como completada inmediatamente
-        session.complete_session(final_message="Protocolo de exacerbación activado")
-        await db_repository.create_session(session)
-        logger.info(f"Sesión de empeoramiento creada y completada para usuario {user_id} por comando /empeore")
-    except Exception as e:
-        logger.error(f"Error al crear sesión de empeoramiento: {e}")
-    
-    # Establecer nodo actual en filtro_1 (para futuras interacciones)
-    user_db.current_node = "filtro_1"
-    await db_repository.update_user(user_db)
-    context.user_data["current_node"] = "filtro_1"
-    
-    # Enviar solo el mensaje de activación del protocolo
-    await update.message.reply_text(response_message)
-    
-    # La interacción termina aquí
-    return ConversationState.RESPONDING
+    return await exacerbation_protocol(update, context, "comando", "EMPEORÉ_COMMAND", "/empeore")
 
 if __name__ == "__main__":
     try:
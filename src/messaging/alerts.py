@@ -0,0 +1,134 @@
+"""Delivery of clinician alerts to a staff chat or an HTTP sink.
+
+Alerts are stored by the repository first (``enqueue_alert``) and only
+marked sent once every sink accepted the batch, so alerts still pending
+after a crash or a failed delivery are sent on the next round.
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional, List, Protocol
+
+import httpx
+from loguru import logger
+
+from src.db.models import Alert
+from .outbound import OutboundQueue, Priority
+
+# Kinds of alert and their priority; 0 is the most urgent
+ALERT_PRIORITIES = {"empeoramiento": 0, "hospital_dia": 1, "teleconsulta": 2}
+
+_KIND_LABELS = {
+    "empeoramiento": "🚨 EMPEORÉ",
+    "hospital_dia": "🏥 Derivación a Hospital de Día",
+    "teleconsulta": "📞 Derivación a teleconsulta",
+}
+
+def format_alert_batch(alerts: List[Alert]) -> str:
+    """Spanish summary of a batch of alerts, one line per alert"""
+    lines = [f"Alertas clínicas pendientes ({len(alerts)}):"]
+    for alert in alerts:
+        patient = alert.first_name or "Paciente"
+        line = f"{_KIND_LABELS.get(alert.kind, alert.kind)}: {patient} (ID {alert.telegram_id}) a las {alert.created_at[11:16]}"
+        if alert.triggers > 1:
+            line += f", repetida {alert.triggers} veces"
+        lines.append(f"• {line}")
+    return "\n".join(lines)
+
+class AlertSink(Protocol):
+    async def deliver(self, alerts: List[Alert]) -> None: ...
+
+class TelegramChatSink:
+    """Sends each batch to a staff chat through the outbound queue, in the alert lane"""
+    
+    def __init__(self, outbox: OutboundQueue, chat_id: int):
+        self.outbox = outbox
+        self.chat_id = chat_id
+    
+    async def deliver(self, alerts: List[Alert]) -> None:
+        await self.outbox.send_message(self.chat_id, format_alert_batch(alerts), priority=Priority.ALERT)
+
+class HttpSink:
+    """POSTs each batch as JSON to ``url``; any non-2xx response is a failed delivery"""
+    
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self._client = httpx.AsyncClient(timeout=timeout)
+    
+    async def deliver(self, alerts: List[Alert]) -> None:
+        response = await self._client.post(self.url, json={"alerts": [alert.to_dict() for alert in alerts]})
+        response.raise_for_status()
+    
+    async def close(self) -> None:
+        await self._client.aclose()
+
+class AlertDispatcher:
+    """Delivers pending alerts in batches.
+    
+    ``notify()`` wakes the dispatcher when an alert is queued; it waits
+    ``batch_window`` seconds so alerts raised together go out together, then
+    sends up to ``batch_size`` pending alerts, most urgent first, to every
+    sink. Every ``poll_interval`` seconds it also retries alerts left pending
+    by a failed delivery or a restart. Delivery is at least once: a batch
+    that failed on one sink is sent again to all of them.
+    """
+    
+    def __init__(self, repository, sinks: List[AlertSink], batch_size: int = 20,
+                 batch_window: float = 2.0, poll_interval: float = 10.0):
+        self.repository = repository
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    def notify(self) -> None:
+        """Deliver pending alerts after the batch window"""
+        self._wakeup.set()
+    
+    async def dispatch(self) -> int:
+        """Deliver pending alerts until none are left or a delivery fails; returns how many were sent"""
+        sent = 0
+        while True:
+            alerts = await self.repository.get_pending_alerts(self.batch_size)
+            if not alerts:
+                return sent
+            try:
+                await asyncio.gather(*(sink.deliver(alerts) for sink in self.sinks))
+            except Exception as e:
+                logger.error(f"Alert delivery failed, {len(alerts)} alerts stay pending: {str(e)}")
+                return sent
+            await self.repository.mark_alerts_sent([alert.alert_id for alert in alerts], datetime.now().isoformat())
+            sent += len(alerts)
+            logger.info(f"Delivered {len(alerts)} clinician alerts")
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                await asyncio.sleep(self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.dispatch()
+            except Exception as e:
+                logger.error(f"Alert dispatcher failed: {str(e)}")
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Alert dispatcher started with {len(self.sinks)} sinks")
+    
+    async def stop(self) -> None:
+        """Stop the dispatcher; alerts still pending are sent after the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                await sink.close()
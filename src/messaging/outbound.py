@@ -0,0 +1,195 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Optional, List, Dict, Any, Tuple
+
+from loguru import logger
+from telegram import Bot, Message
+from telegram.error import RetryAfter
+
+from .ratelimit import RateLimiter
+
+class Priority(IntEnum):
+    """Outbound lanes; lower values are sent first"""
+    ALERT = 0
+    INTERACTIVE = 1
+    EDUCATION = 2
+
+class OutboundMessage:
+    __slots__ = ("chat_id", "text", "kwargs", "priority", "seq", "attempts", "future")
+    
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], priority: Priority, seq: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.attempts = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+    
+    def sort_key(self) -> Tuple[int, int]:
+        return self.priority, self.seq
+
+class OutboundQueue:
+    """Single exit point for every message the bot sends.
+    
+    Messages wait in per-chat queues ordered by priority, then arrival. The
+    sender picks the chat whose next message has the highest priority among
+    chats the rate limiter allows. Each chat has at most one message in flight,
+    so a chat's messages go out in order. A 429 pauses the global bucket for
+    ``retry_after`` and puts the message back at the front of its chat.
+    """
+    
+    def __init__(self, limiter: RateLimiter, concurrency: int = 16, max_attempts: int = 5):
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.bot: Optional[Bot] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._seq = itertools.count()
+        self._chats: Dict[int, List[Tuple[Tuple[int, int], OutboundMessage]]] = {}
+        self._ready: List[Tuple[Tuple[int, int], int]] = []
+        self._delayed: List[Tuple[float, int]] = []
+        self._in_flight: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retried = 0
+    
+    def __len__(self) -> int:
+        return sum(len(messages) for messages in self._chats.values())
+    
+    def start(self, bot: Bot) -> None:
+        """Start sending with ``bot``"""
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Give queued messages ``timeout`` seconds to go out, then stop the sender"""
+        deadline = time.monotonic() + timeout
+        while (self._chats or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._chats:
+            logger.warning(f"Dropping {len(self)} outbound messages on shutdown")
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for messages in self._chats.values():
+            for _, message in messages:
+                if not message.future.done():
+                    message.future.cancel()
+        self._chats.clear()
+    
+    async def send_message(self, chat_id: int, text: str, priority: Priority = Priority.INTERACTIVE,
+                           **kwargs) -> Message:
+        """Queue a message and wait until Telegram accepted it"""
+        message = OutboundMessage(chat_id, text, kwargs, priority, next(self._seq))
+        self._enqueue(message)
+        return await message.future
+    
+    def _enqueue(self, message: OutboundMessage) -> None:
+        messages = self._chats.setdefault(message.chat_id, [])
+        was_head = not messages or message.sort_key() < messages[0][0]
+        heapq.heappush(messages, (message.sort_key(), message))
+        if was_head and message.chat_id not in self._in_flight:
+            # The chat's head changed; a stale _ready entry is skipped when popped
+            heapq.heappush(self._ready, (message.sort_key(), message.chat_id))
+        self._wakeup.set()
+    
+    def _schedule_chat(self, chat_id: int) -> None:
+        messages = self._chats.get(chat_id)
+        if messages:
+            heapq.heappush(self._ready, (messages[0][0], chat_id))
+            self._wakeup.set()
+    
+    def _release_delayed(self) -> Optional[float]:
+        """Move chats whose bucket refilled back to _ready; return seconds to the next one"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, chat_id = heapq.heappop(self._delayed)
+            if chat_id not in self._in_flight:
+                self._schedule_chat(chat_id)
+        return self._delayed[0][0] - now if self._delayed else None
+    
+    def _pop_ready(self) -> Optional[int]:
+        """Chat with the highest-priority head, skipping outdated entries"""
+        while self._ready:
+            key, chat_id = heapq.heappop(self._ready)
+            messages = self._chats.get(chat_id)
+            if messages and messages[0][0] == key and chat_id not in self._in_flight:
+                return chat_id
+        return None
+    
+    async def _run(self) -> None:
+        while True:
+            next_delayed = self._release_delayed()
+            chat_id = self._pop_ready()
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), next_delayed)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            chat_delay = self.limiter.chat_delay(chat_id)
+            if chat_delay > 0:
+                heapq.heappush(self._delayed, (time.monotonic() + chat_delay, chat_id))
+                continue
+            # The global bucket holds every lane back, highest priority first
+            global_delay = self.limiter.global_bucket.delay()
+            if global_delay > 0:
+                heapq.heappush(self._ready, (self._chats[chat_id][0][0], chat_id))
+                await asyncio.sleep(global_delay)
+                continue
+            
+            await self._semaphore.acquire()
+            if chat_id not in self._chats:
+                # Dropped by stop() while waiting for a free slot
+                self._semaphore.release()
+                continue
+            _, message = heapq.heappop(self._chats[chat_id])
+            if not self._chats[chat_id]:
+                del self._chats[chat_id]
+            self.limiter.take(chat_id)
+            self._in_flight.add(chat_id)
+            asyncio.create_task(self._deliver(message))
+    
+    async def _deliver(self, message: OutboundMessage) -> None:
+        try:
+            message.attempts += 1
+            result = await self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+            self.sent += 1
+            if not message.future.done():
+                message.future.set_result(result)
+        except RetryAfter as e:
+            retry_after = float(e.retry_after)
+            logger.warning(f"Telegram flood control: pausing outbound messages for {retry_after}s")
+            self.limiter.pause_all(retry_after)
+            if message.attempts < self.max_attempts:
+                self.retried += 1
+                heapq.heappush(self._chats.setdefault(message.chat_id, []), (message.sort_key(), message))
+            elif not message.future.done():
+                message.future.set_exception(e)
+        except Exception as e:
+            if not message.future.done():
+                message.future.set_exception(e)
+        finally:
+            self._in_flight.discard(message.chat_id)
+            self._semaphore.release()
+            self._schedule_chat(message.chat_id)
+    
+    def stats(self) -> Dict[str, int]:
+        """Queue size and counters"""
+        return {
+            "queued": len(self),
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "retried": self.retried,
+        }
@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def delay(self) -> float:
+        """Seconds until a token is available, without taking it"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def take(self) -> None:
+        """Take a token; the balance goes negative if none is available"""
+        self._refill()
+        self.tokens -= 1
+    
+    def pause(self, seconds: float) -> None:
+        """Withhold tokens for ``seconds``, e.g. after a 429 with retry_after"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+    
+    def is_idle(self) -> bool:
+        """Whether the bucket is full again, i.e. carries no state worth keeping"""
+        self._refill()
+        return self.tokens >= self.capacity
+
+class RateLimiter:
+    """Global token bucket plus one bucket per chat, for Telegram's send limits.
+    
+    Telegram allows about 30 messages per second overall and about one per
+    second in a single chat. Per-chat buckets are dropped once they are full
+    again, so memory is bounded by the chats that sent recently. Tokens are
+    only taken by OutboundQueue, which checks the buckets before each send.
+    """
+    
+    def __init__(self, global_rate: float = 25.0, per_chat_rate: float = 1.0, per_chat_burst: float = 3.0,
+                 max_chats: int = 100_000):
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+    
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        self._chats.move_to_end(chat_id)
+        return bucket
+    
+    def _evict_idle(self) -> None:
+        while self._chats:
+            chat_id, bucket = next(iter(self._chats.items()))
+            if len(self._chats) <= self.max_chats and not bucket.is_idle():
+                break
+            del self._chats[chat_id]
+    
+    def chat_delay(self, chat_id: int) -> float:
+        """Seconds until the chat's own bucket allows a message"""
+        return self._chat_bucket(chat_id).delay()
+    
+    def take(self, chat_id: int) -> None:
+        self.global_bucket.take()
+        self._chat_bucket(chat_id).take()
+        self._evict_idle()
+    
+    def pause_all(self, seconds: float) -> None:
+        self.global_bucket.pause(seconds)
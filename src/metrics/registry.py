@@ -0,0 +1,202 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds; handlers are expected to answer well under a second
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, optionally split by label values"""
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+    
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+class Gauge:
+    """Value read from ``function`` when the metrics are collected"""
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+    
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.function())}"]
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float) -> None:
+        # Counts are per bucket here and made cumulative when collected
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram:
+    """Histogram with fixed buckets, optionally split by label values"""
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+    
+    def labels(self, *labelvalues: str) -> _HistogramChild:
+        child = self._children.get(labelvalues)
+        if child is None:
+            child = self._children[labelvalues] = _HistogramChild(self.buckets)
+        return child
+    
+    def observe(self, value: float, *labelvalues: str) -> None:
+        self.labels(*labelvalues).observe(value)
+    
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {child.count}")
+        return lines
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+    
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+    
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    "cardiovid_handler_latency_seconds", "Time spent in each update handler", ("handler",)
+))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "cardiovid_handler_errors_total", "Update handlers that raised", ("handler",)
+))
+REPOSITORY_LATENCY = REGISTRY.register(Histogram(
+    "cardiovid_repository_latency_seconds", "Time spent in each repository method", ("method",)
+))
+MONGO_COMMANDS = REGISTRY.register(Counter(
+    "cardiovid_mongo_commands_total", "Commands sent to MongoDB while handling updates", ("handler",)
+))
+MONGO_ROUND_TRIPS = REGISTRY.register(Histogram(
+    "cardiovid_mongo_round_trips_per_update", "MongoDB commands sent while handling one update", ("handler",),
+    buckets=ROUND_TRIP_BUCKETS
+))
+
+class _RoundTrips:
+    __slots__ = ("count",)
+    
+    def __init__(self):
+        self.count = 0
+
+# Set for the duration of a handler; motor copies the context into its executor
+# threads, so commands can be attributed to the update that sent them
+_round_trips: ContextVar[Optional[_RoundTrips]] = ContextVar("mongo_round_trips", default=None)
+
+def record_round_trip() -> None:
+    """Count a database command for the update being handled, if any"""
+    counter = _round_trips.get()
+    if counter is not None:
+        counter.count += 1
+
+def instrument_handler(handler: Callable) -> Callable:
+    """Record the latency and MongoDB round trips of an update handler"""
+    name = handler.__name__
+    latency = HANDLER_LATENCY.labels(name)
+    round_trips = MONGO_ROUND_TRIPS.labels(name)
+    
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        counter = _RoundTrips()
+        token = _round_trips.set(counter)
+        started = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+            round_trips.observe(counter.count)
+            MONGO_COMMANDS.inc(name, amount=counter.count)
+            _round_trips.reset(token)
+    
+    return wrapper
+
+def _timed(method: Callable) -> Callable:
+    latency = REPOSITORY_LATENCY.labels(method.__name__)
+    
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            latency.observe(time.perf_counter() - started)
+    
+    return wrapper
+
+def instrument_methods(cls: type) -> type:
+    """Class decorator recording the latency of every public coroutine method"""
+    for name, method in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(method):
+            setattr(cls, name, _timed(method))
+    return cls
@@ -0,0 +1,40 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+
+from loguru import logger
+
+class StartupProfile:
+    """Wall-clock time of each startup phase, reported once the bot is ready"""
+    
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+    
+    def record(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_s": round(time.perf_counter() - self.started, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases},
+        }
+    
+    def report(self, label: str = "Bot", report_file: Optional[str] = None) -> Dict[str, Any]:
+        """Log the time to ready by phase and optionally write it as JSON"""
+        profile = self.to_dict()
+        phases = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in profile["phases"].items())
+        logger.info(f"{label} ready in {profile['total_s']:.3f}s ({phases})")
+        if report_file:
+            with open(report_file, "w", encoding="utf-8") as f:
+                json.dump(profile, f, indent=2)
+        return profile
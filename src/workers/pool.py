@@ -0,0 +1,77 @@
+import asyncio
+import json
+import multiprocessing
+import queue
+from typing import Callable, Optional
+
+from loguru import logger
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+class ShardedDispatcher:
+    """Partitions incoming updates across worker processes by telegram_id.
+    
+    Every update of a user goes to the same worker through a bounded queue, and
+    each worker handles its queue in order, so per-user ordering is kept while
+    different users are spread over all cores. Updates cross the process
+    boundary as Bot API JSON.
+    """
+    
+    def __init__(self, worker_count: int, worker_target: Callable[[int, "multiprocessing.Queue"], None],
+                 queue_size: int = 1000):
+        context = multiprocessing.get_context("spawn")
+        self.worker_count = worker_count
+        self.queues = [context.Queue(maxsize=queue_size) for _ in range(worker_count)]
+        self.processes = [
+            context.Process(target=worker_target, args=(index, self.queues[index]), name=f"cardiovid-worker-{index}")
+            for index in range(worker_count)
+        ]
+    
+    @staticmethod
+    def shard_key(update: Update) -> int:
+        """User the update belongs to, falling back to the chat and then the update id"""
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return update.update_id
+    
+    def shard_for(self, update: Update) -> int:
+        return self.shard_key(update) % self.worker_count
+    
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+        logger.info(f"Started {self.worker_count} worker processes")
+    
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handler that forwards an update to the worker owning its user"""
+        shard = self.shard_for(update)
+        payload = json.dumps(update.to_dict())
+        try:
+            self.queues[shard].put_nowait(payload)
+        except queue.Full:
+            # Back-pressure: wait for the worker instead of dropping the update
+            logger.warning(f"Worker {shard} queue is full, waiting")
+            await asyncio.to_thread(self.queues[shard].put, payload)
+    
+    def stop(self, timeout: float = 30.0) -> None:
+        """Ask every worker to drain its queue and exit, then wait for them"""
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.error(f"Worker {process.name} did not stop in {timeout}s, terminating")
+                process.terminate()
+                process.join()
+        logger.info("Worker processes stopped")
+
+async def serve_shard(application: Application, worker_queue: "multiprocessing.Queue") -> None:
+    """Feed updates from a dispatcher queue into a worker's application until told to stop"""
+    while True:
+        payload: Optional[str] = await asyncio.to_thread(worker_queue.get)
+        if payload is None:
+            return
+        update = Update.de_json(json.loads(payload), application.bot)
+        await application.update_queue.put(update)
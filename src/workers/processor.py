@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.workers.pool import ShardedDispatcher
+
+class _UserLock:
+    __slots__ = ("lock", "pending")
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different users concurrently and each user's updates in order.
+    
+    Handlers read and write ``context.user_data`` and the user's document, so two
+    updates of the same user must not interleave. Each user gets a lock while
+    they have updates pending; it is dropped once the last one is done, so
+    memory is bounded by the pending updates rather than by every user seen.
+    
+    Up to ``max_pending_updates`` are accepted at once (further updates wait
+    for a pending slot) and up to ``max_concurrent_updates`` of them run;
+    updates waiting for their user's lock do not take a running slot.
+    
+    Updates for which ``urgent`` returns True wait for neither a pending nor a
+    running slot, so other patients' load does not hold them back. They do
+    wait for the user's lock, so a slow handler already running for the same
+    user delays them; that user's updates still waiting for a pending slot are
+    overtaken (a button press overtaken this way is then rejected as stale).
+    """
+    
+    __slots__ = ("_running", "_locks", "_urgent")
+    
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: Optional[int] = None,
+                 urgent: Optional[Callable[[object], bool]] = None):
+        super().__init__(max(max_pending_updates or 0, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: Dict[int, _UserLock] = {}
+        self._urgent = urgent
+    
+    def __len__(self) -> int:
+        """Users with updates pending"""
+        return len(self._locks)
+    
+    def _is_urgent(self, update: object) -> bool:
+        return self._urgent is not None and isinstance(update, Update) and self._urgent(update)
+    
+    async def process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:  # type: ignore[misc]
+        """Like BaseUpdateProcessor.process_update, but urgent updates skip the pending slots"""
+        if self._is_urgent(update):
+            await self.do_process_update(update, coroutine)
+        else:
+            await super().process_update(update, coroutine)
+    
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        if not isinstance(update, Update):
+            async with self._running:
+                await coroutine
+            return
+        
+        key = ShardedDispatcher.shard_key(update)
+        user_lock = self._locks.get(key)
+        if user_lock is None:
+            user_lock = self._locks[key] = _UserLock()
+        user_lock.pending += 1
+        try:
+            # asyncio.Lock wakes waiters in arrival order, so a user's updates keep their order
+            async with user_lock.lock:
+                if self._is_urgent(update):
+                    await coroutine
+                else:
+                    async with self._running:
+                        await coroutine
+        finally:
+            user_lock.pending -= 1
+            if not user_lock.pending:
+                del self._locks[key]
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,15 @@
+import pytest_asyncio
+
+from src.db.memory import InMemoryRepository
+from src.db.sqlite import SQLiteRepository
+
+@pytest_asyncio.fixture(params=["memory", "sqlite"])
+async def repository(request, tmp_path):
+    """Each test using it runs against the in-memory and the SQLite backend"""
+    if request.param == "memory":
+        repository = InMemoryRepository()
+    else:
+        repository = SQLiteRepository(str(tmp_path / "cardiovid.db"))
+    await repository.connect()
+    yield repository
+    await repository.close()
@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.db.base import dedup_key
+from src.db.models import Alert
+from src.messaging.alerts import ALERT_PRIORITIES, AlertDispatcher, format_alert_batch
+
+WINDOW = 1800
+
+def make_alert(index: int, kind: str = "empeoramiento", created_at: datetime = None, telegram_id: int = 1) -> Alert:
+    created_at = created_at or datetime(2024, 3, 1, 10, 0, 0)
+    return Alert(alert_id=f"alert-{index}", telegram_id=telegram_id, kind=kind, priority=ALERT_PRIORITIES[kind],
+                 first_name="Ana", created_at=created_at.isoformat())
+
+class RecordingSink:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+    
+    async def deliver(self, alerts):
+        if self.fail:
+            raise ConnectionError("sink down")
+        self.batches.append(alerts)
+
+def test_dedup_key_is_shared_within_a_window_only():
+    start = datetime(2024, 3, 1, 10, 0, 0)
+    key = dedup_key(make_alert(1, created_at=start), WINDOW)
+    assert key == dedup_key(make_alert(2, created_at=start + timedelta(minutes=5)), WINDOW)
+    assert key != dedup_key(make_alert(3, created_at=start + timedelta(minutes=45)), WINDOW)
+    assert key != dedup_key(make_alert(4, kind="hospital_dia", created_at=start), WINDOW)
+    assert key != dedup_key(make_alert(5, created_at=start, telegram_id=2), WINDOW)
+
+@pytest.mark.asyncio
+async def test_concurrent_triggers_are_merged_into_one_alert(repository):
+    queued = await asyncio.gather(*(repository.enqueue_alert(make_alert(index), WINDOW) for index in range(10)))
+    
+    assert queued.count(True) == 1
+    [alert] = await repository.get_pending_alerts()
+    assert alert.triggers == 10
+    assert "repetida 10 veces" in format_alert_batch([alert])
+
+@pytest.mark.asyncio
+async def test_alerts_without_a_window_are_not_merged(repository):
+    assert await repository.enqueue_alert(make_alert(1))
+    assert await repository.enqueue_alert(make_alert(2))
+    assert len(await repository.get_pending_alerts()) == 2
+
+@pytest.mark.asyncio
+async def test_dispatcher_marks_alerts_sent_only_after_every_sink_accepted(repository):
+    await repository.enqueue_alert(make_alert(1, kind="teleconsulta"), WINDOW)
+    await repository.enqueue_alert(make_alert(2, kind="empeoramiento"), WINDOW)
+    failing = RecordingSink(fail=True)
+    sink = RecordingSink()
+    dispatcher = AlertDispatcher(repository, [sink, failing])
+    
+    assert await dispatcher.dispatch() == 0
+    assert len(await repository.get_pending_alerts()) == 2
+    
+    failing.fail = False
+    assert await dispatcher.dispatch() == 2
+    assert [alert.kind for alert in failing.batches[0]] == ["empeoramiento", "teleconsulta"]
+    assert await repository.get_pending_alerts() == []
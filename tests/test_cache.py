@@ -0,0 +1,45 @@
+from src.db import cache as cache_module
+from src.db.cache import UserCache
+from src.db.models import UserDB
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self) -> float:
+        return self.now
+
+def test_least_recently_used_user_is_evicted():
+    cache = UserCache(max_size=2)
+    for telegram_id in (1, 2):
+        cache.put(UserDB.create_new(telegram_id, f"Paciente {telegram_id}"))
+    assert cache.get(1) is not None
+    cache.put(UserDB.create_new(3, "Paciente 3"))
+    
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_expired_entries_are_misses(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = UserCache(ttl=300)
+    cache.put(UserDB.create_new(1, "Paciente 1"))
+    
+    clock.now += 299
+    assert cache.get(1) is not None
+    clock.now += 2
+    assert cache.get(1) is None
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_cache_stores_and_returns_copies():
+    cache = UserCache()
+    user = UserDB.create_new(1, "Paciente 1")
+    cache.put(user)
+    user.current_node = "fin"
+    
+    cached = cache.get(1)
+    assert cached.current_node == "saludo_inicial"
+    cached.responses["filtro_1"] = {"answer": "Sí"}
+    assert cache.get(1).responses == {}
@@ -0,0 +1,15 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from src.campaigns.scheduler import load_campaigns
+
+def test_shipped_campaigns_load():
+    assert load_campaigns("campaigns.json")
+
+def test_unknown_audience_is_rejected_at_load(tmp_path):
+    campaigns_file = tmp_path / "campaigns.json"
+    campaigns_file.write_text(json.dumps({"campaigns": [{"id": "semanal", "message": "Hola", "audience": "educacion"}]}))
+    with pytest.raises(ValidationError, match="Unknown audience 'educacion'"):
+        load_campaigns(str(campaigns_file))
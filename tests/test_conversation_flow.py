@@ -0,0 +1,95 @@
+import pytest
+import pytest_asyncio
+from telegram import MessageEntity
+from telegram.ext import Application, CallbackContext, ConversationHandler
+
+from src import main as bot_main
+from src.db.memory import InMemoryRepository
+from src.harness.benchmark import BenchmarkBot, HandlerBenchmark, UNLIMITED
+from src.messaging.outbound import OutboundQueue
+from src.messaging.ratelimit import RateLimiter
+
+USER_ID = 4242
+
+class CommandBot(BenchmarkBot):
+    """CommandHandler compares the command's target with the bot's username"""
+    
+    username = "cardiovid_test_bot"
+
+class ConversationDriver:
+    """Feeds updates through the real ConversationHandler, as the Application would"""
+    
+    def __init__(self, application: Application, bot: BenchmarkBot):
+        self.application = application
+        self.bot = bot
+        self.updates = HandlerBenchmark(bot)
+        self.handler = next(
+            handler for handler in application.handlers[0] if isinstance(handler, ConversationHandler)
+        )
+    
+    async def _process(self, update) -> bool:
+        check = self.handler.check_update(update)
+        if check is None or check is False:
+            return False
+        context = CallbackContext.from_update(update, self.application)
+        await self.handler.handle_update(update, self.application, check, context)
+        return True
+    
+    async def send(self, text: str) -> bool:
+        update = self.updates._message_update(USER_ID, text)
+        if text.startswith("/"):
+            update.message._unfreeze()
+            update.message.entities = (MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split()[0])),)
+            update.message._freeze()
+        return await self._process(update)
+    
+    async def press(self, text: str) -> bool:
+        """Press the button labelled ``text`` on the last keyboard sent"""
+        message = self.bot.last_keyboard[USER_ID]
+        buttons = [button for row in message.reply_markup.inline_keyboard for button in row]
+        button = next(button for button in buttons if button.text == text)
+        return await self._process(self.updates._callback_update(USER_ID, message, button.callback_data))
+    
+    def state(self):
+        return self.handler._conversations.get((USER_ID, USER_ID))
+
+@pytest_asyncio.fixture
+async def driver():
+    repository = InMemoryRepository()
+    await repository.connect()
+    bot_main.init_services(
+        repository=repository,
+        outbound=OutboundQueue(RateLimiter(global_rate=UNLIMITED, per_chat_rate=UNLIMITED, per_chat_burst=UNLIMITED))
+    )
+    bot = CommandBot()
+    bot_main.outbox.start(bot)
+    application = Application.builder().token("123456:TEST").updater(None).build()
+    bot_main.register_handlers(application)
+    yield ConversationDriver(application, bot)
+    await bot_main.outbox.stop()
+    await repository.close()
+
+@pytest.mark.asyncio
+async def test_conversation_reaches_cerrar_chat_and_completes_the_session(driver):
+    assert await driver.send("/start")
+    for text in ("Sí", "Sí a 2 o más", "Sí con signos de alarma", "Continuar", "Sí", "Continuar"):
+        assert await driver.press(text), f"'{text}' was not handled"
+    
+    user = await bot_main.db_repository.get_user(USER_ID)
+    assert user.current_node == "cerrar_chat"
+    assert user.education_opt_in is True
+    # The conversation ended, so the next button press enters it again
+    assert driver.state() is None
+    sessions = await bot_main.db_repository.get_user_sessions(USER_ID)
+    assert len(sessions) == 1 and sessions[0].completed
+    assert [alert["kind"] for alert in bot_main.db_repository.alerts.values()] == ["hospital_dia"]
+
+@pytest.mark.asyncio
+async def test_stale_button_does_not_move_the_conversation(driver):
+    assert await driver.send("/start")
+    first_keyboard = driver.bot.last_keyboard[USER_ID]
+    assert await driver.press("Sí")
+    # Pressing "Sí" on the greeting again is rejected; the user stays at filtro_1
+    driver.bot.last_keyboard[USER_ID] = first_keyboard
+    await driver.press("Sí")
+    assert (await bot_main.db_repository.get_user(USER_ID)).current_node == "filtro_1"
@@ -0,0 +1,68 @@
+import pytest
+
+from src.conversation.graph import CONTINUE_TEXT, ConversationGraph, ConversationGraphError
+from src.conversation.manager import ConversationManager
+from src.conversation.models import Conversation
+
+def make_conversation(*nodes) -> Conversation:
+    return Conversation(conversation=list(nodes))
+
+GREETING = {"id": "saludo", "message": "Hola {{first_name}}", "options": [
+    {"text": "Sí", "next": "pregunta"},
+    {"text": "No", "next": "despedida"},
+]}
+QUESTION = {"id": "pregunta", "message": "¿Qué tal?", "next": "despedida"}
+GOODBYE = {"id": "despedida", "message": "Adiós"}
+
+def press(graph: ConversationGraph, node_id: str, text: str) -> str:
+    """callback_data of the button labelled ``text`` on the keyboard of ``node_id``"""
+    markup = graph.get(node_id).markup
+    return next(button.callback_data for row in markup.inline_keyboard for button in row if button.text == text)
+
+def test_shipped_conversation_compiles_with_every_node_reachable():
+    graph = ConversationManager().graph
+    assert len(graph) > 0
+    assert graph.unreachable == ()
+
+def test_compiled_nodes_render_and_route_buttons():
+    graph = ConversationGraph(make_conversation(GREETING, QUESTION, GOODBYE))
+    assert graph.get("saludo").template.render({"first_name": "Ana"}) == "Hola Ana"
+    assert graph.get("saludo").template.render() == "Hola {{first_name}}"
+    assert graph.next_node_id("saludo", press(graph, "saludo", "No")) == "despedida"
+    # A node with only a default next gets a Continuar button
+    assert graph.resolve("pregunta", press(graph, "pregunta", CONTINUE_TEXT)).next == "despedida"
+    assert graph.get("despedida").markup is None
+
+def test_dangling_next_is_rejected():
+    with pytest.raises(ConversationGraphError, match="saludo -> pregunta"):
+        ConversationGraph(make_conversation(GREETING, GOODBYE))
+
+def test_duplicate_and_missing_start_nodes_are_rejected():
+    with pytest.raises(ConversationGraphError, match="Duplicate"):
+        ConversationGraph(make_conversation(GREETING, QUESTION, GOODBYE, GOODBYE))
+    with pytest.raises(ConversationGraphError, match="Start node"):
+        ConversationGraph(make_conversation(GREETING, QUESTION, GOODBYE), start_node="inicio")
+
+def test_unreachable_nodes_are_reported():
+    orphan = {"id": "huerfano", "message": "Nadie llega aquí", "next": "despedida"}
+    graph = ConversationGraph(make_conversation(GREETING, QUESTION, GOODBYE, orphan))
+    assert graph.unreachable == ("huerfano",)
+
+def test_stale_buttons_do_not_resolve():
+    conversation = make_conversation(GREETING, QUESTION, GOODBYE)
+    graph = ConversationGraph(conversation)
+    yes = press(graph, "saludo", "Sí")
+    
+    # A button of another node
+    assert graph.resolve("pregunta", yes) is None
+    assert graph.next_node_id("pregunta", yes) == "despedida"
+    # A button sent before conversation.json changed
+    edited = conversation.model_copy(deep=True)
+    edited.conversation[0].message = "Buenos días {{first_name}}"
+    new_graph = ConversationGraph(edited)
+    assert new_graph.revision != graph.revision
+    assert new_graph.resolve("saludo", yes) is None
+    # Buttons from before callback_data was encoded carry the option text
+    assert graph.resolve("saludo", "Sí") is None
+    # Garbage callback_data
+    assert graph.resolve("saludo", "x.y.z") is None
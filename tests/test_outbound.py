@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from src.messaging.outbound import OutboundQueue, Priority
+from src.messaging.ratelimit import RateLimiter
+
+class RecordingBot:
+    """Records sent texts; the first ``flood`` sends fail with a 429"""
+    
+    def __init__(self, flood: int = 0, retry_after: float = 0.05):
+        self.flood = flood
+        self.retry_after = retry_after
+        self.sent = []
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.flood:
+            self.flood -= 1
+            raise RetryAfter(self.retry_after)
+        self.sent.append(text)
+        return text
+
+def make_queue(concurrency: int = 1) -> OutboundQueue:
+    return OutboundQueue(RateLimiter(global_rate=1000, per_chat_rate=1000, per_chat_burst=1000),
+                         concurrency=concurrency)
+
+@pytest.mark.asyncio
+async def test_queued_messages_go_out_by_priority_then_arrival():
+    queue = make_queue()
+    sends = [
+        asyncio.create_task(queue.send_message(chat_id, text, priority=priority))
+        for chat_id, text, priority in (
+            (1, "educación 1", Priority.EDUCATION),
+            (2, "respuesta 1", Priority.INTERACTIVE),
+            (3, "alerta", Priority.ALERT),
+            (4, "educación 2", Priority.EDUCATION),
+            (5, "respuesta 2", Priority.INTERACTIVE),
+        )
+    ]
+    await asyncio.sleep(0)
+    bot = RecordingBot()
+    queue.start(bot)
+    await asyncio.gather(*sends)
+    await queue.stop()
+    
+    assert bot.sent == ["alerta", "respuesta 1", "respuesta 2", "educación 1", "educación 2"]
+
+@pytest.mark.asyncio
+async def test_message_is_requeued_after_a_429_and_keeps_its_place_in_the_chat():
+    queue = make_queue(concurrency=4)
+    bot = RecordingBot(flood=1)
+    queue.start(bot)
+    first = asyncio.create_task(queue.send_message(1, "primero"))
+    second = asyncio.create_task(queue.send_message(1, "segundo"))
+    
+    assert await asyncio.wait_for(asyncio.gather(first, second), timeout=5) == ["primero", "segundo"]
+    assert bot.sent == ["primero", "segundo"]
+    assert queue.stats()["retried"] == 1
+    await queue.stop()
+
+@pytest.mark.asyncio
+async def test_message_fails_after_max_attempts():
+    queue = OutboundQueue(RateLimiter(global_rate=1000, per_chat_rate=1000, per_chat_burst=1000), max_attempts=2)
+    queue.start(RecordingBot(flood=5, retry_after=0.01))
+    with pytest.raises(RetryAfter):
+        await asyncio.wait_for(queue.send_message(1, "texto"), timeout=5)
+    await queue.stop()
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from src.harness.benchmark import BenchmarkBot, HandlerBenchmark
+from src.main import is_exacerbation_update
+from src.workers.processor import PerUserUpdateProcessor
+
+updates = HandlerBenchmark(BenchmarkBot())
+
+async def record(log, label, delay: float = 0.0, started: asyncio.Event = None):
+    if started is not None:
+        started.set()
+    await asyncio.sleep(delay)
+    log.append(label)
+
+@pytest.mark.asyncio
+async def test_updates_of_one_user_run_in_order_and_users_run_concurrently():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+    log = []
+    await asyncio.gather(
+        processor.process_update(updates._message_update(1, "a"), record(log, "1a", delay=0.03)),
+        processor.process_update(updates._message_update(1, "b"), record(log, "1b")),
+        processor.process_update(updates._message_update(2, "a"), record(log, "2a", delay=0.01)),
+    )
+    
+    assert log == ["2a", "1a", "1b"]
+    assert len(processor) == 0
+
+def test_exacerbation_updates_are_urgent():
+    assert is_exacerbation_update(updates._message_update(1, " empeoré "))
+    assert is_exacerbation_update(updates._message_update(1, "/empeore@cardiovid_bot"))
+    assert not is_exacerbation_update(updates._message_update(1, "   "))
+    assert not is_exacerbation_update(updates._message_update(1, "Me siento peor"))
+
+@pytest.mark.asyncio
+async def test_urgent_update_skips_the_slots_taken_by_other_users():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=1, max_pending_updates=1,
+                                       urgent=is_exacerbation_update)
+    log = []
+    release = asyncio.Event()
+    started = asyncio.Event()
+    
+    async def blocking():
+        started.set()
+        await release.wait()
+        log.append("2 bloqueado")
+    
+    busy = asyncio.create_task(processor.process_update(updates._message_update(2, "Sí"), blocking()))
+    await started.wait()
+    queued = asyncio.create_task(processor.process_update(updates._message_update(3, "Sí"), record(log, "3")))
+    await asyncio.wait_for(
+        processor.process_update(updates._message_update(1, "EMPEORÉ"), record(log, "1 empeoré")), timeout=1
+    )
+    assert log == ["1 empeoré"]
+    
+    release.set()
+    await asyncio.gather(busy, queued)
+    assert log == ["1 empeoré", "2 bloqueado", "3"]
+
+@pytest.mark.asyncio
+async def test_urgent_update_waits_for_the_same_users_running_update():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2, urgent=is_exacerbation_update)
+    log = []
+    started = asyncio.Event()
+    running = asyncio.create_task(
+        processor.process_update(updates._message_update(1, "Sí"), record(log, "respuesta", 0.05, started))
+    )
+    await started.wait()
+    await processor.process_update(updates._message_update(1, "EMPEORÉ"), record(log, "empeoré"))
+    await running
+    
+    assert log == ["respuesta", "empeoré"]
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.db.models import UserDB
+
+async def create_user(repository, telegram_id: int = 1) -> UserDB:
+    return await repository.create_user(UserDB.create_new(telegram_id, "Paciente"))
+
+@pytest.mark.asyncio
+async def test_transition_records_the_answer_and_moves_on(repository):
+    await create_user(repository)
+    now = datetime.now().isoformat()
+    user = await repository.apply_transition(1, "saludo_inicial", "filtro_1", "Sí", now,
+                                             fields={"education_opt_in": True})
+    
+    assert user.current_node == "filtro_1"
+    assert user.responses["saludo_inicial"] == {"answer": "Sí", "timestamp": now}
+    assert user.education_opt_in is True
+    stored = await repository.get_user(1)
+    assert stored.current_node == "filtro_1" and stored.responses == user.responses
+
+@pytest.mark.asyncio
+async def test_double_tap_is_applied_once(repository):
+    await create_user(repository)
+    now = datetime.now().isoformat()
+    results = await asyncio.gather(
+        repository.apply_transition(1, "saludo_inicial", "filtro_1", "Sí", now),
+        repository.apply_transition(1, "saludo_inicial", "despedida", "No", now),
+    )
+    
+    applied = [result for result in results if result is not None]
+    assert len(applied) == 1
+    stored = await repository.get_user(1)
+    assert stored.current_node == applied[0].current_node
+    assert stored.responses == applied[0].responses
+
+@pytest.mark.asyncio
+async def test_transition_from_another_node_is_rejected(repository):
+    await create_user(repository)
+    now = datetime.now().isoformat()
+    assert await repository.apply_transition(1, "filtro_1", "filtro_2", "Sí", now) is None
+    assert await repository.apply_transition(2, "saludo_inicial", "filtro_1", "Sí", now) is None
+    assert (await repository.get_user(1)).current_node == "saludo_inicial"
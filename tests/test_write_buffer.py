@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+
+from src.db.repository import WriteBehindBuffer
+
+class FakeCollection:
+    """Records bulk_write calls; ``gate`` holds a write open until it is set"""
+    
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+        self.gate: asyncio.Event = None
+    
+    async def bulk_write(self, operations, ordered=True):
+        self.batches.append(operations)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise ConnectionError("primary unavailable")
+
+def make_buffer(users=None, sessions=None) -> WriteBehindBuffer:
+    buffer = WriteBehindBuffer(flush_interval=60, batch_size=1000)
+    buffer.collections = {"users": users or FakeCollection(), "sessions": sessions or FakeCollection()}
+    return buffer
+
+@pytest.mark.asyncio
+async def test_writes_to_one_document_are_merged_into_one_operation():
+    users = FakeCollection()
+    buffer = make_buffer(users=users)
+    await buffer.set("users", 1, 1, {"current_node": "filtro_1", "last_interaction": "a"})
+    await buffer.set("users", 1, 1, {"current_node": "filtro_2"})
+    await buffer.push("users", 1, 1, "history", ["x"])
+    await buffer.push("users", 1, 1, "history", ["y"], fields={"last_interaction": "b"})
+    assert len(buffer) == 1
+    
+    await buffer.flush()
+    [[operation]] = users.batches
+    assert operation == UpdateOne({"telegram_id": 1}, {
+        "$set": {"current_node": "filtro_2", "last_interaction": "b"},
+        "$push": {"history": {"$each": ["x", "y"]}},
+    })
+    assert len(buffer) == 0
+
+@pytest.mark.asyncio
+async def test_changes_after_an_insert_are_folded_into_the_document():
+    sessions = FakeCollection()
+    buffer = make_buffer(sessions=sessions)
+    await buffer.insert("sessions", "s1", 1, {"session_id": "s1", "responses": []})
+    await buffer.push("sessions", "s1", 1, "responses", [{"node_id": "saludo_inicial"}])
+    await buffer.set("sessions", "s1", 1, {"completed": True})
+    
+    await buffer.flush()
+    [[operation]] = sessions.batches
+    assert operation == InsertOne({"session_id": "s1", "responses": [{"node_id": "saludo_inicial"}], "completed": True})
+
+@pytest.mark.asyncio
+async def test_failed_flush_restores_the_batch_under_newer_writes():
+    users = FakeCollection(fail=True)
+    users.gate = asyncio.Event()
+    buffer = make_buffer(users=users)
+    await buffer.set("users", 1, 1, {"current_node": "filtro_1", "last_interaction": "a"})
+    
+    flushing = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    # Written while the failing batch is in flight
+    await buffer.set("users", 1, 1, {"current_node": "filtro_2"})
+    await buffer.set("users", 2, 2, {"current_node": "fin"})
+    users.gate.set()
+    with pytest.raises(ConnectionError):
+        await flushing
+    
+    assert buffer.has_pending("users", 1) and buffer.has_pending("users", 2)
+    users.fail = False
+    users.gate = None
+    await buffer.flush()
+    operations = {operation._filter["telegram_id"]: operation._doc for operation in users.batches[-1]}
+    assert operations[1] == {"$set": {"current_node": "filtro_2", "last_interaction": "a"}}
+    assert operations[2] == {"$set": {"current_node": "fin"}}
+
+@pytest.mark.asyncio
+async def test_batch_being_written_stays_pending_until_bulk_write_returns():
+    users = FakeCollection()
+    users.gate = asyncio.Event()
+    buffer = make_buffer(users=users)
+    await buffer.set("users", 1, 1, {"current_node": "filtro_1"})
+    
+    flushing = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    assert users.batches and len(buffer) == 0
+    assert buffer.has_pending("users", 1)
+    assert buffer.is_pending("users", 1)
+    
+    users.gate.set()
+    await flushing
+    assert not buffer.has_pending("users", 1)
+    assert not buffer.is_pending("users", 1)